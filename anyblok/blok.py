@@ -10,7 +10,9 @@ from pkg_resources import iter_entry_points
 from anyblok.imp import ImportManager
 from .logging import log
 from anyblok.environment import EnvironmentManager
-from time import sleep
+from time import time
+from threading import RLock, current_thread
+from contextlib import contextmanager
 from sys import modules
 from os.path import dirname
 from logging import getLogger
@@ -44,6 +46,67 @@ class BlokManager:
     entry_points = None
     ordered_bloks = []
     auto_install = []
+    lock = RLock()
+    lock_owner = None
+    lock_since = None
+    # default timeout in seconds to wait the loading lock, None: forever
+    lock_timeout = None
+    # delay in seconds between two warnings during the wait of the lock
+    lock_warning_delay = 10
+
+    @classmethod
+    @contextmanager
+    def loading_lock(cls, timeout=None):
+        """Process-wide lock to load or reload the bloks, the lock is
+        reentrant::
+
+            with BlokManager.loading_lock():
+                BlokManager.reload()
+
+        A warning is logged each ``lock_warning_delay`` seconds with the
+        thread which owns the lock
+
+        :param timeout: in seconds, by default ``lock_timeout``
+        :exception: BlokManagerException if the timeout is reached
+        """
+        if timeout is None:
+            timeout = cls.lock_timeout
+
+        start = time()
+        while True:
+            delay = cls.lock_warning_delay
+            if timeout is not None:
+                delay = max(0, min(delay, start + timeout - time()))
+
+            if cls.lock.acquire(timeout=delay):
+                break
+
+            waiting = time() - start
+            owner = cls.lock_owner
+            since = time() - (cls.lock_since or start)
+            if timeout is not None and waiting >= timeout:
+                raise BlokManagerException(
+                    "Timeout (%ss) to load the bloks, the bloks are loaded "
+                    "by the thread %r since %.1fs" % (timeout, owner, since))
+
+            logger.warning(
+                "The thread %r waits for %.1fs to load the bloks, the "
+                "bloks are loaded by the thread %r since %.1fs",
+                current_thread().name, waiting, owner, since)
+
+        is_owner = cls.lock_owner is None
+        if is_owner:
+            cls.lock_owner = current_thread().name
+            cls.lock_since = time()
+
+        try:
+            yield
+        finally:
+            if is_owner:
+                cls.lock_owner = None
+                cls.lock_since = None
+
+            cls.lock.release()
 
     @classmethod
     def list(cls):
@@ -91,33 +154,39 @@ class BlokManager:
 
     @classmethod
     @log(logger, level='debug')
-    def reload(cls):
+    def reload(cls, timeout=None):
         """Reload the entry points
 
         Empty the ``bloks`` dict and use the ``entry_points`` attribute to
         load bloks
+
+        :param timeout: in seconds, to wait the loading lock
         :exception: BlokManagerException
         """
-        if cls.entry_points is None:
-            raise BlokManagerException(
-                """You must use the ``load`` classmethod before using """
-                """``reload``""")
+        with cls.loading_lock(timeout=timeout):
+            if cls.entry_points is None:
+                raise BlokManagerException(
+                    """You must use the ``load`` classmethod before using """
+                    """``reload``""")
 
-        entry_points = []
-        entry_points += cls.entry_points
-        cls.unload()
-        cls.load(entry_points=entry_points)
+            entry_points = []
+            entry_points += cls.entry_points
+            cls.unload()
+            cls.load(entry_points=entry_points)
 
     @classmethod
     @log(logger, level='debug')
     def unload(cls):
         """Unload all the bloks but not the registry """
-        cls.bloks = {}
-        cls.ordered_bloks = []
-        cls.entry_points = None
-        cls.auto_install = []
-        from .registry import RegistryManager
-        RegistryManager.unload()
+        with cls.loading_lock():
+            cls.bloks = {}
+            cls.ordered_bloks = []
+            cls.entry_points = None
+            cls.auto_install = []
+            from .registry import RegistryManager
+            RegistryManager.unload()
+            from .snapshot import clear_source_signatures
+            clear_source_signatures()
 
     @classmethod
     def get_needed_blok_dependencies(cls, blok):
@@ -175,52 +244,52 @@ class BlokManager:
 
     @classmethod
     @log(logger, level='debug')
-    def load(cls, entry_points=('bloks',)):
+    def load(cls, entry_points=('bloks',), timeout=None):
         """Load all the bloks and import them
 
+        The concurrent calls wait the end of the loading, see
+        ``loading_lock``
+
         :param entry_points: Used by ``iter_entry_points`` to get the blok
+        :param timeout: in seconds, to wait the loading lock
         :exception: BlokManagerException
         """
         if not entry_points:
             raise BlokManagerException("The entry_points mustn't be empty")
 
-        cls.entry_points = entry_points
-
-        if EnvironmentManager.get('current_blok'):
-            while EnvironmentManager.get('current_blok'):
-                sleep(0.1)
-
-        EnvironmentManager.set('current_blok', 'start')
-
-        bloks = []
-        for entry_point in entry_points:
-            count = 0
-            for i in iter_entry_points(entry_point):
-                count += 1
-                blok = i.load()
-                blok.required_by = []
-                blok.optional_by = []
-                blok.conditional_by = []
-                blok.conflicting_by = []
-                cls.set(i.name, blok)
-                blok.name = i.name
-                bloks.append((blok.priority, i.name))
-
-            if not count:
-                raise BlokManagerException(
-                    "Invalid bloks group %r" % entry_point)
-
-        # Empty the ordered blok to reload it depending on the priority
-        cls.ordered_bloks = []
-        bloks.sort()
-
-        try:
-            while bloks:
-                blok = bloks.pop(0)[1]
-                cls.get_needed_blok(blok)
-
-        finally:
-            EnvironmentManager.set('current_blok', None)
+        with cls.loading_lock(timeout=timeout):
+            cls.entry_points = entry_points
+            EnvironmentManager.set('current_blok', 'start')
+
+            bloks = []
+            for entry_point in entry_points:
+                count = 0
+                for i in iter_entry_points(entry_point):
+                    count += 1
+                    blok = i.load()
+                    blok.required_by = []
+                    blok.optional_by = []
+                    blok.conditional_by = []
+                    blok.conflicting_by = []
+                    cls.set(i.name, blok)
+                    blok.name = i.name
+                    bloks.append((blok.priority, i.name))
+
+                if not count:
+                    raise BlokManagerException(
+                        "Invalid bloks group %r" % entry_point)
+
+            # Empty the ordered blok to reload it depending on the priority
+            cls.ordered_bloks = []
+            bloks.sort()
+
+            try:
+                while bloks:
+                    blok = bloks.pop(0)[1]
+                    cls.get_needed_blok(blok)
+
+            finally:
+                EnvironmentManager.set('current_blok', None)
 
     @classmethod
     def getPath(cls, blok):
@@ -7,17 +7,52 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 from anyblok.declarations import Declarations, classmethod_cache
-from anyblok.field import FieldException
-from anyblok.column import Column
+from anyblok.field import (
+    Field as AnyBlokField, FieldException, expire_related_attribute)
+from anyblok.column import Column, DateTime
 from anyblok.mapper import FakeColumn, FakeRelationShip
 from anyblok.relationship import RelationShip, Many2Many
 from anyblok.common import anyblok_column_prefix
+from anyblok.config import Configuration
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
 from ..exceptions import SqlBaseException
-from sqlalchemy.orm import aliased, ColumnProperty
-from sqlalchemy.sql.expression import true
-from sqlalchemy import or_, and_, inspect
+from sqlalchemy.orm import aliased, ColumnProperty, Query
+from sqlalchemy import or_, and_, inspect, tuple_, bindparam, select
 from sqlalchemy_utils.models import NO_VALUE, NOT_LOADED_REPR
 from sqlalchemy.orm.session import object_state
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import NoResultFound
+
+
+def coerce_to_python_type(python_type, value):
+    """ Return the value converted to the python type of a column, as the
+    value is in the identities of the session. The string values and the
+    numbers of another type are converted, the others are kept
+
+    :param python_type: python type of the column, None if unknown
+    :param value: value given by the caller
+    :rtype: the converted value, or the value if it can not be converted
+    """
+    if (python_type in (None, bool) or value is None or
+            isinstance(value, python_type)):
+        return value
+
+    try:
+        if isinstance(value, str):
+            return python_type(value)
+        elif isinstance(value, (int, float, Decimal)):
+            if python_type is int and value == int(value):
+                return int(value)
+            elif python_type is Decimal:
+                return Decimal(str(value))
+            elif python_type is float:
+                return float(value)
+    except (TypeError, ValueError, ArithmeticError):
+        pass
+
+    return value
 
 
 class uniquedict(dict):
@@ -34,6 +69,7 @@ class uniquedict(dict):
 class SqlMixin:
 
     __db_schema__ = None
+    tuple_in_dialects = ('postgresql', 'mysql', 'oracle')
 
     def __repr__(self):
         state = inspect(self)
@@ -159,41 +195,186 @@ class SqlMixin:
 
         return [getattr(cls, k) == v for k, v in pks.items()]
 
+    @classmethod_cache()
+    def get_identity_primary_keys(cls):
+        """ return the name of the primary keys in the order of the identity
+        of the instances in the session
+
+        :rtype: list of the primary keys name, None if the identity can not
+                be built from the primary keys
+        """
+        names = []
+        mapper = inspect(cls)
+        for column in mapper.primary_key:
+            name = mapper.get_property_by_column(column).key
+            if name.startswith(anyblok_column_prefix):
+                name = name[len(anyblok_column_prefix):]
+
+            names.append(name)
+
+        if set(names) != set(cls.get_primary_keys()):
+            return None
+
+        return names
+
+    @classmethod_cache()
+    def get_identity_python_types(cls):
+        """ return the python types of the primary keys in the order of the
+        identity of the instances in the session
+
+        :rtype: list of the python types, None if the type is unknown
+        """
+        res = []
+        for column in inspect(cls).primary_key:
+            try:
+                res.append(column.type.python_type)
+            except NotImplementedError:
+                res.append(None)
+
+        return res
+
+    @classmethod
+    def get_identity_from_primary_keys(cls, names, pks):
+        """ return the identity of the primary keys, the values are
+        converted to the python types of the columns, so ``{'id': '1'}``
+        gives the identity of the instance with the id 1
+
+        :param names: names of the primary keys, in the order of the
+                      identity
+        :param pks: dict {primary_key: value, ...}
+        :rtype: tuple of the values of the primary keys
+        """
+        return tuple(
+            coerce_to_python_type(python_type, pks[name])
+            for name, python_type in zip(
+                names, cls.get_identity_python_types()))
+
     @classmethod
     def from_primary_keys(cls, **pks):
-        """ return the instance of the model from the primary keys
+        """ return the instance of the model from the primary keys, the
+        instance already loaded in the session is returned without query,
+        else the instance is loaded by one query
 
         :param **pks: dict {primary_key: value, ...}
         :rtype: instance of the model
         """
+        names = cls.get_identity_primary_keys()
+        if names is not None and set(pks) == set(names):
+            identity = cls.get_identity_from_primary_keys(names, pks)
+            if None in identity:
+                return None
+
+            # not Query.get, the query of the model may have a criterion
+            return cls.get_instances_from_identities(
+                names, [identity]).get(identity)
+
         where_clause = cls.get_where_clause_from_primary_keys(**pks)
-        query = cls.query().filter(*where_clause)
-        if query.count():
-            return query.first()
+        return cls.query().filter(*where_clause).first()
 
-        return None
+    @classmethod
+    def get_chunk_size(cls, chunk_size=None):
+        """ return the number of primary keys by query
+
+        :param chunk_size: number of primary keys, by default the
+                           configuration ``query_chunk_size``
+        :rtype: int
+        """
+        if chunk_size is None:
+            chunk_size = Configuration.get('query_chunk_size', 1000)
+
+        return max(chunk_size, 1)
 
     @classmethod
-    def from_multi_primary_keys(cls, *pks):
-        """ return the instances of the model from the primary keys
+    def get_where_clause_from_identities(cls, names, identities):
+        """ return the where clause to find the instances from their
+        identities, the composite primary keys are filtered by a row value
+        ``IN`` if the dialect supports it, else by ``OR`` of ``AND``
+
+        :param names: names of the primary keys, in the order of the values
+                      of the identities
+        :param identities: list of tuple of the values of the primary keys
+        :rtype: where clause
+        """
+        columns = [getattr(cls, name) for name in names]
+        if len(columns) == 1:
+            return columns[0].in_([identity[0] for identity in identities])
 
-        :param *pks: list of dict [{primary_key: value, ...}]
-        :rtype: instances of the model
+        if cls.registry.engine.dialect.name in cls.tuple_in_dialects:
+            return tuple_(*columns).in_(identities)
+
+        return or_(*[and_(*[column == value
+                            for column, value in zip(columns, identity)])
+                     for identity in identities])
+
+    @classmethod
+    def get_instances_from_identities(cls, names, identities,
+                                      chunk_size=None):
+        """ return the instances of the identities, the instances already
+        loaded in the session are taken from the identity map, the others
+        are loaded by one query by chunk of identities
+
+        :param names: names of the primary keys, in the order of the values
+                      of the identities
+        :param identities: list of tuple of the values of the primary keys,
+                           converted to the python types of the columns
+                           (see ``get_identity_from_primary_keys``)
+        :param chunk_size: number of identities by query
+        :rtype: dict {identity: instance}, without the missing identities
         """
-        where_clause = []
-        for _pks in pks:
-            where_clause.append(cls.get_where_clause_from_primary_keys(**_pks))
+        session = cls.registry.session
+        mapper = inspect(cls)
+        res = {}
+        missing = []
+        seen = set()
+        for identity in identities:
+            if identity in seen or None in identity:
+                continue
 
-        if not where_clause:
-            return []
+            seen.add(identity)
+            instance = session.identity_map.get(
+                mapper.identity_key_from_primary_key(identity))
+            if (instance is not None and isinstance(instance, cls) and
+                    not inspect(instance).expired):
+                res[identity] = instance
+            else:
+                missing.append(identity)
 
-        where_clause = or_(*[and_(*x) for x in where_clause])
+        chunk_size = cls.get_chunk_size(chunk_size)
+        for i in range(0, len(missing), chunk_size):
+            where_clause = cls.get_where_clause_from_identities(
+                names, missing[i:i + chunk_size])
+            for instance in cls.query().filter(where_clause).all():
+                res[inspect(instance).identity] = instance
 
-        query = cls.query().filter(where_clause)
-        if query.count():
-            return query.all()
+        return res
 
-        return []
+    @classmethod
+    def from_multi_primary_keys(cls, *pks, chunk_size=None):
+        """ return the instances of the model from the primary keys, in
+        the order of the primary keys. The instances already loaded in the
+        session are returned without query, the others are loaded by
+        chunks of primary keys::
+
+            Model.from_multi_primary_keys({'id': 1}, {'id': 2})
+
+        :param *pks: list of dict [{primary_key: value, ...}]
+        :param chunk_size: number of primary keys by query, by default the
+                           configuration ``query_chunk_size``
+        :rtype: InstrumentedList of the instances, None for the missing
+                primary keys
+        """
+        names = cls.get_identity_primary_keys()
+        if names is None or any(set(x) != set(names) for x in pks):
+            # not only the primary keys, the instances are found one by one
+            return cls.registry.InstrumentedList(
+                cls.from_primary_keys(**x) for x in pks)
+
+        identities = [cls.get_identity_from_primary_keys(names, x)
+                      for x in pks]
+        instances = cls.get_instances_from_identities(
+            names, identities, chunk_size=chunk_size)
+        return cls.registry.InstrumentedList(
+            instances.get(identity) for identity in identities)
 
     def to_primary_keys(self):
         """ return the primary keys and values for this instance
@@ -209,27 +390,37 @@ class SqlMixin:
 
         :type: list of the primary keys name
         """
-        C = cls.registry.System.Column
-        query = C.query()
-        query = query.filter(C.model.in_(cls.get_all_registry_names()))
-        query = query.filter(C.primary_key == true())
-        return query.all().name
+        index = cls.registry.System.Model.get_fields_metadata()
+        return [name
+                for registry_name in cls.get_all_registry_names()
+                for name, (Field, values) in index.get(
+                    registry_name, {}).items()
+                if values.get('primary_key')]
 
     @classmethod_cache()
     def _fields_description(cls):
         """ Return the information of the Field, Column, RelationShip """
-        Field = cls.registry.System.Field
+        index = cls.registry.System.Model.get_fields_metadata()
         res = {}
-        for registry_name in cls.__depends__:
-            query = Field.query().filter(Field.model == registry_name)
-            res.update({x.name: x._description() for x in query.all()})
+        for registry_name in list(cls.__depends__) + [cls.__registry_name__]:
+            for name, (Field, values) in index.get(registry_name, {}).items():
+                res[name] = Field.get_description(values)
 
-        query = Field.query().filter(Field.model == cls.__registry_name__)
-        res.update({x.name: x._description() for x in query.all()})
         return res
 
     @classmethod
     def fields_description(cls, fields=None):
+        """ Return the description of the fields of the model
+
+        The descriptions come from the assembled models. The changes of the
+        rows of System.Field (the labels for example) are only seen after
+        the event ``Update Model`` of the model::
+
+            registry.System.Model.fire('Update Model', 'Model.Foo')
+
+        :param fields: names of the fields to describe, all by default
+        :rtype: dict {name: description}
+        """
         res = cls._fields_description()
         if fields:
             return {x: y for x, y in res.items() if x in fields}
@@ -395,12 +586,13 @@ class SqlMixin:
         :param name: name of the column
         :rtype: String, the name of the Type of column used
         """
-        Field = cls.registry.System.Field
-        query = Field.query()
-        query = query.filter(Field.name == name)
-        query = query.filter(Field.model.in_(cls.get_all_registry_names()))
-        query = query.limit(1)
-        return query.one().ftype
+        index = cls.registry.System.Model.get_fields_metadata()
+        for registry_name in cls.get_all_registry_names():
+            if name in index.get(registry_name, {}):
+                return index[registry_name][name][1]['ftype']
+
+        raise NoResultFound(
+            'On Model %r: No field %r found' % (cls.__registry_name__, name))
 
     @classmethod_cache()
     def find_remote_attribute_to_expire(cls, *fields):
@@ -596,6 +788,235 @@ class SqlBase(SqlMixin):
         if flush:
             self.registry.flush()
 
+    @classmethod
+    def bulk_delete(cls, instances_or_query, synchronize_session='expire',
+                    chunk_size=None):
+        """ Delete many entries of the model, by one ``DELETE`` by chunk of
+        entries::
+
+            MyModel.bulk_delete(MyModel.query().filter(...))
+            MyModel.bulk_delete([instance1, instance2, ...])
+
+        The related attributes to expire are computed once for the model
+        (see :meth:`get_delete_expiration_plan`), the links of the
+        Many2Many are deleted with the entries. The deleted instances are
+        expunged from the session, the session is synchronized with the
+        ``synchronize_session`` strategy:
+
+        * ``'expire'``: the related attributes loaded in the session which
+          contain a deleted instance are expired, they are reloaded at the
+          next access
+        * ``'remove'``: the deleted instances are removed from the related
+          attributes loaded in the session, without reloading them
+        * ``False``: the session is not synchronized
+
+        .. warning::
+
+            As with ``delete(byquery=True)``, the ORM cascades and events are
+            not applied, the polymorphic models are deleted by the instances
+
+        :param instances_or_query: query or list of instances of the model
+        :param synchronize_session: ``'expire'``, ``'remove'`` or ``False``
+        :param chunk_size: number of entries by query, by default the
+                           configuration ``query_chunk_size``
+        :rtype: int, number of deleted entries
+        :exception: SqlBaseException
+        """
+        if synchronize_session not in ('expire', 'remove', False):
+            raise SqlBaseException(
+                "Unknown synchronize_session %r, only 'expire', 'remove' or "
+                "False are allowed" % synchronize_session)
+
+        # the changes of the session must be written before the delete
+        cls.registry.flush()
+        identities = cls.get_identities_to_delete(instances_or_query)
+        if not identities:
+            return 0
+
+        names = cls.get_identity_primary_keys()
+        mapper = inspect(cls)
+        if (names is None or mapper.inherits is not None or
+                mapper.polymorphic_on is not None):
+            instances = cls.get_instances_from_identities(
+                [x.key for x in mapper.primary_key], identities,
+                chunk_size=chunk_size)
+            instances = list(instances.values())
+            for instance in instances:
+                cls.registry.session.delete(instance)
+
+            cls.registry.flush()
+            # the session is synchronized only once the entries are deleted
+            cls.synchronize_bulk_deleted_instances(
+                instances, synchronize_session)
+            return len(instances)
+
+        identity_map = cls.registry.session.identity_map
+        deleted = [identity_map.get(mapper.identity_key_from_primary_key(x))
+                   for x in identities]
+        res = 0
+        chunk_size = cls.get_chunk_size(chunk_size)
+        for i in range(0, len(identities), chunk_size):
+            where_clause = cls.get_where_clause_from_identities(
+                names, identities[i:i + chunk_size])
+            for secondary, pairs in cls.get_many2many_secondaries():
+                parents = select([x[0] for x in pairs]).where(where_clause)
+                columns = [x[1] for x in pairs]
+                column = columns[0] if len(columns) == 1 else tuple_(*columns)
+                cls.registry.execute(
+                    secondary.delete().where(column.in_(parents)))
+
+            res += cls.query().filter(where_clause).delete(
+                synchronize_session=False)
+
+        # the session is synchronized only once all the chunks are deleted,
+        # if a DELETE fails the session is kept as it was
+        cls.synchronize_bulk_deleted_instances(
+            [x for x in deleted if x is not None], synchronize_session)
+        return res
+
+    @classmethod
+    def get_identities_to_delete(cls, instances_or_query):
+        """ return the identities of the entries to delete
+
+        :param instances_or_query: query or list of instances of the model
+        :rtype: list of tuple of the values of the primary keys
+        :exception: SqlBaseException
+        """
+        mapper = inspect(cls)
+        if isinstance(instances_or_query, Query):
+            identities = [tuple(x) for x in instances_or_query.with_entities(
+                *mapper.primary_key)]
+        else:
+            identities = []
+            for instance in instances_or_query:
+                if not isinstance(instance, cls):
+                    raise SqlBaseException(
+                        "bulk_delete method wait instances of %r, not %r" % (
+                            cls.__registry_name__, instance))
+
+                identity = inspect(instance).identity
+                if identity is not None:
+                    identities.append(identity)
+
+        seen = set()
+        return [x for x in identities if not (x in seen or seen.add(x))]
+
+    @classmethod_cache()
+    def get_delete_expiration_plan(cls):
+        """ return the attributes of the related models to expire when
+        entries of the model are deleted
+
+        :rtype: list of tuple (related model, list of the attributes)
+        """
+        model = cls.registry.loaded_namespaces_first_step[
+            cls.__registry_name__]
+        mapper = inspect(cls)
+        res = []
+        mappers = uniquedict(
+            (x, list(y)) for x, y in cls.find_remote_attribute_to_expire(
+                *model.keys()).items())
+        for field_name, field in model.items():
+            # the Many2Many are ignored by find_remote_attribute_to_expire,
+            # but their links are deleted with the entries
+            if isinstance(field, Many2Many) and 'backref' in field.kwargs:
+                mappers.add_in_res(field_name, [field.kwargs['backref'][0]])
+
+        for field_name, rfields in mappers.items():
+            for key in (field_name, anyblok_column_prefix + field_name):
+                if key in mapper.relationships:
+                    res.append((mapper.relationships[key].mapper.class_,
+                                rfields))
+                    break
+
+        return res
+
+    @classmethod_cache()
+    def get_many2many_secondaries(cls):
+        """ return the tables of the Many2Many links of the model
+
+        :rtype: list of tuple (table, list of tuple (column of the model,
+                column of the table))
+        """
+        res = []
+        for relationship in inspect(cls).relationships:
+            if relationship.secondary is None:
+                continue
+
+            entry = (relationship.secondary,
+                     list(relationship.synchronize_pairs))
+            if entry not in res:
+                res.append(entry)
+
+        return res
+
+    @classmethod
+    def synchronize_bulk_deleted_instances(cls, deleted,
+                                           synchronize_session):
+        """ remove the deleted instances from the session and from the
+        related attributes loaded in the session
+
+        :param deleted: deleted instances loaded in the session
+        :param synchronize_session: ``'expire'``, ``'remove'`` or ``False``
+        """
+        if not synchronize_session or not deleted:
+            return
+
+        plan = cls.get_delete_expiration_plan()
+        deleted_ids = set(id(x) for x in deleted)
+        session = cls.registry.session
+        for obj in list(session.identity_map.values()):
+            if id(obj) in deleted_ids:
+                continue
+
+            rfields = [rfield for Model, rfields in plan
+                       if isinstance(obj, Model) for rfield in rfields]
+            only_check = synchronize_session == 'expire'
+            to_expire = [
+                rfield for rfield in rfields
+                if cls.remove_deleted_instances_from_attribute(
+                    obj, rfield, deleted_ids, only_check=only_check)]
+            if to_expire and only_check:
+                cls.registry.expire(obj, to_expire)
+
+        for instance in deleted:
+            session.expunge(instance)
+
+    @classmethod
+    def remove_deleted_instances_from_attribute(cls, obj, rfield,
+                                                deleted_ids,
+                                                only_check=False):
+        """ remove the deleted instances from the attribute loaded on the
+        related instance, without reloading it
+
+        :param obj: related instance loaded in the session
+        :param rfield: name of the attribute of the related instance
+        :param deleted_ids: ``id`` of the deleted instances
+        :param only_check: if True, the attribute is not modified
+        :rtype: bool, True if the attribute contains a deleted instance
+        """
+        key = rfield
+        if rfield in obj.get_hybrid_property_columns():
+            key = anyblok_column_prefix + rfield
+
+        state = inspect(obj)
+        if key not in state.dict:
+            return False
+
+        value = state.dict[key]
+        values = value if isinstance(value, list) else [value]
+        if not any(id(x) in deleted_ids for x in values):
+            return False
+
+        if not only_check:
+            if isinstance(value, list):
+                value = [x for x in value if id(x) not in deleted_ids]
+            else:
+                value = None
+
+            set_committed_value(obj, key, value)
+
+        return True
+
     @classmethod
     def insert(cls, **kwargs):
         """ Insert in the table of the model::
@@ -615,20 +1036,43 @@ class SqlBase(SqlMixin):
         return instance
 
     @classmethod
-    def multi_insert(cls, *args):
+    def multi_insert(cls, *args, bulk=False, return_instances=True,
+                     chunk_size=None):
         """ Insert in the table one or more entry of the model::
 
             MyModel.multi_insert([{...}, ...])
 
         the flush will be done only one time at the end of the insert
 
+        With ``bulk=True`` the entries are inserted without instances,
+        by one ``INSERT`` by chunk of entries with the same columns (see
+        :meth:`bulk_insert_values`)::
+
+            MyModel.multi_insert(*values, bulk=True, return_instances=False)
+
+        :param bulk: if True, insert the entries by the SQLAlchemy Core
+        :param return_instances: if False, return the primary keys of the
+                                 inserted entries
+        :param chunk_size: number of entries by query, by default the
+                           configuration ``query_chunk_size``
+        :rtype: list of the instances, or list of dict of the primary keys
         :exception: SqlBaseException
         """
-        instances = cls.registry.InstrumentedList()
         for kwargs in args:
             if not isinstance(kwargs, dict):
                 raise SqlBaseException("multi_insert method wait list of dict")
 
+        mapper = inspect(cls)
+        if bulk and mapper.inherits is None and mapper.polymorphic_on is None:
+            pks = cls.bulk_insert_values(args, chunk_size=chunk_size)
+            if not return_instances:
+                return pks
+
+            return cls.from_multi_primary_keys(*pks, chunk_size=chunk_size)
+
+        # the polymorphic models are always inserted by the instances
+        instances = cls.registry.InstrumentedList()
+        for kwargs in args:
             instance = cls(**kwargs)
             cls.registry.add(instance)
             instances.append(instance)
@@ -636,4 +1080,302 @@ class SqlBase(SqlMixin):
         if instances:
             cls.registry.flush()
 
+        if not return_instances:
+            return [instance.to_primary_keys() for instance in instances]
+
         return instances
+
+    @classmethod_cache()
+    def get_bulk_columns(cls):
+        """ return the columns of the table of the model which can be
+        filled by :meth:`bulk_insert_values` and :meth:`bulk_update`
+
+        :rtype: dict {field name: (column key, anyblok field or None)}
+        """
+        fields = {}
+        first_step = cls.registry.loaded_namespaces_first_step
+        for registry_name in cls.get_all_registry_names():
+            for name, field in first_step.get(registry_name, {}).items():
+                if isinstance(field, AnyBlokField):
+                    fields.setdefault(name, field)
+
+        res = {}
+        for prop in inspect(cls).column_attrs:
+            column = prop.columns[0]
+            if column.table is not cls.__table__:
+                continue
+
+            name = prop.key
+            if name.startswith(anyblok_column_prefix):
+                name = name[len(anyblok_column_prefix):]
+
+            res[name] = (column.key, fields.get(name))
+
+        return res
+
+    @classmethod
+    def get_bulk_rows(cls, values):
+        """ return the rows to write in the table, the values are
+        formatted as by the setters of the fields
+
+        :param values: list of dict {field name: value}
+        :rtype: list of dict {column key: value}
+        :exception: SqlBaseException
+        """
+        columns = cls.get_bulk_columns()
+        rows = []
+        for kwargs in values:
+            row = {}
+            for name, value in kwargs.items():
+                if name not in columns:
+                    raise SqlBaseException(
+                        "%r is not a column of %r, it can not be written "
+                        "by bulk" % (name, cls.__registry_name__))
+
+                key, field = columns[name]
+                if field is not None:
+                    value = field.setter_format_value(value)
+
+                row[key] = value
+
+            rows.append(row)
+
+        return rows
+
+    @classmethod
+    def bulk_insert_values(cls, values, chunk_size=None):
+        """ Insert the entries in the table of the model without instance
+        and return their primary keys::
+
+            MyModel.bulk_insert_values([{...}, ...])
+
+        The entries with the same columns are inserted by one
+        ``INSERT ... VALUES`` by chunk of entries, with ``RETURNING`` of the
+        primary keys if the dialect supports it. The defaults of the
+        columns (AnyBlok defaults, ``Sequence``) are computed by SQLAlchemy
+        for each entry, and the values are formatted as by the setters of
+        the fields.
+
+        .. warning::
+
+            Only the columns of the table are filled: the relationships,
+            the ORM events and the ``before_insert_orm_event`` methods are
+            not called, and the relationships already loaded in the session
+            are not expired
+
+        :param values: list of dict {field name: value}
+        :param chunk_size: number of entries by query, by default the
+                           configuration ``query_chunk_size``
+        :rtype: list of dict {primary key: value, ...}, in the order of the
+                values
+        :exception: SqlBaseException
+        """
+        rows = cls.get_bulk_rows(values)
+        if not rows:
+            return []
+
+        # the pending instances may be referenced by the new entries
+        cls.registry.flush()
+        columns = cls.get_bulk_columns()
+        table = cls.__table__
+        names = cls.get_primary_keys()
+        keys = [columns[name][0] for name in names]
+        returning = cls.registry.engine.dialect.implicit_returning
+        chunk_size = cls.get_chunk_size(chunk_size)
+        groups = OrderedDict()
+        for index, row in enumerate(rows):
+            groups.setdefault(tuple(sorted(row)), []).append(index)
+
+        res = [None] * len(rows)
+        for group, indexes in groups.items():
+            for i in range(0, len(indexes), chunk_size):
+                chunk = indexes[i:i + chunk_size]
+                params = [rows[index] for index in chunk]
+                if group and returning:
+                    query = table.insert().values(params).returning(
+                        *[table.c[key] for key in keys])
+                    result = cls.registry.execute(query).fetchall()
+                    for index, pks in zip(chunk, result):
+                        res[index] = dict(zip(names, pks))
+                elif set(keys).issubset(group):
+                    # the primary keys are known, no need to get them back
+                    cls.registry.execute(table.insert(), params)
+                    for index, row in zip(chunk, params):
+                        res[index] = {name: row[key]
+                                      for name, key in zip(names, keys)}
+                else:
+                    for index, row in zip(chunk, params):
+                        result = cls.registry.execute(table.insert(), row)
+                        res[index] = dict(
+                            zip(names, result.inserted_primary_key))
+
+        return res
+
+    @classmethod
+    def bulk_update(cls, values, chunk_size=None):
+        """ Update the entries of the model from their primary keys, each
+        entry gets its own values::
+
+            MyModel.bulk_update([{'id': 1, 'name': 'a'},
+                                 {'id': 2, 'name': 'b', 'value': 2}])
+
+        The entries with the same updated columns are updated by one
+        ``UPDATE`` executed for many parameters by chunk of entries. The
+        values are formatted as by the setters of the fields, and the
+        ``auto_update`` DateTime columns are filled. For the instances
+        already loaded in the session, the updated attributes and the
+        related attributes (``registry.expire_attributes``) are expired as
+        by the setters of the fields.
+
+        .. warning::
+
+            The ORM events and the ``before_update_orm_event`` methods are
+            not called, the polymorphic models are updated by the instances
+
+        :param values: list of dict {primary key: value, ..., field: value}
+        :param chunk_size: number of entries by query, by default the
+                           configuration ``query_chunk_size``
+        :rtype: int, number of updated entries
+        :exception: SqlBaseException
+        """
+        entries = cls.get_bulk_update_entries(values)
+        if not entries:
+            return 0
+
+        names = cls.get_identity_primary_keys()
+        mapper = inspect(cls)
+        if (names is None or mapper.inherits is not None or
+                mapper.polymorphic_on is not None):
+            return cls.bulk_update_instances(entries, chunk_size=chunk_size)
+
+        pks = cls.get_primary_keys()
+        columns = cls.get_bulk_columns()
+        now = datetime.now()
+        for name, (key, field) in columns.items():
+            if isinstance(field, DateTime) and field.auto_update:
+                for _, fields in entries:
+                    fields.setdefault(name, now)
+
+        rows = cls.get_bulk_rows(x[1] for x in entries)
+
+        # the changes of the session must be written before the update
+        cls.registry.flush()
+        loaded = cls.get_loaded_instances_to_update(names, entries)
+        cls.expire_bulk_updated_instances(loaded, related_only=True)
+
+        table = cls.__table__
+        keys = [columns[name][0] for name in pks]
+        where_clause = and_(*[table.c[key] == bindparam('pk_' + key)
+                              for key in keys])
+        groups = OrderedDict()
+        for (identity, _), row in zip(entries, rows):
+            params = {'pk_' + columns[x][0]: y for x, y in identity.items()}
+            params.update({'value_' + x: y for x, y in row.items()})
+            groups.setdefault(tuple(sorted(row)), []).append(params)
+
+        res = 0
+        chunk_size = cls.get_chunk_size(chunk_size)
+        for group, params in groups.items():
+            query = table.update().where(where_clause).values(
+                {table.c[key]: bindparam('value_' + key) for key in group})
+            for i in range(0, len(params), chunk_size):
+                result = cls.registry.execute(query,
+                                              params[i:i + chunk_size])
+                res += result.rowcount
+
+        cls.expire_bulk_updated_instances(loaded)
+        return res
+
+    @classmethod
+    def get_bulk_update_entries(cls, values):
+        """ return the primary keys and the updated fields of the entries,
+        the entries without updated fields are ignored
+
+        :param values: list of dict {primary key: value, ..., field: value}
+        :rtype: list of tuple (dict of the primary keys, dict of the
+                updated fields)
+        :exception: SqlBaseException
+        """
+        pks = cls.get_primary_keys()
+        entries = []
+        for kwargs in values:
+            if not isinstance(kwargs, dict):
+                raise SqlBaseException("bulk_update method wait list of dict")
+
+            for pk in pks:
+                if pk not in kwargs:
+                    raise SqlBaseException(
+                        "No primary key %s filled for %r" % (
+                            pk, cls.__registry_name__))
+
+            fields = {x: y for x, y in kwargs.items() if x not in pks}
+            if fields:
+                entries.append(({x: kwargs[x] for x in pks}, fields))
+
+        return entries
+
+    @classmethod
+    def bulk_update_instances(cls, entries, chunk_size=None):
+        """ update the entries by their instances, used when the entries
+        can not be updated by the table of the model
+
+        :param entries: list of tuple (dict of the primary keys, dict of
+                        the updated fields)
+        :param chunk_size: number of entries by query to load the instances
+        :rtype: int, number of updated entries
+        """
+        instances = cls.from_multi_primary_keys(
+            *[x[0] for x in entries], chunk_size=chunk_size)
+        res = 0
+        for instance, (_, fields) in zip(instances, entries):
+            if instance is not None:
+                res += instance.update(**fields)
+
+        cls.registry.flush()
+        return res
+
+    @classmethod
+    def get_loaded_instances_to_update(cls, names, entries):
+        """ return the instances of the entries already loaded in the
+        session, the values of the primary keys are converted to the python
+        types of the columns as by **get_identity_from_primary_keys**
+
+        :param names: names of the primary keys, in the order of the
+                      identity of the instances
+        :param entries: list of tuple (dict of the primary keys, dict of
+                        the updated fields)
+        :rtype: list of tuple (instance, list of the updated fields)
+        """
+        identity_map = cls.registry.session.identity_map
+        mapper = inspect(cls)
+        res = []
+        for pks, fields in entries:
+            instance = identity_map.get(mapper.identity_key_from_primary_key(
+                cls.get_identity_from_primary_keys(names, pks)))
+            if instance is not None:
+                res.append((instance, list(fields)))
+
+        return res
+
+    @classmethod
+    def expire_bulk_updated_instances(cls, loaded, related_only=False):
+        """ expire the updated attributes of the instances and their
+        related attributes, the related attributes are expired before the
+        update for the previous related instances and after the update for
+        the new ones
+
+        :param loaded: list of tuple (instance, list of the updated fields)
+        :param related_only: if True, expire only the related attributes
+        """
+        expire_attributes = cls.registry.expire_attributes.get(
+            cls.__registry_name__, {})
+        for instance, fields in loaded:
+            if not related_only:
+                cls.registry.expire(instance, fields)
+
+            for name in fields:
+                if name in cls.loaded_columns:
+                    # the relationships of the instance are expired before
+                    # to get the related instances
+                    expire_related_attribute(instance, sorted(
+                        expire_attributes.get(name, set()), key=len))
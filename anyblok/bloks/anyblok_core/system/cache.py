@@ -5,10 +5,20 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+import json
+from datetime import datetime, timedelta
+from logging import getLogger
+from time import monotonic
+from sqlalchemy import or_, and_, select, func
 from anyblok.declarations import Declarations
-from anyblok.column import String, Integer
+from anyblok.column import String, Integer, Json, DateTime
+from anyblok.config import Configuration
+from anyblok.cache import invalidation_cause
+from anyblok.cache_invalidation import get_params, load_args
+from anyblok.common import sgdb_in
 from ..exceptions import CacheException
 
+logger = getLogger(__name__)
 
 register = Declarations.register
 System = Declarations.Model.System
@@ -18,11 +28,18 @@ System = Declarations.Model.System
 class Cache:
 
     last_cache_id = None
+    last_checkpoint = None
+    last_check = None
+    last_prune = None
+    prune_lock_timeout = 1000
+    prune_chunk_size = 1000
     lrus = {}
 
     id = Integer(primary_key=True)
     registry_name = String(nullable=False)
     method = String(nullable=False)
+    args = Json()
+    create_date = DateTime()
 
     @classmethod
     def get_last_id(cls):
@@ -34,12 +51,159 @@ class Cache:
 
         return 0
 
+    @classmethod
+    def before_insert_orm_event(cls, mapper, connection, target):
+        # no default on the column, the existing rows are not updated by
+        # the migration, they are pruned as old invalidations
+        if target.create_date is None:
+            target.create_date = datetime.now()
+
     @classmethod
     def initialize_model(cls):
         """ Initialize the last_cache_id known
         """
         super(Cache, cls).initialize_model()
         cls.last_cache_id = cls.get_last_id()
+        cls.last_check = monotonic()
+
+    @staticmethod
+    def get_retention():
+        """ Return the number of seconds the invalidations are kept in the
+        table, None if they are kept forever
+        """
+        return Configuration.get('cache_invalidation_retention') or None
+
+    @classmethod
+    def prune(cls, retention=None):
+        """ Remove the useless invalidations of the table:
+
+        * the invalidations older than the retention, the processes which
+          did not check the invalidations during the retention clear all
+          their caches
+        * the invalidations followed by the same invalidation or by the
+          invalidation of the whole method
+
+        The last invalidation is always kept, only the invalidations before
+        it are removed. The table is pruned in its own short transaction,
+        on another connection than the session, so the locks are not kept
+        until the end of the transaction of the caller. On PostgreSQL the
+        prune fails instead of waiting the locks more than
+        ``prune_lock_timeout`` milliseconds.
+
+        :param retention: number of seconds to keep the invalidations, by
+            default the configuration ``cache_invalidation_retention``
+        :rtype: int, number of removed invalidations
+        """
+        if retention is None:
+            retention = cls.get_retention()
+
+        if cls.registry.unittest:
+            # the registry of the unittest is bound to only one connection
+            return cls.prune_table(cls.registry.connection(), retention)
+
+        connection = cls.registry.engine.connect()
+        try:
+            with connection.begin():
+                if sgdb_in(connection.engine, ['PostgreSQL']):
+                    connection.execute(
+                        'SET LOCAL lock_timeout = %d' %
+                        cls.prune_lock_timeout)
+
+                return cls.prune_table(connection, retention)
+        finally:
+            connection.close()
+
+    @classmethod
+    def prune_table(cls, connection, retention):
+        """ Remove the useless invalidations with the connection, see
+        ``prune``
+
+        :param connection: connection of the transaction of the prune
+        :param retention: number of seconds to keep the invalidations
+        :rtype: int, number of removed invalidations
+        """
+        table = cls.__table__
+        last_id = connection.execute(
+            select([func.max(table.c.id)])).scalar() or 0
+        ids = []
+        if retention:
+            limit = datetime.now() - timedelta(seconds=retention)
+            query = select([table.c.id]).where(and_(
+                table.c.id < last_id,
+                or_(table.c.create_date.is_(None),
+                    table.c.create_date < limit)))
+            ids.extend(x[0] for x in connection.execute(query))
+
+        old_ids = set(ids)
+        whole_methods = set()
+        keys = set()
+        query = select([table.c.id, table.c.registry_name, table.c.method,
+                        table.c.args]).where(
+            table.c.id <= last_id).order_by(table.c.id.desc())
+        for id_, registry_name, method, args in connection.execute(query):
+            if id_ in old_ids:
+                continue
+            elif (registry_name, method) in whole_methods:
+                ids.append(id_)
+            elif args is None:
+                whole_methods.add((registry_name, method))
+            else:
+                key = (registry_name, method, json.dumps(args))
+                if key in keys:
+                    ids.append(id_)
+                else:
+                    keys.add(key)
+
+        nb = 0
+        for i in range(0, len(ids), cls.prune_chunk_size):
+            chunk = ids[i:i + cls.prune_chunk_size]
+            nb += connection.execute(table.delete().where(and_(
+                table.c.id < last_id, table.c.id.in_(chunk)))).rowcount
+
+        return nb
+
+    @classmethod
+    def auto_prune(cls):
+        """ Prune the table at most once by retention, nothing to do if the
+        invalidations are kept forever or if the registry is readonly
+
+        The prune is called after the commit of the invalidations and by
+        the checkpoints, never inside a transaction of the session which
+        may lock the table (the installation or the migration of the
+        bloks for example)
+        """
+        retention = cls.get_retention()
+        if retention is None or cls.registry.readonly:
+            return
+
+        now = monotonic()
+        if cls.last_prune is not None and now - cls.last_prune < retention:
+            return
+
+        cls.last_prune = now
+        try:
+            cls.prune(retention=retention)
+        except Exception as e:
+            # the prune is a maintenance task, the next one will do it
+            logger.warning('The cache invalidations are not pruned: %s', e)
+
+    @classmethod
+    def publish(cls, registry_name, method, args=None):
+        """ Push the invalidation with the transport of the registry, the
+        caches of the current process are cleared at once
+
+        :param registry_name: namespace of the model
+        :param method: name of the method on the model
+        :param args: list of the arguments of the invalidated entries, all
+            the entries are invalidated if None
+        """
+        transport = cls.registry.cache_invalidation
+        if transport is None:
+            return
+
+        params = get_params(registry_name, method, args)
+        transport.receive(*params)
+        transport.publish(*params)
 
     @classmethod
     def invalidate_all(cls):
@@ -51,22 +215,43 @@ class Cache:
         if res:
             cls.multi_insert(*res)
 
+        for values in res:
+            cls.publish(**values)
+
         cls.clear_invalidate_cache()
+        cls.registry.postcommit_hook('Model.System.Cache', 'auto_prune')
 
     @classmethod
-    def invalidate(cls, registry_name, method):
+    def invalidate(cls, registry_name, method, *args):
         """ Call the invalidation for a specific method cached on a model
 
+        Without arguments all the entries of the method are invalidated,
+        else only the entries called with these arguments (without the
+        instance or the class of the model)::
+
+            registry.System.Cache.invalidate(
+                'Model.System.Blok', 'is_installed', 'anyblok-core')
+
+        The arguments must be serializable in JSON, the lists are received
+        as tuples by the other processes.
+
         :param registry_name: namespace of the model
         :param method: name of the method on the model
+        :param args: positional arguments of the invalidated entries
         :exception: CacheException
         """
         caches = cls.registry.caches
+        if args:
+            args = cls.check_invalidation_args(args)
+        else:
+            args = None
 
         def insert(registry_name=None, method=None):
             if registry_name in caches:
                 if method in caches[registry_name]:
-                    cls.insert(registry_name=registry_name, method=method)
+                    cls.insert(registry_name=registry_name, method=method,
+                               args=args)
+                    cls.publish(registry_name, method, args)
                 else:
                     raise CacheException(
                         "Unknown cached method %r" % method)
@@ -81,6 +266,90 @@ class Cache:
                    method=method)
 
         cls.clear_invalidate_cache()
+        cls.registry.postcommit_hook('Model.System.Cache', 'auto_prune')
+
+    @staticmethod
+    def check_invalidation_args(args):
+        """ Return the arguments of the invalidation as they are received
+        by the other processes
+
+        :param args: positional arguments of the invalidated entries
+        :rtype: list
+        :exception: CacheException
+        """
+        try:
+            return load_args(json.loads(json.dumps(list(args))))
+        except (TypeError, ValueError) as e:
+            raise CacheException(
+                "The arguments of the invalidation %r must be serializable "
+                "in JSON: %s" % (args, e))
+
+    @classmethod
+    def get_stats(cls):
+        """ Return the statistics of the cached methods, the statistics of
+        the caches of the same method (one by base of the model) are
+        summed
+
+        :rtype: dict {(registry_name, method): {stat: value}}
+        """
+        stats_keys = ('hits', 'misses', 'evictions', 'expirations',
+                      'currsize', 'bytes')
+        res = {}
+        for registry_name, methods in cls.registry.caches.items():
+            for method, caches in methods.items():
+                stats = dict.fromkeys(stats_keys, 0)
+                for cache in caches:
+                    info = cache.cache_info()
+                    for key in stats_keys:
+                        stats[key] += info[key]
+
+                res[(registry_name, method)] = stats
+
+        return res
+
+    @classmethod
+    def get_report(cls):
+        """ Return the introspection of the cached methods: the statistics
+        of the caches in the process, the estimated memory of the entries,
+        the last invalidation applied to the caches of the process and the
+        invalidations saved in the ``system_cache`` table::
+
+            for method in registry.System.Cache.get_report():
+                print(method['registry_name'], method['method'],
+                      method['hit_ratio'], method['saved_invalidations'])
+
+        :rtype: list of dict, sorted by registry name and method
+        """
+        saved = {}
+        query = cls.query('registry_name', 'method', 'args', 'create_date')
+        for registry_name, method, args, create_date in query.order_by(
+                cls.id).all():
+            count = saved.get((registry_name, method), (0, None))[0]
+            saved[(registry_name, method)] = (
+                count + 1, dict(date=create_date, args=args))
+
+        res = []
+        for (registry_name, method), stats in sorted(cls.get_stats().items()):
+            caches = cls.registry.caches[registry_name][method]
+            calls = stats['hits'] + stats['misses']
+            invalidations = [cache.last_invalidation for cache in caches
+                             if cache.last_invalidation is not None]
+            count, last_saved = saved.get((registry_name, method), (0, None))
+            stats.update(
+                registry_name=registry_name,
+                method=method,
+                caches=len(caches),
+                hit_ratio=stats['hits'] / calls if calls else None,
+                memory=sum(cache.cache_memory() for cache in caches),
+                invalidations=sum(cache.invalidations for cache in caches),
+                last_invalidation=max(
+                    invalidations, key=lambda x: x['date'], default=None),
+                saved_invalidations=count,
+                last_saved_invalidation=last_saved,
+            )
+            res.append(stats)
+
+        return res
 
     @classmethod
     def detect_invalidation(cls):
@@ -91,22 +360,101 @@ class Cache:
         return cls.last_cache_id < cls.get_last_id()
 
     @classmethod
-    def get_invalidation(cls):
-        """ Return the pointer of the method to invalidate
+    def get_invalidations(cls):
+        """ Return the pointer of the method to invalidate with the
+        arguments of the invalidated entries, None for all the entries
+
+        :rtype: list of tuple (cache, args)
         """
         res = []
+        now = monotonic()
+        retention = cls.get_retention()
+        if (retention and cls.last_check is not None and
+                now - cls.last_check > retention):
+            # the invalidations not checked may be pruned
+            cls.last_check = now
+            cls.last_cache_id = cls.get_last_id()
+            for methods in cls.registry.caches.values():
+                for caches in methods.values():
+                    res.extend((cache, None) for cache in caches)
+
+            return res
+
+        cls.last_check = now
         if cls.detect_invalidation():
             caches = cls.registry.caches
             for i in cls.query().filter(cls.id > cls.last_cache_id).all():
-                res.extend(caches[i.registry_name][i.method])
+                args = None if i.args is None else load_args(i.args)
+                res.extend(
+                    (cache, args)
+                    for cache in caches[i.registry_name][i.method])
 
             cls.last_cache_id = cls.get_last_id()
 
         return res
 
+    @classmethod
+    def get_invalidation(cls):
+        """ Return the pointer of the method to invalidate, the methods
+        invalidated only for some entries are also returned
+        """
+        return [cache for cache, args in cls.get_invalidations()]
+
+    @classmethod
+    def is_pushed_by_transport(cls):
+        """ Return True if the invalidations are pushed by a transport
+        which is alive, else the table is polled
+
+        :rtype: bool
+        """
+        transport = cls.registry.cache_invalidation
+        return transport is not None and transport.is_alive()
+
     @classmethod
     def clear_invalidate_cache(cls):
-        """ Invalidate the cache that needs to be invalidated
+        """ Invalidate the cache that needs to be invalidated, nothing to
+        do if the invalidations are pushed by a transport
         """
-        for cache in cls.get_invalidation():
-            cache.cache_clear()
+        if cls.is_pushed_by_transport():
+            return
+
+        with invalidation_cause('System.Cache'):
+            for cache, args in cls.get_invalidations():
+                if args is None:
+                    cache.cache_clear()
+                else:
+                    cache.cache_invalidate(*args)
+
+    @classmethod
+    def checkpoint(cls, interval=None):
+        """ Clear the caches invalidated by the other processes, at most
+        once by interval
+
+        The results of the cached methods are consistent with the
+        invalidations committed before the last checkpoint. The registry
+        calls the checkpoint at the beginning of each transaction if the
+        configuration ``cache_checkpoint_interval`` is defined::
+
+            registry.System.Cache.checkpoint()
+
+        :param interval: minimal number of seconds between two checks, by
+            default the configuration ``cache_checkpoint_interval``
+        :rtype: True if the invalidations have been checked
+        """
+        # at the beginning of the transaction, the session does not lock
+        # the table
+        cls.auto_prune()
+        if cls.is_pushed_by_transport():
+            return False
+
+        if interval is None:
+            interval = Configuration.get('cache_checkpoint_interval') or 0
+
+        now = monotonic()
+        if (cls.last_checkpoint is not None and
+                now - cls.last_checkpoint < interval):
+            return False
+
+        cls.last_checkpoint = now
+        cls.clear_invalidate_cache()
+        return True
@@ -27,10 +27,12 @@ class Column(System.Field):
     nullable = Boolean()
     remote_model = String()
 
-    def _description(self):
-        res = super(Column, self)._description()
-        res.update(nullable=self.nullable, primary_key=self.primary_key,
-                   model=self.remote_model)
+    @classmethod
+    def get_description(cls, values):
+        res = super(Column, cls).get_description(values)
+        res.update(nullable=values['nullable'],
+                   primary_key=values['primary_key'],
+                   model=values['remote_model'])
         return res
 
     @classmethod
@@ -44,14 +46,15 @@ class Column(System.Field):
         return cname
 
     @classmethod
-    def add_field(cls, cname, column, model, table, ftype):
-        """ Insert a column definition
+    def get_field_values(cls, cname, column, model, table, ftype):
+        """ Return the values to insert for a column definition
 
         :param cname: name of the column
         :param column: instance of the column
         :param model: namespace of the model
         :param table: name of the table of the model
         :param ftype: type of the AnyBlok Field
+        :rtype: list of dict
         """
         Model = cls.registry.get(model)
         if hasattr(Model, anyblok_column_prefix + cname):
@@ -76,7 +79,7 @@ class Column(System.Field):
                     ftype=ftype,
                     remote_model=c.info.get('remote_model'),
                     unique=c.unique)
-        cls.insert(**vals)
+        return [vals]
 
     @classmethod
     def alter_field(cls, column, meta_column, ftype):
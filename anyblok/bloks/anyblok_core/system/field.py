@@ -56,18 +56,47 @@ class Field:
         return cname
 
     def _description(self):
+        # the columns of the polymorphic models are split by model
+        values = {name: getattr(self, name)
+                  for registry_name in self.get_all_registry_names()
+                  for name in self.registry.get(registry_name).loaded_columns}
+        return self.get_description(values)
+
+    @classmethod
+    def get_description(cls, values):
+        """ Return the description of a field definition
+
+        :param values: values of the field definition, as they are saved
+            in the table
+        :rtype: dict
+        """
         res = {
-            'id': self.name,
-            'label': self.label,
-            'type': self.ftype,
+            'id': values['name'],
+            'label': values['label'],
+            'type': values['ftype'],
             'nullable': True,
             'primary_key': False,
             'model': None,
         }
-        c = self.registry.loaded_namespaces_first_step[self.model][self.name]
-        c.update_description(self.registry, self.model, res)
+        model = values['model']
+        c = cls.registry.loaded_namespaces_first_step[model][values['name']]
+        c.update_description(cls.registry, model, res)
         return res
 
+    @classmethod
+    def get_field_values(cls, rname, label, model, table, ftype):
+        """ Return the values to insert for a field definition
+
+        :param rname: name of the field
+        :param label: label of the field
+        :param model: namespace of the model
+        :param table: name of the table of the model
+        :param ftype: type of the AnyBlok Field
+        :rtype: list of dict
+        """
+        return [dict(code=table + '.' + rname, model=model, name=rname,
+                     label=label, ftype=ftype)]
+
     @classmethod
     def add_field(cls, rname, label, model, table, ftype):
         """ Insert a field definition
@@ -78,8 +107,8 @@ class Field:
         :param table: name of the table of the model
         :param ftype: type of the AnyBlok Field
         """
-        cls.insert(code=table + '.' + rname, model=model, name=rname,
-                   label=label, ftype=ftype)
+        cls.multi_insert(*cls.get_field_values(
+            rname, label, model, table, ftype))
 
     @classmethod
     def alter_field(cls, field, label, ftype):
@@ -6,7 +6,7 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
-from anyblok.declarations import Declarations, listen
+from anyblok.declarations import Declarations, listen, classmethod_cache
 from anyblok.field import Function
 from anyblok.column import String, Boolean
 from logging import getLogger
@@ -44,6 +44,8 @@ class Model:
 
     @listen('Model.System.Model', 'Update Model')
     def listener_update_model(cls, model):
+        cls.registry.System.Cache.invalidate(
+            'Model.System.Model', 'get_fields_metadata')
         cls.registry.System.Cache.invalidate(model, '_fields_description')
         cls.registry.System.Cache.invalidate(model, 'getFieldType')
         cls.registry.System.Cache.invalidate(model, 'get_primary_keys')
@@ -76,61 +78,250 @@ class Model:
         return field, Field
 
     @classmethod
-    def update_fields(cls, model, table):
+    def get_model_fields(cls, model):
+        """ Return the fields of the assembled model
+
+        :param model: namespace of the model
+        :rtype: list of tuple (name, field, Field model, type of the field)
+        """
         fsp = cls.registry.loaded_namespaces_first_step
         m = cls.registry.get(model)
-        # remove useless column
+        res = []
+        for cname in m.loaded_columns:
+            field, Field = cls.get_field(m, cname)
+            cname = Field.get_cname(field, cname)
+            ftype = fsp[model][cname].__class__.__name__
+            res.append((cname, field, Field, ftype))
+
+        return res
+
+    @classmethod_cache()
+    def get_fields_metadata(cls):
+        """ Return the values of the fields of the loaded models, as they
+        are saved in the table of the fields
+
+        The first index is computed from the assembled models, without
+        query. The event ``Update Model`` invalidates the index in all the
+        processes by **System.Cache**, the next index is computed with the
+        rows of the fields (the labels for example) read by one query
+
+        :rtype: dict {model: {name: (Field model, values)}}
+        """
+        registry = cls.registry
+        index = cls.get_assembled_fields_metadata()
+        if registry.fields_metadata_computed:
+            cls.update_fields_metadata(index)
+
+        registry.fields_metadata_computed = True
+        return index
+
+    @classmethod
+    def get_assembled_fields_metadata(cls):
+        """ Return the values of the fields computed from the assembled
+        models, see ``get_fields_metadata``
+
+        :rtype: dict {model: {name: (Field model, values)}}
+        """
+        registry = cls.registry
+        index = {}
+        models = list(registry.loaded_namespaces.keys())
+        indexed = set()
+        while models:
+            model = models.pop(0)
+            indexed.add(model)
+            try:
+                m = registry.get(model)
+                table = getattr(m, '__tablename__', '')
+                for cname, field, Field, ftype in cls.get_model_fields(model):
+                    for values in Field.get_field_values(
+                            cname, field, model, table, ftype):
+                        # the both sides of a relationship give the field
+                        index.setdefault(values['model'], {}).setdefault(
+                            values['name'], (Field, values))
+
+            except Exception as e:
+                logger.exception(str(e))
+
+            if not models:
+                # in lazy assembly mode, the models assembled while the
+                # index is computed are indexed too
+                models = [x for x in registry.loaded_namespaces.keys()
+                          if x not in indexed]
+
+        return index
+
+    @classmethod
+    def update_fields_metadata(cls, index):
+        """ Update the index of the fields with the rows of the fields
+
+        :param index: dict {model: {name: (Field model, values)}}
+        """
+        Field = cls.registry.System.Field
+        for field in Field.query().with_polymorphic('*').all():
+            entry = index.get(field.model, {}).get(field.name)
+            if entry is not None:
+                values = entry[1]
+                values.update({name: getattr(field, name)
+                               for name in values})
+
+    @classmethod
+    def get_existing_fields(cls):
+        """ Return the existing fields of all the models, loaded by only
+        one query with all the polymorphic columns
+
+        :rtype: dict {model: {name: field}}
+        """
         Field = cls.registry.System.Field
-        query = Field.query()
-        query = query.filter(Field.model == model)
-        query = query.filter(Field.name.notin_(m.loaded_columns))
-        for model_ in query.all():
+        fields = {}
+        for field in Field.query().with_polymorphic('*').all():
+            fields.setdefault(field.model, {})[field.name] = field
+
+        return fields
+
+    @classmethod
+    def delete_field(cls, fields, field):
+        """ Remove the field from the existing fields and from the session,
+        the deletion is done by the next flush
+
+        :param fields: existing fields {model: {name: field}}
+        :param field: the field to delete
+        """
+        del fields[field.model][field.name]
+        field.delete(flush=False)
+
+    @classmethod
+    def update_fields(cls, model, table, fields, toinsert):
+        """ Compute the changes of the fields of an existing model
+
+        The useless fields are deleted, the existing fields are altered in
+        the session and the values of the new fields are added in toinsert
+
+        :param model: namespace of the model
+        :param table: name of the table of the model
+        :param fields: existing fields {model: {name: field}}
+        :param toinsert: values to insert {Field model: [values]}
+        """
+        m = cls.registry.get(model)
+        # remove useless column
+        for model_ in list(fields.get(model, {}).values()):
+            if model_.name in m.loaded_columns:
+                continue
+
             if model_.entity_type == 'Model.System.RelationShip':
                 if model_.remote:
                     continue
 
-                RelationShip = cls.registry.System.RelationShip
-                Q = RelationShip.query()
-                Q = Q.filter(RelationShip.name == model_.remote_name)
-                Q = Q.filter(RelationShip.model == model_.remote_model)
-                Q.delete()
+                remote = fields.get(model_.remote_model, {}).get(
+                    model_.remote_name)
+                if remote is not None and (
+                        remote.entity_type == 'Model.System.RelationShip'):
+                    cls.delete_field(fields, remote)
 
-            model_.delete()
+            cls.delete_field(fields, model_)
 
         # add or update new column
-        for cname in m.loaded_columns:
-            ftype = fsp[model][cname].__class__.__name__
-            field, Field = cls.get_field(m, cname)
-            cname = Field.get_cname(field, cname)
-            query = Field.query()
-            query = query.filter(Field.model == model)
-            query = query.filter(Field.name == cname)
-            if query.count():
-                Field.alter_field(query.first(), field, ftype)
+        existing_fields = fields.get(model, {})
+        for cname, field, Field, ftype in cls.get_model_fields(model):
+            if cname in existing_fields:
+                Field.alter_field(existing_fields[cname], field, ftype)
             else:
-                Field.add_field(cname, field, model, table, ftype)
+                toinsert.setdefault(Field, []).extend(
+                    Field.get_field_values(cname, field, model, table, ftype))
 
     @classmethod
-    def add_fields(cls, model, table):
-        fsp = cls.registry.loaded_namespaces_first_step
+    def add_fields(cls, model, table, toinsert):
+        """ Compute the values of a new model and of its fields
+
+        :param model: namespace of the model
+        :param table: name of the table of the model
+        :param toinsert: values to insert {Model: [values]}
+        """
         m = cls.registry.get(model)
         is_sql_model = len(m.loaded_columns) > 0
-        cls.insert(name=model, table=table, schema=m.__db_schema__,
-                   is_sql_model=is_sql_model)
-        for cname in m.loaded_columns:
-            field, Field = cls.get_field(m, cname)
-            cname = Field.get_cname(field, cname)
-            ftype = fsp[model][cname].__class__.__name__
-            Field.add_field(cname, field, model, table, ftype)
+        toinsert.setdefault(cls, []).append(dict(
+            name=model, table=table, schema=m.__db_schema__,
+            is_sql_model=is_sql_model))
+        for cname, field, Field, ftype in cls.get_model_fields(model):
+            toinsert.setdefault(Field, []).extend(
+                Field.get_field_values(cname, field, model, table, ftype))
+
+    @classmethod
+    def insert_all(cls, fields, toinsert, inserted):
+        """ Insert the new models and fields, with one multi insert by
+        model. A field can be given twice, by the both sides of a
+        relationship, only the first values are inserted
+
+        :param fields: existing fields {model: {name: field}}
+        :param toinsert: values to insert {Model: [values]}
+        :param inserted: set of the (model, name) of the fields already
+            inserted, updated by this method
+        """
+        for Model, values in toinsert.items():
+            if Model is not cls:
+                rows = []
+                for value in values:
+                    key = (value['model'], value['name'])
+                    if key in inserted or (
+                            value['name'] in fields.get(value['model'], {})):
+                        continue
+
+                    inserted.add(key)
+                    rows.append(value)
+
+                values = rows
+
+            Model.multi_insert(*values)
+
+    @classmethod
+    def insert_by_model(cls, fields, toinsert):
+        """ Insert the new models and fields, model by model, an error on
+        a model is logged and does not stop the insertion of the others
+
+        :param fields: existing fields {model: {name: field}}
+        :param toinsert: values to insert {model: {Model: [values]}}
+        """
+        inserted = set()
+        for values in toinsert.values():
+            try:
+                cls.insert_all(fields, values, inserted)
+            except Exception as e:
+                logger.exception(str(e))
+
+    @classmethod
+    def delete_unloaded_models(cls, models, fields):
+        """ Remove the models and the fields which are not in
+        loaded_namespaces, the deletion is done by the next flush
+
+        :param models: existing models {name: model}
+        :param fields: existing fields {model: {name: field}}
+        """
+        for name, model_ in models.items():
+            if name in cls.registry.loaded_namespaces:
+                continue
+
+            for field in list(fields.get(name, {}).values()):
+                cls.delete_field(fields, field)
+
+            model_.delete(flush=False)
 
     @classmethod
     def update_list(cls):
         """ Insert and update the table of models
 
+        The existing models and fields are loaded by two queries, the
+        changes are computed in memory then applied by one flush for the
+        updates and the deletions and by one multi insert by field model
+        for each model
+
         :exception: Exception
         """
+        models = {model_.name: model_ for model_ in cls.query().all()}
+        fields = cls.get_existing_fields()
+        toinsert = {}
+        updated = []
         for model in cls.registry.loaded_namespaces.keys():
             try:
+                values = toinsert.setdefault(model, {})
                 # TODO need refactor, then try except pass whenever refactor
                 # not apply
                 m = cls.registry.get(model)
@@ -138,26 +329,24 @@ class Model:
                 if hasattr(m, '__tablename__'):
                     table = m.__tablename__
 
-                _m = cls.query('name').filter(cls.name == model)
-                if _m.count():
-                    cls.update_fields(model, table)
+                if model in models:
+                    cls.update_fields(model, table, fields, values)
                 else:
-                    cls.add_fields(model, table)
+                    cls.add_fields(model, table, values)
 
                 if m.loaded_columns:
-                    cls.fire('Update Model', model)
+                    updated.append(model)
 
             except Exception as e:
                 logger.exception(str(e))
 
-        # remove model and field which are not in loaded_namespaces
-        query = cls.query()
-        query = query.filter(
-            cls.name.notin_(cls.registry.loaded_namespaces.keys()))
-        Field = cls.registry.System.Field
-        for model_ in query.all():
-            Q = Field.query().filter(Field.model == model_.name)
-            for field in Q.all():
-                field.delete()
+        cls.delete_unloaded_models(models, fields)
+        cls.registry.flush()
+        cls.insert_by_model(fields, toinsert)
+        for model in updated:
+            cls.fire('Update Model', model)
 
-            model_.delete()
+        # the rows of the fields are the values of the assembled models
+        # again, the index is computed from them without query
+        cls.get_fields_metadata.cache_clear()
+        cls.registry.fields_metadata_computed = False
@@ -26,25 +26,28 @@ class RelationShip(System.Field):
     remote = Boolean(default=False)
     nullable = Boolean()
 
-    def _description(self):
-        res = super(RelationShip, self)._description()
-        remote_name = self.remote_name or ''
+    @classmethod
+    def get_description(cls, values):
+        res = super(RelationShip, cls).get_description(values)
+        remote_name = values['remote_name'] or ''
         res.update(
-            nullable=self.nullable,
-            model=self.remote_model,
+            nullable=values['nullable'],
+            model=values['remote_model'],
             remote_name=remote_name
         )
         return res
 
     @classmethod
-    def add_field(cls, rname, relation, model, table, ftype):
-        """ Insert a relationship definition
+    def get_field_values(cls, rname, relation, model, table, ftype):
+        """ Return the values to insert for a relationship definition,
+        and for its remote side if the relationship has a remote name
 
         :param rname: name of the relationship
         :param relation: instance of the relationship
         :param model: namespace of the model
         :param table: name of the table of the model
         :param ftype: type of the AnyBlok Field
+        :rtype: list of dict
         """
         local_column = relation.info.get('local_column')
         remote_column = relation.info.get('remote_column')
@@ -58,7 +61,7 @@ class RelationShip(System.Field):
                     remote_model=remote_model, remote_name=remote_name,
                     remote_column=remote_column, label=label,
                     nullable=nullable, ftype=ftype)
-        cls.insert(**vals)
+        values = [vals]
 
         if remote_name:
             remote_type = "Many2One"
@@ -77,7 +80,9 @@ class RelationShip(System.Field):
                         remote_column=local_column,
                         label=remote_name.capitalize().replace('_', ' '),
                         nullable=True, ftype=remote_type, remote=True)
-            cls.insert(**vals)
+            values.append(vals)
+
+        return values
 
     @classmethod
     def alter_field(cls, field, label, ftype):
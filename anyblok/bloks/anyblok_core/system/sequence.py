@@ -6,7 +6,7 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 from anyblok import Declarations
-from sqlalchemy import Sequence as SQLASequence
+from sqlalchemy import Sequence as SQLASequence, event
 from anyblok.column import Integer, String
 
 
@@ -120,10 +120,10 @@ class Sequence:
         return super(Sequence, cls).insert(**cls.create_sequence(kwargs))
 
     @classmethod
-    def multi_insert(cls, *args):
+    def multi_insert(cls, *args, **kwargs):
         """Overwrite to call :meth:`create_sequence` on the fly."""
         res = [cls.create_sequence(x) for x in args]
-        return super(Sequence, cls).multi_insert(*res)
+        return super(Sequence, cls).multi_insert(*res, **kwargs)
 
     def nextval(self):
         """Format and return the next value of the sequence.
@@ -131,7 +131,19 @@ class Sequence:
         :rtype: str
         """
         nextval = self.registry.execute(SQLASequence(self.seq_name))
-        self.update(number=nextval)
+        session = self.registry.session
+        if session._flushing:
+            # called by the default of a Sequence column, a change of the
+            # sequence inside the flush would be reset by SQLAlchemy, the
+            # number is updated after the flush
+            def update_number(session, flush_context):
+                self.update(number=nextval)
+
+            event.listen(session, 'after_flush_postexec', update_number,
+                         once=True)
+        else:
+            self.update(number=nextval)
+
         return self.formater.format(code=self.code, seq=nextval, id=self.id)
 
     @classmethod
@@ -1,12 +1,143 @@
 # This file is a part of the AnyBlok project
 #
 #    Copyright (C) 2014 Jean-Sebastien SUZANNE <jssuzanne@anybox.fr>
+#    Copyright (C) 2019 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
 #
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
-from anyblok.tests.testcase import BlokTestCase
+import pytest
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
 
 
-class TestSystemModel(BlokTestCase):
-    pass
+@pytest.mark.usefixtures('rollback_registry')
+class TestSystemModel:
+
+    def get_fields(self, registry, model):
+        Field = registry.System.Field
+        query = Field.query('name').filter(Field.model == model)
+        return set(x[0] for x in query.all())
+
+    def test_update_list_without_change(self, rollback_registry):
+        registry = rollback_registry
+        Model = registry.System.Model
+        Field = registry.System.Field
+        nb_models = Model.query().count()
+        nb_fields = Field.query().count()
+        Model.update_list()
+        assert Model.query().count() == nb_models
+        assert Field.query().count() == nb_fields
+
+    def test_update_list_add_removed_fields(self, rollback_registry):
+        registry = rollback_registry
+        Model = registry.System.Model
+        Field = registry.System.Field
+        fields = self.get_fields(registry, 'Model.System.Blok')
+        query = Field.query().filter(Field.model == 'Model.System.Blok')
+        for field in query.filter(Field.name.in_(['state', 'version'])):
+            field.delete()
+
+        Model.update_list()
+        assert self.get_fields(registry, 'Model.System.Blok') == fields
+        column = registry.System.Column.query().filter_by(
+            model='Model.System.Blok', name='state').one()
+        assert column.ftype == 'Selection'
+
+    def test_update_list_add_removed_model(self, rollback_registry):
+        registry = rollback_registry
+        Model = registry.System.Model
+        fields = self.get_fields(registry, 'Model.System.Blok')
+        Model.query().filter_by(name='Model.System.Blok').one().delete()
+        Model.update_list()
+        model = Model.query().filter_by(name='Model.System.Blok').one()
+        assert model.table == 'system_blok'
+        assert self.get_fields(registry, 'Model.System.Blok') == fields
+
+    def test_update_list_remove_unknown_model(self, rollback_registry):
+        registry = rollback_registry
+        Model = registry.System.Model
+        Column = registry.System.Column
+        Model.insert(name='Model.Unknown', table='unknown')
+        Column.insert(name='id', model='Model.Unknown', label='Id',
+                      ftype='Integer', code='unknown.id', autoincrement=True,
+                      nullable=False, primary_key=True)
+        Model.update_list()
+        assert not Model.query().filter_by(name='Model.Unknown').count()
+        assert not self.get_fields(registry, 'Model.Unknown')
+
+    def test_fields_metadata_as_saved(self, rollback_registry):
+        registry = rollback_registry
+        Field = registry.System.Field
+        index = registry.System.Model.get_fields_metadata()
+        for field in Field.query().with_polymorphic('*').all():
+            if field.model not in registry.loaded_namespaces:
+                continue
+
+            Field_, values = index[field.model][field.name]
+            assert Field_.__registry_name__ == field.entity_type
+            assert values['ftype'] == field.ftype
+            assert Field_.get_description(values) == field._description()
+
+    def test_fields_metadata_cached(self, rollback_registry):
+        registry = rollback_registry
+        index = registry.System.Model.get_fields_metadata()
+        assert registry.System.Model.get_fields_metadata() is index
+
+    def test_fields_metadata_invalidated_by_another_process(
+        self, rollback_registry
+    ):
+        registry = rollback_registry
+        Model = registry.System.Model
+        Cache = registry.System.Cache
+        Column = registry.System.Column
+        index = Model.get_fields_metadata()
+        assert index['Model.System.Model']['table'][1]['label'] == 'Table'
+        column = Column.from_primary_keys(model='Model.System.Model',
+                                          name='table')
+        column.label = 'Test'
+        # the invalidation saved by the process which fired Update Model
+        Cache.insert(registry_name='Model.System.Model',
+                     method='get_fields_metadata')
+        Cache.clear_invalidate_cache()
+        index = Model.get_fields_metadata()
+        assert index['Model.System.Model']['table'][1]['label'] == 'Test'
+
+    def test_update_list_insert_error_on_one_model(self, rollback_registry):
+        registry = rollback_registry
+        Model = registry.System.Model
+        fields = self.get_fields(registry, 'Model.System.Blok')
+        Model.query().filter(Model.name.in_(
+            ['Model.System.Blok', 'Model.System.Parameter'])).delete(
+                synchronize_session='fetch')
+        insert_all = Model.insert_all
+
+        def insert_all_except_parameter(fields, toinsert, inserted):
+            if any(x['name'] == 'Model.System.Parameter'
+                   for x in toinsert.get(Model, [])):
+                raise Exception('Error on Model.System.Parameter')
+
+            insert_all(fields, toinsert, inserted)
+
+        with patch.object(Model, 'insert_all',
+                          side_effect=insert_all_except_parameter):
+            Model.update_list()
+
+        assert not Model.query().filter_by(
+            name='Model.System.Parameter').count()
+        model = Model.query().filter_by(name='Model.System.Blok').one()
+        assert model.table == 'system_blok'
+        assert self.get_fields(registry, 'Model.System.Blok') == fields
+
+    def test_fields_metadata_without_query_after_update_list(
+        self, rollback_registry
+    ):
+        registry = rollback_registry
+        Model = registry.System.Model
+        Model.update_list()
+        with patch.object(Model, 'update_fields_metadata') as update:
+            Model.get_fields_metadata()
+
+        update.assert_not_called()
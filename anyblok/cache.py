@@ -0,0 +1,546 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2019 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import update_wrapper, lru_cache
+from threading import RLock, local
+from time import monotonic
+from types import MethodType
+from weakref import WeakValueDictionary
+
+
+class CacheException(Exception):
+    """ Simple exception for the cached methods """
+
+
+def get_size(value, depth=3):
+    """ Return an estimation of the memory used by the value, the
+    containers (list, tuple, set, dict) are measured with their items
+
+    :param value: value to measure
+    :param depth: number of levels of the containers to measure
+    :rtype: int, size in bytes
+    """
+    size = sys.getsizeof(value)
+    if depth <= 0:
+        return size
+
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += get_size(key, depth - 1) + get_size(item, depth - 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += get_size(item, depth - 1)
+
+    return size
+
+
+invalidation_context = local()
+
+
+@contextmanager
+def invalidation_cause(cause):
+    """ Give the cause of the invalidations done in the context, it is
+    saved by the caches as the cause of their last invalidation::
+
+        with invalidation_cause('System.Cache'):
+            method_cache.cache_clear()
+
+    :param cause: description of the invalidation
+    """
+    previous = getattr(invalidation_context, 'cause', None)
+    invalidation_context.cause = cause
+    try:
+        yield
+    finally:
+        invalidation_context.cause = previous
+
+
+class LRUPolicy:
+    """ Evict the least recently used entry """
+
+    def hit(self, entries, key):
+        """ Called when the entry is read from the cache
+
+        :param entries: OrderedDict of the entries of the cache
+        :param key: key of the entry
+        """
+        entries.move_to_end(key)
+
+    def victim(self, entries):
+        """ Return the key of the entry to evict
+
+        :param entries: OrderedDict of the entries of the cache
+        :rtype: key
+        """
+        return next(iter(entries))
+
+
+class FIFOPolicy(LRUPolicy):
+    """ Evict the oldest entry, the reads do not change the order """
+
+    def hit(self, entries, key):
+        pass
+
+
+EVICTION_POLICIES = {
+    'lru': LRUPolicy,
+    'fifo': FIFOPolicy,
+}
+
+
+class CacheEntry:
+
+    __slots__ = ('value', 'expire', 'size')
+
+    def __init__(self, value, expire, size):
+        self.value = value
+        self.expire = expire
+        self.size = size
+
+
+class CacheStore:
+    """ Entries of a cache, with their estimated memory """
+
+    __slots__ = ('entries', 'bytes', 'generation', 'session_id')
+
+    def __init__(self, generation=0, session_id=None):
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.generation = generation
+        self.session_id = session_id
+
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry.size
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+
+class MethodCache:
+    """ Cache of the results of a method, used by ``cache`` and
+    ``classmethod_cache``
+
+    The cache is bounded by the number of entries (``size``), by the
+    estimated memory of the results (``max_bytes``) and by the time to live
+    of the entries (``ttl`` in seconds). When a bound is reached, the
+    entries are evicted by the policy (``lru``, ``fifo`` or an instance of
+    a class with the methods ``hit`` and ``victim``)::
+
+        method_cache = MethodCache(method, size=128, ttl=60,
+                                   max_bytes=1024 * 1024)
+        method_cache(*args)
+        method_cache.cache_info()
+
+    The caches are cleared by ``cache_clear``, like ``functools.lru_cache``,
+    or only for some arguments by ``cache_invalidate``.
+    """
+
+    kwd_mark = (object(),)
+
+    def __init__(self, method, size=128, ttl=None, max_bytes=None,
+                 policy='lru'):
+        update_wrapper(self, method)
+        self.method = method
+        self.size = size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.policy = self.get_policy(policy)
+        self.store = CacheStore()
+        self.lock = RLock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        self.invalidations = 0
+        self.last_invalidation = None
+
+    @staticmethod
+    def get_policy(policy):
+        """ Return the instance of the eviction policy
+
+        :param policy: name of the policy or instance of the policy
+        :rtype: policy instance
+        :exception: CacheException
+        """
+        if policy is None:
+            policy = 'lru'
+
+        if isinstance(policy, str):
+            if policy not in EVICTION_POLICIES:
+                raise CacheException("Unknown eviction policy %r" % policy)
+
+            return EVICTION_POLICIES[policy]()
+
+        return policy
+
+    @property
+    def entries(self):
+        return self.store.entries
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        return MethodType(self, instance)
+
+    def make_key(self, args, kwargs):
+        if kwargs:
+            return args + self.kwd_mark + tuple(sorted(kwargs.items()))
+
+        return args
+
+    def __call__(self, *args, **kwargs):
+        return self.call(self.store, self.make_key(args, kwargs), args,
+                         kwargs)
+
+    def call(self, store, key, args, kwargs):
+        """ Return the result from the store, or call the method and add
+        the result in the store
+
+        :param store: CacheStore instance
+        :param key: key of the call in the store
+        :param args: positional arguments of the method
+        :param kwargs: named arguments of the method
+        """
+        with self.lock:
+            entry = store.entries.get(key)
+            if entry is not None:
+                if entry.expire is None or entry.expire > monotonic():
+                    self.hits += 1
+                    self.policy.hit(store.entries, key)
+                    return entry.value
+
+                store.remove(key)
+                self.expirations += 1
+
+            self.misses += 1
+
+        value = self.method(*args, **kwargs)
+        self.add(store, key, value)
+        return value
+
+    def add(self, store, key, value):
+        """ Add the result in the store, and evict the entries out of the
+        bounds
+
+        :param store: CacheStore instance
+        :param key: key of the call
+        :param value: result of the method
+        """
+        size = get_size(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # the result is never cached
+            return
+
+        expire = monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            if key in store.entries:
+                store.remove(key)
+
+            store.entries[key] = CacheEntry(value, expire, size)
+            store.bytes += size
+            while store.entries and self.is_full(store):
+                store.remove(self.policy.victim(store.entries))
+                self.evictions += 1
+
+    def is_full(self, store):
+        """ Return True if an entry must be evicted from the store
+
+        :param store: CacheStore instance
+        :rtype: bool
+        """
+        if self.size is not None and len(store.entries) > self.size:
+            return True
+
+        if self.max_bytes is not None and store.bytes > self.max_bytes:
+            return True
+
+        return False
+
+    def get_stores(self):
+        """ Return the valid stores of the cache
+
+        :rtype: list of CacheStore
+        """
+        return [self.store]
+
+    def record_invalidation(self, method, args=None):
+        """ Count the invalidation and save its date and its cause, the
+        cause is given by ``invalidation_cause`` or is the name of the
+        method of invalidation
+
+        :param method: name of the method of invalidation
+        :param args: arguments of the invalidated entries
+        """
+        cause = getattr(invalidation_context, 'cause', None) or method
+        with self.lock:
+            self.invalidations += 1
+            self.last_invalidation = {
+                'date': datetime.now(),
+                'cause': cause,
+                'args': args,
+            }
+
+    def cache_clear(self):
+        """ Remove all the entries """
+        self.record_invalidation('cache_clear')
+        with self.lock:
+            self.store.clear()
+
+    def cache_invalidate(self, *args, **kwargs):
+        """ Remove the entries of the arguments, the first argument of the
+        method (the class or the instance of the model) is not given::
+
+            method_cache.cache_invalidate(*args)
+
+        :param args: positional arguments of the method
+        :param kwargs: named arguments of the method
+        """
+        key = self.make_key(args, kwargs)
+        self.record_invalidation('cache_invalidate', args=key)
+        with self.lock:
+            for store in self.get_stores():
+                self.invalidate_store(store, key)
+
+    def invalidate_store(self, store, key):
+        """ Remove the entries of the key from the store, whatever the
+        first argument of the call
+
+        :param store: CacheStore instance
+        :param key: key of the call without the first argument
+        """
+        for entry_key in [x for x in store.entries if x[1:] == key]:
+            store.remove(entry_key)
+
+    def cache_info(self):
+        """ Return the statistics of the cache
+
+        :rtype: dict
+        """
+        with self.lock:
+            stores = self.get_stores()
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'currsize': sum(len(store.entries) for store in stores),
+                'bytes': sum(store.bytes for store in stores),
+                'maxsize': self.size,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'invalidations': self.invalidations,
+            }
+
+    def cache_memory(self):
+        """ Return the estimated memory of the results, the size of each
+        result is estimated if the cache is not bounded by ``max_bytes``
+
+        :rtype: int, size in bytes
+        """
+        with self.lock:
+            stores = self.get_stores()
+            if self.max_bytes is not None:
+                return sum(store.bytes for store in stores)
+
+            return sum(get_size(entry.value)
+                       for store in stores
+                       for entry in list(store.entries.values()))
+
+
+def get_session_id(instance):
+    """ Return the id of the session of the SQLAlchemy instance
+
+    :param instance: instance of a model
+    :rtype: int or None if the instance is not in a session
+    """
+    state = instance.__dict__.get('_sa_instance_state')
+    if state is None:
+        return None
+
+    return state.session_id
+
+
+class InstanceMethodCache(MethodCache):
+    """ Cache of the results of a method by instance, used by ``cache``
+
+    The entries are stored in the instance, the cache does not keep the
+    instances alive. The bounds (``size``, ``max_bytes``) are applied to
+    the entries of each instance. The entries of an instance are dropped
+    when the instance is expunged or its session is closed (when the
+    session of the instance changes), and by ``cache_clear``.
+
+    The instances without ``__dict__`` use the entries of the method.
+    """
+
+    store_attribute = '__anyblok_method_caches__'
+
+    def __init__(self, *args, **kwargs):
+        super(InstanceMethodCache, self).__init__(*args, **kwargs)
+        self.generation = 0
+        self.instances = WeakValueDictionary()
+
+    def __call__(self, instance, *args, **kwargs):
+        store = self.get_store(instance)
+        if store is None:
+            return super(InstanceMethodCache, self).__call__(
+                instance, *args, **kwargs)
+
+        return self.call(store, self.make_key(args, kwargs),
+                         (instance,) + args, kwargs)
+
+    def get_store(self, instance):
+        """ Return the valid store of the instance
+
+        :param instance: instance of the model
+        :rtype: CacheStore or None if the instance has no ``__dict__``
+        """
+        try:
+            stores = instance.__dict__.setdefault(self.store_attribute, {})
+        except AttributeError:
+            return None
+
+        session_id = get_session_id(instance)
+        with self.lock:
+            store = stores.get(self)
+            if (store is None or store.generation != self.generation or
+                    store.session_id != session_id):
+                store = stores[self] = CacheStore(
+                    generation=self.generation, session_id=session_id)
+                self.instances[id(instance)] = instance
+
+        return store
+
+    def get_stores(self):
+        stores = []
+        for instance in list(self.instances.values()):
+            store = instance.__dict__.get(self.store_attribute, {}).get(self)
+            if store is None or store.generation != self.generation:
+                continue
+
+            if store.session_id != get_session_id(instance):
+                continue
+
+            stores.append(store)
+
+        stores.append(self.store)
+        return stores
+
+    def invalidate_store(self, store, key):
+        if store is self.store:
+            super(InstanceMethodCache, self).invalidate_store(store, key)
+        elif key in store.entries:
+            # the instance is not a part of the keys of its store
+            store.remove(key)
+
+    def cache_clear(self):
+        self.record_invalidation('cache_clear')
+        with self.lock:
+            self.generation += 1
+            self.instances.clear()
+            self.store.clear()
+
+
+class LRUMethodCache(MethodCache):
+    """ Cache of the results of a method by ``functools.lru_cache``, used
+    when the cache is only bounded by the number of entries with the
+    ``lru`` policy
+
+    The entries are not reachable in ``functools.lru_cache``: the key of
+    each entry contains the number of invalidations of its arguments, the
+    invalidation of some arguments by ``cache_invalidate`` makes their
+    entries unreachable, they are evicted by ``functools.lru_cache`` as the
+    least recently used. The memory of the results is not estimated.
+    """
+
+    def __init__(self, method, size=128, policy='lru'):
+        super(LRUMethodCache, self).__init__(method, size=size,
+                                             policy=policy)
+        self.lru = lru_cache(maxsize=size)(self.call_method)
+        self.versions = {}
+        self.removed = 0
+
+    def call_method(self, version, *args, **kwargs):
+        return self.method(*args, **kwargs)
+
+    def __call__(self, *args, **kwargs):
+        # the first argument is the class or the instance of the model
+        version = self.versions.get(self.make_key(args[1:], kwargs), 0)
+        return self.lru(version, *args, **kwargs)
+
+    def clear_lru(self):
+        """ Remove all the entries, the statistics of
+        ``functools.lru_cache`` are kept by the cache
+        """
+        with self.lock:
+            info = self.lru.cache_info()
+            self.hits += info.hits
+            self.misses += info.misses
+            self.removed += info.currsize
+            self.lru.cache_clear()
+            self.versions.clear()
+
+    def cache_clear(self):
+        self.record_invalidation('cache_clear')
+        self.clear_lru()
+
+    def cache_invalidate(self, *args, **kwargs):
+        key = self.make_key(args, kwargs)
+        self.record_invalidation('cache_invalidate', args=key)
+        with self.lock:
+            self.versions[key] = self.versions.get(key, 0) + 1
+
+    def cache_info(self):
+        with self.lock:
+            info = self.lru.cache_info()
+            hits = self.hits + info.hits
+            misses = self.misses + info.misses
+            return {
+                'hits': hits,
+                'misses': misses,
+                # each miss adds an entry, the missing ones are evicted
+                'evictions': max(misses - self.removed - info.currsize, 0),
+                'expirations': 0,
+                'currsize': info.currsize,
+                'bytes': 0,
+                'maxsize': self.size,
+                'max_bytes': None,
+                'ttl': None,
+                'invalidations': self.invalidations,
+            }
+
+    def cache_memory(self):
+        return 0
+
+
+def get_method_cache(method, per_instance=False, size=128, ttl=None,
+                     max_bytes=None, policy='lru'):
+    """ Return the cache of the method, ``functools.lru_cache`` is used if
+    the cache is only bounded by the number of entries with the ``lru``
+    policy
+
+    :param method: the cached method
+    :param per_instance: if True the entries are stored in the instances
+    :param size: maximum number of entries, None for no limit
+    :param ttl: time to live of the entries in seconds, None for no limit
+    :param max_bytes: maximum estimated memory of the results, None for no
+        limit
+    :param policy: eviction policy
+    :rtype: MethodCache instance
+    """
+    if per_instance:
+        return InstanceMethodCache(method, size=size, ttl=ttl,
+                                   max_bytes=max_bytes, policy=policy)
+
+    if ttl is None and max_bytes is None and policy in (None, 'lru'):
+        return LRUMethodCache(method, size=size)
+
+    return MethodCache(method, size=size, ttl=ttl, max_bytes=max_bytes,
+                       policy=policy)
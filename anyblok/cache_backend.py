@@ -0,0 +1,434 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2019 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import os
+import pickle
+import sqlite3
+import tempfile
+from hashlib import sha1
+from logging import getLogger
+from threading import RLock
+from time import time
+from pkg_resources import iter_entry_points
+from .blok import BlokManager
+from .cache import MethodCache, get_method_cache
+from .config import Configuration
+
+logger = getLogger(__name__)
+
+PICKLE_PROTOCOL = 4
+
+
+class CacheBackendException(Exception):
+    """ Simple exception for the backends of the cached methods """
+
+
+class CacheBackend:
+    """ Base class of the backends of the cached classmethods
+
+    The backend creates the caches of the classmethods decorated by
+    ``classmethod_cache``, the default backend keeps the entries in the
+    process. The backend is defined by the configuration ``cache_backend``,
+    it is the name of an entry point of the group ``anyblok.cache.backend``.
+
+    Whatever the backend, the entries are invalidated by ``System.Cache``.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    @classmethod
+    def get(cls, registry):
+        """ Return the backend defined by the configuration
+
+        :param registry: the current registry
+        :rtype: CacheBackend instance
+        :exception: CacheBackendException
+        """
+        name = registry.additional_setting.get(
+            'cache_backend', Configuration.get('cache_backend'))
+        if not name:
+            return MemoryCacheBackend(registry)
+
+        for i in iter_entry_points('anyblok.cache.backend', name):
+            return i.load()(registry)
+
+        raise CacheBackendException("Unknown cache backend %r" % name)
+
+    def get_method_cache(self, method, **options):
+        """ Return the cache of the classmethod
+
+        :param method: the decorated classmethod
+        :param options: bounds of the cache (size, ttl, max_bytes, policy)
+        :rtype: MethodCache instance
+        """
+        return get_method_cache(method, **options)
+
+    def start(self):
+        """ Called when the registry is started, before the loading """
+
+    def close(self):
+        """ Release the resources of the backend """
+
+
+class MemoryCacheBackend(CacheBackend):
+    """ Backend in the process, each process computes and stores its own
+    entries
+    """
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """ Backend shared by the processes of the same host, the entries are
+    pickled in a local SQLite file (configuration ``cache_backend_path``,
+    by default ``anyblok-cache-<db_name>.sqlite`` in the temporary
+    directory)
+
+    A result computed by a process is read by the other processes, the
+    entries are stored once for all the processes. The arguments and the
+    results must be picklable, else the result is not cached. The entries
+    are kept by database and by version of the loaded bloks, the processes
+    of another database or with another code do not read them.
+
+    The file outlives the processes, the invalidations committed while no
+    process of the host was running are never applied to its entries, so
+    the entries of the database are removed when a registry is started.
+    The forked processes keep them.
+    """
+
+    create_table = """
+        CREATE TABLE IF NOT EXISTS anyblok_cache (
+            name TEXT NOT NULL,
+            version TEXT NOT NULL,
+            key BLOB NOT NULL,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            expire REAL,
+            PRIMARY KEY (name, version, key)
+        )
+    """
+
+    def __init__(self, registry):
+        super(SQLiteCacheBackend, self).__init__(registry)
+        path = registry.additional_setting.get(
+            'cache_backend_path', Configuration.get('cache_backend_path'))
+        if not path:
+            path = os.path.join(tempfile.gettempdir(),
+                                'anyblok-cache-%s.sqlite' % registry.db_name)
+
+        self.path = path
+        self.lock = RLock()
+        self.connection = None
+        self.pid = None
+        self.inherited_connections = []
+
+    def get_method_cache(self, method, **options):
+        return SharedMethodCache(self, method, **options)
+
+    def get_connection(self):
+        """ Return the connection of the current process, the connection
+        is opened again in the forked processes
+
+        :rtype: sqlite3 connection
+        """
+        pid = os.getpid()
+        if self.connection is not None and self.pid != pid:
+            # the connection of the parent process must not be closed
+            # by the child process
+            self.inherited_connections.append(self.connection)
+            self.connection = None
+
+        if self.connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None,
+                check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(self.create_table)
+            connection.execute(
+                'DELETE FROM anyblok_cache WHERE expire < ?', (time(),))
+            self.connection = connection
+            self.pid = pid
+
+        return self.connection
+
+    def execute(self, query, params=()):
+        with self.lock:
+            return self.get_connection().execute(query, params)
+
+    def start(self):
+        """ Remove the entries of the database, they may be invalidated
+        while no process used them
+        """
+        prefix = '%s:' % self.registry.db_name
+        self.execute('DELETE FROM anyblok_cache WHERE substr(name, 1, ?) = ?',
+                     (len(prefix), prefix))
+
+    def get_version(self):
+        """ Return the version of the loaded bloks, the entries are
+        shared only by the processes with the same bloks
+
+        :rtype: str, hexadecimal digest
+        """
+        value = ['%s:%s' % (blok, BlokManager.bloks[blok].version)
+                 for blok in self.registry.ordered_loaded_bloks]
+        return sha1('\n'.join(value).encode('utf-8')).hexdigest()
+
+    def get(self, name, version, key):
+        """ Return the entry of the key
+
+        :param name: name of the cached method
+        :param version: version of the loaded bloks
+        :param key: pickled arguments of the call
+        :rtype: tuple (pickled value, expire) or None
+        """
+        return self.execute(
+            'SELECT value, expire FROM anyblok_cache '
+            'WHERE name = ? AND version = ? AND key = ?',
+            (name, version, key)).fetchone()
+
+    def set(self, name, version, key, value, expire=None, size=None,
+            max_bytes=None):
+        """ Add the entry and evict the oldest entries out of the bounds
+
+        :param name: name of the cached method
+        :param version: version of the loaded bloks
+        :param key: pickled arguments of the call
+        :param value: pickled result of the call
+        :param expire: timestamp of the expiration, None for no limit
+        :param size: maximum number of entries, None for no limit
+        :param max_bytes: maximum size of the pickled results, None for no
+            limit
+        :rtype: int, number of evicted entries
+        """
+        where = 'WHERE name = ? AND version = ?'
+        params = (name, version)
+        evictions = 0
+        with self.lock:
+            connection = self.get_connection()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute(
+                    'INSERT OR REPLACE INTO anyblok_cache '
+                    '(name, version, key, value, size, expire) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    params + (key, value, len(value), expire))
+                if size is not None:
+                    evictions += connection.execute(
+                        'DELETE FROM anyblok_cache ' + where + ' AND '
+                        'rowid NOT IN (SELECT rowid FROM anyblok_cache ' +
+                        where + ' ORDER BY rowid DESC LIMIT ?)',
+                        params + params + (size,)).rowcount
+
+                while max_bytes is not None:
+                    total = connection.execute(
+                        'SELECT SUM(size) FROM anyblok_cache ' + where,
+                        params).fetchone()[0]
+                    if not total or total <= max_bytes:
+                        break
+
+                    evictions += connection.execute(
+                        'DELETE FROM anyblok_cache WHERE rowid = ('
+                        'SELECT MIN(rowid) FROM anyblok_cache ' + where + ')',
+                        params).rowcount
+
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+
+        return evictions
+
+    def remove(self, name, key, version=None):
+        """ Remove the entries of the key
+
+        :param name: name of the cached method
+        :param key: pickled arguments of the call
+        :param version: version of the loaded bloks, all the versions if
+            None
+        """
+        if version is None:
+            self.execute(
+                'DELETE FROM anyblok_cache WHERE name = ? AND key = ?',
+                (name, key))
+        else:
+            self.execute(
+                'DELETE FROM anyblok_cache '
+                'WHERE name = ? AND version = ? AND key = ?',
+                (name, version, key))
+
+    def clear(self, name):
+        """ Remove all the entries of the cached method, for all the
+        versions
+
+        :param name: name of the cached method
+        """
+        self.execute('DELETE FROM anyblok_cache WHERE name = ?', (name,))
+
+    def info(self, name, version):
+        """ Return the number of entries and the size of the results
+
+        :param name: name of the cached method
+        :param version: version of the loaded bloks
+        :rtype: tuple (number of entries, size in bytes)
+        """
+        count, size = self.execute(
+            'SELECT COUNT(*), SUM(size) FROM anyblok_cache '
+            'WHERE name = ? AND version = ?', (name, version)).fetchone()
+        return count, size or 0
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None and self.pid == os.getpid():
+                self.connection.close()
+
+            self.connection = None
+
+
+class SharedMethodCache(MethodCache):
+    """ Cache of the results of a classmethod, stored by a shared backend
+
+    The entries are evicted from the oldest when a bound is reached, the
+    eviction policy is not used. The hits, misses, evictions and
+    expirations are counted by process.
+    """
+
+    def __init__(self, backend, method, **options):
+        super(SharedMethodCache, self).__init__(method, **options)
+        self.backend = backend
+        self.name = None
+        self.version = None
+
+    def get_name(self):
+        """ Return the name of the entries of the cache in the backend, the
+        databases sharing the same backend path have their own entries
+
+        :rtype: str
+        """
+        if self.name is None:
+            namespace, attr = getattr(
+                self, 'indentify', (None, self.method.__name__))
+            self.name = '%s:%s:%s:%s.%s' % (
+                self.backend.registry.db_name, namespace, attr,
+                self.method.__module__, self.method.__qualname__)
+
+        return self.name
+
+    def get_version(self):
+        if self.version is None:
+            self.version = self.backend.get_version()
+
+        return self.version
+
+    def dumps_key(self, args, kwargs):
+        """ Return the pickled arguments, without the first argument
+
+        :param args: positional arguments of the method
+        :param kwargs: named arguments of the method
+        :rtype: bytes
+        """
+        return pickle.dumps((tuple(args), tuple(sorted(kwargs.items()))),
+                            protocol=PICKLE_PROTOCOL)
+
+    def __call__(self, *args, **kwargs):
+        try:
+            key = self.dumps_key(args[1:], kwargs)
+        except Exception:
+            logger.debug('The arguments of %r are not picklable',
+                         self.get_name())
+            with self.lock:
+                self.misses += 1
+
+            return self.method(*args, **kwargs)
+
+        name, version = self.get_name(), self.get_version()
+        entry = self.backend.get(name, version, key)
+        if entry is not None:
+            value, expire = entry
+            if expire is not None and expire <= time():
+                self.backend.remove(name, key, version=version)
+                with self.lock:
+                    self.expirations += 1
+            else:
+                try:
+                    value = pickle.loads(value)
+                except Exception:
+                    logger.debug('The entry of %r can not be unpickled',
+                                 name)
+                else:
+                    with self.lock:
+                        self.hits += 1
+
+                    return value
+
+        with self.lock:
+            self.misses += 1
+
+        value = self.method(*args, **kwargs)
+        self.add_shared(key, value)
+        return value
+
+    def add_shared(self, key, value):
+        """ Add the result in the backend
+
+        :param key: pickled arguments of the call
+        :param value: result of the method
+        """
+        try:
+            data = pickle.dumps(value, protocol=PICKLE_PROTOCOL)
+        except Exception:
+            logger.debug('The result of %r is not picklable',
+                         self.get_name())
+            return
+
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            # the result is never cached
+            return
+
+        expire = time() + self.ttl if self.ttl is not None else None
+        evictions = self.backend.set(
+            self.get_name(), self.get_version(), key, data, expire=expire,
+            size=self.size, max_bytes=self.max_bytes)
+        with self.lock:
+            self.evictions += evictions
+
+    def cache_clear(self):
+        self.record_invalidation('cache_clear')
+        self.backend.clear(self.get_name())
+
+    def cache_invalidate(self, *args, **kwargs):
+        self.record_invalidation('cache_invalidate',
+                                 args=self.make_key(args, kwargs))
+        try:
+            key = self.dumps_key(args, kwargs)
+        except Exception:
+            # an entry with unpicklable arguments is never stored
+            return
+
+        self.backend.remove(self.get_name(), key)
+
+    def cache_info(self):
+        currsize, size = self.backend.info(self.get_name(),
+                                           self.get_version())
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'currsize': currsize,
+                'bytes': size,
+                'maxsize': self.size,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'invalidations': self.invalidations,
+            }
+
+    def cache_memory(self):
+        """ Return the size of the pickled results of the entries
+
+        :rtype: int, size in bytes
+        """
+        return self.backend.info(self.get_name(), self.get_version())[1]
@@ -0,0 +1,351 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2019 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import json
+import select
+from logging import getLogger
+from threading import Thread, Event, RLock
+from pkg_resources import iter_entry_points
+from sqlalchemy import text
+from .cache import invalidation_cause
+from .config import Configuration
+
+logger = getLogger(__name__)
+
+NOTIFY_CHANNEL = 'anyblok_cache_invalidation'
+
+
+class CacheInvalidationException(Exception):
+    """ Simple exception for the transports of the cache invalidation """
+
+
+def get_params(registry_name, method, args=None):
+    """ Return the parameters of an invalidation, the arguments are given
+    only for the invalidation of some entries
+
+    :param registry_name: namespace of the model
+    :param method: name of the cached method
+    :param args: list of the arguments of the invalidated entries
+    :rtype: list
+    """
+    if args is None:
+        return [registry_name, method]
+
+    return [registry_name, method, args]
+
+
+def load_args(args):
+    """ Return the arguments decoded from JSON as keys of the caches, the
+    lists are converted to tuples
+
+    :param args: list of the arguments
+    :rtype: tuple
+    """
+    return tuple(load_args(arg) if isinstance(arg, list) else arg
+                 for arg in args)
+
+
+class CacheInvalidation:
+    """ Base class of the transports of the cache invalidation
+
+    ``System.Cache`` inserts one row by invalidation, each process polls
+    the table to know which cached methods must be cleared. With a
+    transport, the invalidations are pushed to the processes which clear
+    their caches when they receive them, without polling::
+
+        transport = CacheInvalidation.get(registry)
+        transport.publish('Model.System.Blok', 'is_installed')
+
+    The transport is defined by the configuration
+    ``cache_invalidation_transport``, it is the name of an entry point of
+    the group ``anyblok.cache.invalidation``.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.started = False
+
+    @classmethod
+    def get(cls, registry):
+        """ Return the transport defined by the configuration, the
+        transport must be started to receive the invalidations
+
+        :param registry: the current registry
+        :rtype: CacheInvalidation instance or None if no transport
+        :exception: CacheInvalidationException
+        """
+        name = registry.additional_setting.get(
+            'cache_invalidation_transport',
+            Configuration.get('cache_invalidation_transport'))
+        if not name:
+            return None
+
+        for i in iter_entry_points('anyblok.cache.invalidation', name):
+            return i.load()(registry)
+
+        raise CacheInvalidationException(
+            "Unknown cache invalidation transport %r" % name)
+
+    def start(self):
+        """ Start to receive the invalidations """
+        self.started = True
+
+    def stop(self):
+        """ Stop to receive the invalidations """
+        self.started = False
+
+    def is_alive(self):
+        """ Return True if the invalidations are received, else
+        ``System.Cache`` polls the table to find them
+
+        :rtype: bool
+        """
+        return self.started
+
+    def publish(self, registry_name, method, args=None):
+        """ Send the invalidation to the processes
+
+        :param registry_name: namespace of the model
+        :param method: name of the cached method
+        :param args: list of the arguments of the invalidated entries, all
+            the entries are invalidated if None
+        """
+        raise NotImplementedError
+
+    def receive_all(self):
+        """ Clear all the caches, the invalidations sent while the
+        transport did not receive them are unknown
+        """
+        caches = getattr(self.registry, 'caches', {})
+        with invalidation_cause(self.__class__.__name__):
+            for methods in caches.values():
+                for caches_ in methods.values():
+                    for cache in caches_:
+                        cache.cache_clear()
+
+    def receive(self, registry_name, method, args=None):
+        """ Clear the caches of the invalidated method
+
+        :param registry_name: namespace of the model
+        :param method: name of the cached method
+        :param args: list of the arguments of the invalidated entries, all
+            the entries are invalidated if None
+        """
+        caches = getattr(self.registry, 'caches', {})
+        with invalidation_cause(self.__class__.__name__):
+            for cache in caches.get(registry_name, {}).get(method, []):
+                if args is None:
+                    cache.cache_clear()
+                else:
+                    cache.cache_invalidate(*load_args(args))
+
+
+class LocalCacheInvalidation(CacheInvalidation):
+    """ Transport in the current process, the invalidations are received
+    at once by the other started transports of the same database. Used by
+    the tests and by the applications with only one process
+    """
+
+    subscribers = {}
+    lock = RLock()
+
+    def start(self):
+        with self.lock:
+            self.subscribers.setdefault(self.registry.db_name, []).append(
+                self)
+
+        super(LocalCacheInvalidation, self).start()
+
+    def stop(self):
+        with self.lock:
+            subscribers = self.subscribers.get(self.registry.db_name, [])
+            if self in subscribers:
+                subscribers.remove(self)
+
+        super(LocalCacheInvalidation, self).stop()
+
+    def publish(self, registry_name, method, args=None):
+        with self.lock:
+            subscribers = list(self.subscribers.get(
+                self.registry.db_name, []))
+
+        for subscriber in subscribers:
+            if subscriber is not self:
+                subscriber.receive(
+                    *get_params(registry_name, method, args))
+
+
+class PostgreSQLCacheInvalidation(CacheInvalidation):
+    """ Transport by LISTEN / NOTIFY of PostgreSQL
+
+    The invalidation is notified in the transaction of the session, it is
+    received by the processes only if the transaction is committed. Each
+    process listens the channel with a dedicated connection in a thread,
+    the caches are cleared as soon as the notification is received.
+
+    The invalidations committed before the channel is listened are
+    unknown, so all the caches are cleared when the transport is started
+    (at the start of the registry and after a fork). If the connection is
+    lost, the thread connects again, waiting twice longer after each failure
+    up to ``max_reconnect_delay`` seconds. In the meantime the transport is
+    not alive, ``System.Cache`` polls the table, and all the caches are
+    cleared once the connection is back.
+
+    PostgreSQL refuses the payloads of ``max_payload_size`` bytes or more,
+    for such an invalidation only the model and the method are notified, and
+    all the entries of the method are invalidated.
+    """
+
+    timeout = 1
+    reconnect_delay = 1
+    max_reconnect_delay = 60
+    max_payload_size = 8000
+
+    def __init__(self, registry):
+        super(PostgreSQLCacheInvalidation, self).__init__(registry)
+        self.connection = None
+        self.thread = None
+        self.stopped = Event()
+
+    def connect(self):
+        """ Open the dedicated connection and listen the channel
+
+        :rtype: connection of psycopg2
+        """
+        connection = self.registry.engine.raw_connection()
+        # the listener connection must not go back in the pool
+        connection.detach()
+        connection = connection.connection
+        try:
+            connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute('LISTEN %s;' % NOTIFY_CHANNEL)
+            cursor.close()
+        except Exception:
+            connection.close()
+            raise
+
+        return connection
+
+    def disconnect(self):
+        """ Close the dedicated connection, the errors are ignored because
+        the connection may be already lost
+        """
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def start(self):
+        if not self.registry.engine.url.drivername.startswith('postgres'):
+            raise CacheInvalidationException(
+                "The cache invalidation by LISTEN / NOTIFY needs PostgreSQL")
+
+        self.connection = self.connect()
+        # the notifications sent before the LISTEN are lost
+        self.receive_all()
+        self.stopped.clear()
+        self.thread = Thread(target=self.listen, daemon=True,
+                             name='anyblok-cache-invalidation')
+        self.thread.start()
+        super(PostgreSQLCacheInvalidation, self).start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        self.disconnect()
+        super(PostgreSQLCacheInvalidation, self).stop()
+
+    def is_alive(self):
+        return self.started and self.connection is not None
+
+    def listen(self):
+        """ Wait the notifications until the transport is stopped """
+        while not self.stopped.is_set():
+            if self.connection is None:
+                self.reconnect()
+                continue
+
+            connection = self.connection
+            try:
+                if not select.select([connection], [], [], self.timeout)[0]:
+                    continue
+
+                connection.poll()
+            except Exception:
+                logger.exception('The cache invalidation listener is lost')
+                self.disconnect()
+                continue
+
+            while connection.notifies:
+                self.receive_notify(connection.notifies.pop(0))
+
+    def reconnect(self):
+        """ Try to connect again until the transport is stopped, the delay
+        between two attempts is doubled after each failure
+        """
+        delay = self.reconnect_delay
+        while not self.stopped.wait(delay):
+            try:
+                connection = self.connect()
+            except Exception as e:
+                logger.warning('The cache invalidation listener can not '
+                               'connect, next attempt in %s seconds: %s',
+                               delay, e)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+
+            logger.info('The cache invalidation listener is connected again')
+            # the notifications sent during the disconnection are lost
+            self.receive_all()
+            self.connection = connection
+            return
+
+    def receive_notify(self, notify):
+        """ Decode the payload of the notification and clear the caches
+
+        :param notify: notification of psycopg2
+        """
+        try:
+            params = json.loads(notify.payload)
+            if not isinstance(params, list) or len(params) not in (2, 3):
+                raise ValueError(params)
+        except ValueError:
+            logger.warning('Invalid cache invalidation %r', notify.payload)
+            return
+
+        self.receive(*params)
+
+    def get_payload(self, registry_name, method, args=None):
+        """ Return the payload of the notification, without the arguments
+        if it is too long for PostgreSQL
+
+        :param registry_name: namespace of the model
+        :param method: name of the cached method
+        :param args: list of the arguments of the invalidated entries
+        :rtype: str
+        """
+        payload = json.dumps(get_params(registry_name, method, args))
+        if (args is not None and
+                len(payload.encode('utf-8')) >= self.max_payload_size):
+            logger.info('The cache invalidation payload is too long, all '
+                        'the entries of %s.%s are invalidated',
+                        registry_name, method)
+            payload = json.dumps(get_params(registry_name, method))
+
+        return payload
+
+    def publish(self, registry_name, method, args=None):
+        payload = self.get_payload(registry_name, method, args)
+        self.registry.execute(
+            text('SELECT pg_notify(:channel, :payload)'),
+            dict(channel=NOTIFY_CHANNEL, payload=payload))
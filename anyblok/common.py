@@ -6,10 +6,10 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 import sys
-from functools import lru_cache
 from sqlalchemy.schema import ForeignKeyConstraint
 from sqlalchemy.sql.naming import ConventionDict
 from sqlalchemy.exc import InvalidRequestError
+from .cache import get_method_cache
 
 
 """Define the prefix for the mapper attribute of the column"""
@@ -167,9 +167,19 @@ def apply_cache(attr, method, registry, namespace, base, properties):
         elif attr not in registry.caches[namespace]:
             registry.caches[namespace][attr] = []
 
-        @lru_cache(maxsize=method.size)
-        def wrapper(*args, **kwargs):
-            return method(*args, **kwargs)
+        options = dict(size=method.size,
+                       ttl=getattr(method, 'ttl', None),
+                       max_bytes=getattr(method, 'max_bytes', None),
+                       policy=getattr(method, 'policy', None))
+        backend = getattr(registry, 'cache_backend', None)
+        if (backend is not None and method.is_cache_classmethod and
+                getattr(method, 'shared', False)):
+            wrapper = backend.get_method_cache(method, **options)
+        else:
+            wrapper = get_method_cache(
+                method, per_instance=(not method.is_cache_classmethod and
+                                      getattr(method, 'per_instance', False)),
+                **options)
 
         wrapper.indentify = (namespace, attr)
         registry.caches[namespace][attr].append(wrapper)
@@ -788,6 +788,11 @@ def add_configuration_file(parser):
                         help="Relative path of the config file")
     parser.add_argument('--without-auto-migration', dest='withoutautomigration',
                         action='store_true')
+    parser.add_argument('--force-schema-comparison',
+                        dest='force_schema_comparison', action='store_true',
+                        help="Compare the schema of the database with the "
+                             "models even if the fingerprint of the models "
+                             "is unchanged")
     parser.add_argument('--isolation-level',
                         default="READ_COMMITTED",
                         choices=["SERIALIZABLE", "REPEATABLE_READ",
@@ -797,6 +802,89 @@ def add_configuration_file(parser):
                         default=os.environ.get('ANYBLOK_DEFAULT_TIMEZONE'),
                         help="default timezone use by naive datetime "
                              "(by default use the timezone of the serveur")
+    parser.add_argument('--registry-snapshot-dir',
+                        default=os.environ.get('ANYBLOK_REGISTRY_SNAPSHOT_DIR'),
+                        help="Directory where the snapshot of the assembled "
+                             "registry is saved, to speed up the next "
+                             "loadings of the registry")
+    parser.add_argument('--lazy-assembly', dest='lazy_assembly',
+                        action='store_true',
+                        help="Assemble the models the first time they are "
+                             "used, only if the registry is loaded without "
+                             "migration")
+    parser.add_argument('--incremental-reload', dest='incremental_reload',
+                        action='store_true',
+                        help="During the installation and the update of the "
+                             "bloks, only reassemble the models which depend "
+                             "on the changed bloks")
+    parser.add_argument('--single-pass-install', dest='single_pass_install',
+                        action='store_true',
+                        help="Install all the bloks to install with only one "
+                             "assembly of the models and one migration, in "
+                             "place of one reload of the registry by blok")
+    parser.add_argument('--readonly-registry', dest='readonly_registry',
+                        action='store_true',
+                        help="Load the registry from the installed bloks "
+                             "without migration, without update of the "
+                             "system models and without commit, the bloks "
+                             "can not be installed or updated")
+    parser.add_argument('--cache-invalidation-transport',
+                        dest='cache_invalidation_transport',
+                        default=os.environ.get(
+                            'ANYBLOK_CACHE_INVALIDATION_TRANSPORT'),
+                        help="Name of the transport which pushes the "
+                             "invalidations of the cached methods to the "
+                             "processes (local, postgresql), in place of "
+                             "the polling of the system_cache table")
+    parser.add_argument('--cache-checkpoint-interval',
+                        dest='cache_checkpoint_interval', type=float,
+                        help="Check the invalidations of the cached methods "
+                             "at the beginning of the transactions, at most "
+                             "once by interval (in seconds, 0 for each "
+                             "transaction)")
+    parser.add_argument('--cache-invalidation-retention',
+                        dest='cache_invalidation_retention', type=float,
+                        default=86400,
+                        help="Number of seconds the invalidations of the "
+                             "cached methods are kept in the system_cache "
+                             "table (0 to keep them forever), the table is "
+                             "pruned at most once by retention")
+    parser.add_argument('--cache-backend', dest='cache_backend',
+                        default=os.environ.get('ANYBLOK_CACHE_BACKEND'),
+                        help="Name of the backend of the cached classmethods "
+                             "(memory, sqlite), sqlite shares the entries "
+                             "between the processes of the host")
+    parser.add_argument('--cache-backend-path', dest='cache_backend_path',
+                        default=os.environ.get('ANYBLOK_CACHE_BACKEND_PATH'),
+                        help="Path of the file of the sqlite cache backend, "
+                             "anyblok-cache-<db_name>.sqlite in the "
+                             "temporary directory by default")
+    parser.add_argument('--registry-warm-up', dest='registry_warm_up',
+                        action='store_true',
+                        help="Fill the caches of the metadata of all the "
+                             "models and configure the mappers at the end "
+                             "of the load of the registry")
+    parser.add_argument('--registry-warm-up-models',
+                        dest='registry_warm_up_models', nargs="+",
+                        help="Warm up only these models at the end of the "
+                             "load of the registry")
+    parser.add_argument('--query-chunk-size', dest='query_chunk_size',
+                        type=int, default=1000,
+                        help="Number of primary keys by query for the "
+                             "operations on many primary keys")
+    parser.add_argument('--registry-load-report',
+                        dest='registry_load_report',
+                        default=os.environ.get('ANYBLOK_REGISTRY_LOAD_REPORT'),
+                        choices=['json', 'table'],
+                        help="Record the wall time and the allocated memory "
+                             "of each phase of the loading of the registry "
+                             "and emit the report in this format")
+    parser.add_argument('--registry-load-report-file',
+                        dest='registry_load_report_file',
+                        default=os.environ.get(
+                            'ANYBLOK_REGISTRY_LOAD_REPORT_FILE'),
+                        help="File where the loading report is written, by "
+                             "default the report is logged")
 
 
 @Configuration.add('database', label="Database",
@@ -909,6 +997,20 @@ def add_interpreter(parser):
                         help="Python script to execute")
 
 
+@Configuration.add('cache-report', label="Cache report")
+def add_cache_report(group):
+    """Add arguments to 'cache-report' configuration group
+
+    :param group:
+    """
+    group.add_argument('--cache-report-script', dest='cache_report_script',
+                       help="Python script executed before the report, to "
+                            "call the cached methods")
+    group.add_argument('--cache-report-models', dest='cache_report_models',
+                       nargs='+',
+                       help="Report only the cached methods of these models")
+
+
 @Configuration.add('schema', label="Schema options")
 def add_schema(group):
     """Add arguments to 'schema' configuration group
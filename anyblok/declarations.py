@@ -137,7 +137,21 @@ class Declarations:
             return wrapper
 
 
-def cache(size=128):
+def cache(size=128, ttl=None, max_bytes=None, policy='lru',
+          per_instance=False):
+    """ Cache the result of the method by instance
+
+    :param size: maximum number of entries, None for no limit
+    :param ttl: time to live of the entries in seconds, None for no limit
+    :param max_bytes: maximum estimated memory of the results, None for no
+        limit. A result bigger than this limit is not cached
+    :param policy: eviction policy, ``lru``, ``fifo`` or an instance of a
+        policy class (see ``anyblok.cache``)
+    :param per_instance: if True the entries are stored in the instances,
+        the bounds are applied by instance and the entries are dropped when
+        the instance leaves its session. By default the entries of all the
+        instances are stored in the method and keep the instances alive
+    """
     autodoc = """
     **Cached method** with size=%(size)s
     """ % dict(size=size)
@@ -147,12 +161,29 @@ def cache(size=128):
         method.is_cache_method = True
         method.is_cache_classmethod = False
         method.size = size
+        method.ttl = ttl
+        method.max_bytes = max_bytes
+        method.policy = policy
+        method.per_instance = per_instance
         return method
 
     return wrapper
 
 
-def classmethod_cache(size=128):
+def classmethod_cache(size=128, ttl=None, max_bytes=None, policy='lru',
+                      shared=False):
+    """ Cache the result of the classmethod
+
+    :param size: maximum number of entries, None for no limit
+    :param ttl: time to live of the entries in seconds, None for no limit
+    :param max_bytes: maximum estimated memory of the results, None for no
+        limit. A result bigger than this limit is not cached
+    :param policy: eviction policy, ``lru``, ``fifo`` or an instance of a
+        policy class (see ``anyblok.cache``)
+    :param shared: if True the entries are stored by the cache backend
+        and may be shared with the other processes (see
+        ``anyblok.cache_backend``), by default they are kept in the process
+    """
     autodoc = """
     **Cached classmethod** with size=%(size)s
     """ % dict(size=size)
@@ -162,6 +193,10 @@ def classmethod_cache(size=128):
         method.is_cache_method = True
         method.is_cache_classmethod = True
         method.size = size
+        method.ttl = ttl
+        method.max_bytes = max_bytes
+        method.policy = policy
+        method.shared = shared
         return method
 
     return wrapper
@@ -79,6 +79,22 @@ class EnvironmentManager:
         """ Save the value of the key in the environment """
         return cls.environment.scoped_function_for_session
 
+    @classmethod
+    def reset(cls):
+        """ Remove all the values of the environment, used by a forked
+        process to forget the values of the parent process
+
+        .. note:: the ``reset`` class method of the environment class is
+            optional
+
+        :exception: EnvironmentException
+        """
+        if cls.environment is None:
+            raise EnvironmentException("No environments defined")
+
+        if hasattr(cls.environment, 'reset'):
+            cls.environment.reset()
+
 
 class ThreadEnvironment:
     """ Use the thread, to get the environment """
@@ -114,5 +130,10 @@ class ThreadEnvironment:
 
         return cls.values[str(threading.current_thread())].get(key, default)
 
+    @classmethod
+    def reset(cls):
+        """ Remove the values of all the threads """
+        cls.values.clear()
+
 
 EnvironmentManager.define_environment_cls(ThreadEnvironment)
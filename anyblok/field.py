@@ -14,6 +14,28 @@ class FieldException(Exception):
     """ Simple Exception for Field """
 
 
+def expire_related_attribute(model_self, action_todos):
+    """ Expire the attributes related to a column of the instance
+
+    :param model_self: the instance
+    :param action_todos: the attributes to expire, see
+                         ``registry.expire_attributes``
+    """
+    for action_todo in action_todos:
+        if len(action_todo) == 1:
+            obj = model_self
+            attrs = [action_todo[0]]
+        else:
+            obj = getattr(model_self, action_todo[0])
+            attrs = [action_todo[1]]
+            if obj is None:
+                continue
+
+        if obj in model_self.registry.session:
+            if obj._sa_instance_state.persistent:
+                model_self.registry.expire(obj, attrs)
+
+
 class Field:
     """ Field class
 
@@ -107,19 +129,7 @@ class Field:
         return expr_column
 
     def expire_related_attribute(self, model_self, action_todos):
-        for action_todo in action_todos:
-            if len(action_todo) == 1:
-                obj = model_self
-                attrs = [action_todo[0]]
-            else:
-                obj = getattr(model_self, action_todo[0])
-                attrs = [action_todo[1]]
-                if obj is None:
-                    continue
-
-            if obj in model_self.registry.session:
-                if obj._sa_instance_state.persistent:
-                    model_self.registry.expire(obj, attrs)
+        expire_related_attribute(model_self, action_todos)
 
     def setter_format_value(self, value):
         return value
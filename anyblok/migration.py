@@ -11,11 +11,13 @@ from sqlalchemy.dialects.mysql.types import TINYINT
 from sqlalchemy.dialects.mssql.base import BIT
 from sqlalchemy.sql.sqltypes import Boolean
 from sqlalchemy.ext.compiler import compiles
-from sqlalchemy.sql.ddl import CreateSchema, DropSchema
+from sqlalchemy.sql.ddl import (
+    CreateSchema, DropSchema, CreateTable, CreateIndex)
 from .common import sgdb_in
 from sqlalchemy.schema import (
     DDLElement, PrimaryKeyConstraint, CheckConstraint, UniqueConstraint)
 from logging import getLogger
+from hashlib import sha1
 
 logger = getLogger(__name__)
 
@@ -1284,6 +1286,30 @@ class Migration:
         """
         return MigrationSchema(self, name)
 
+    def get_metadata_fingerprint(self):
+        """ Return the hash of the DDL of the metadata
+
+        Two identical fingerprints mean that the same schema is expected
+        in the database, the DDL is compiled with the dialect of the
+        connection
+
+        :rtype: str, hexadecimal digest
+        """
+        dialect = self.conn.dialect
+        digest = sha1()
+        for table in sorted(self.metadata.tables.values(),
+                            key=lambda t: t.fullname):
+            ddl = CreateTable(table).compile(dialect=dialect)
+            digest.update(str(ddl).encode('utf-8'))
+            for index in sorted(table.indexes, key=lambda i: str(i.name)):
+                ddl = CreateIndex(index).compile(dialect=dialect)
+                digest.update(str(ddl).encode('utf-8'))
+
+        for view in sorted(self.loaded_views):
+            digest.update(view.encode('utf-8'))
+
+        return digest.hexdigest()
+
     def auto_upgrade_database(self, schema_only=False):
         """ Upgrade the database automaticly """
         report = self.detect_changed(schema_only=schema_only)
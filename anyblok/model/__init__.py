@@ -11,12 +11,14 @@
 from anyblok.registry import RegistryManager
 from anyblok import Declarations
 from anyblok.field import Field, FieldException
-from anyblok.relationship import RelationShip
+from anyblok.relationship import RelationShip, Many2Many
 from anyblok.column import Column
 from sqlalchemy import inspection
 from anyblok.common import TypeList
+from collections import OrderedDict
 from copy import deepcopy
 from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.orm import mapperlib
 from anyblok.mapper import ModelAttribute, format_schema
 from anyblok.common import anyblok_column_prefix
 from texttable import Texttable
@@ -24,6 +26,16 @@ from .plugins import get_model_plugins
 from .exceptions import ModelException
 from .factory import has_sql_fields, ModelFactory, ViewFactory
 from .common import get_factory
+from logging import getLogger
+
+try:
+    # private API of SQLAlchemy, only used by the incremental reload
+    from sqlalchemy.ext.declarative.clsregistry import (
+        _ModuleMarker, _MultipleClassMarker)
+except ImportError:  # pragma: no cover
+    _ModuleMarker = _MultipleClassMarker = None
+
+logger = getLogger(__name__)
 
 
 def has_sqlalchemy_fields(base):
@@ -71,6 +83,78 @@ def get_fields(base, without_relationship=False, only_relationship=False,
     return fields
 
 
+def get_listened_model(method):
+    """ Return the name of the model listened by the method
+
+    :param method: attribute of a base
+    :rtype: name of the model or None if the method is not a listener
+    """
+    method = getattr(method, '__func__', method)
+    if getattr(method, 'is_an_event_listener', False):
+        return method.model
+    elif getattr(method, 'is_an_sqlalchemy_event_listener', False):
+        listener = method.sqlalchemy_listener
+        if hasattr(listener, 'attribute'):
+            return listener.attribute.model_name
+
+        return listener.model.model_name
+
+    return None
+
+
+def iter_declared_bases(loaded_registries, namespace):
+    """ Return the bases declared by the bloks for the namespace and for
+    the mixins which it inherits
+
+    :param loaded_registries: the loaded registries of the registry
+    :param namespace: the namespace of the model or of the mixin
+    :rtype: generator of the bases
+    """
+    for b in loaded_registries[namespace]['bases']:
+        yield b
+        for b_ns in b.__anyblok_bases__:
+            brn = b_ns.__registry_name__
+            if brn in loaded_registries['Mixin_names']:
+                yield from iter_declared_bases(loaded_registries, brn)
+
+
+def can_dispose_models():
+    """ Return True if the private API of SQLAlchemy used to dispose the
+    assembled Models is available, else the incremental reload assembles
+    all the Models again
+
+    :rtype: bool
+    """
+    return (_ModuleMarker is not None and
+            hasattr(_MultipleClassMarker, '_remove_item') and
+            hasattr(mapperlib, '_CONFIGURE_MUTEX') and
+            hasattr(mapperlib, '_mapper_registry'))
+
+
+def remove_from_class_registry(class_registry, cls_):
+    """ Remove the class from the string lookup of the declarative base,
+    used by the relationships and the join conditions
+
+    :param class_registry: class registry of the declarative base
+    :param ``cls_``: the class to remove
+    """
+    if class_registry.get(cls_.__name__) is cls_:
+        del class_registry[cls_.__name__]
+
+    todo = [class_registry.get('_sa_module_registry')]
+    while todo:
+        module = todo.pop()
+        if module is None:
+            continue
+
+        for name, value in list(module.contents.items()):
+            if isinstance(value, _ModuleMarker):
+                todo.append(value)
+            elif name == cls_.__name__:
+                for ref in [ref for ref in value.contents if ref() is cls_]:
+                    value._remove_item(ref)
+
+
 def autodoc_fields(declaration_cls, model_cls):
     """Produces autodocumentation table for the fields.
 
@@ -148,12 +232,27 @@ class Model:
         plugins = get_model_plugins(registry)
 
         def call_plugins(method, *args, **kwargs):
-            """call the method on each plugin"""
+            """call the method on each plugin and return the results"""
+            return [getattr(plugin, method)(*args, **kwargs)
+                    for plugin in plugins
+                    if hasattr(plugin, method)]
+
+        def call_plugins_with_report(method, *args, **kwargs):
+            """call the method on each plugin, record the duration of each
+            call in the loading report, and return the results"""
+            res = []
             for plugin in plugins:
                 if hasattr(plugin, method):
-                    getattr(plugin, method)(*args, **kwargs)
+                    name = '%s.%s' % (plugin.__class__.__name__, method)
+                    with registry.loading_report.phase('call_plugins', name):
+                        res.append(getattr(plugin, method)(*args, **kwargs))
+
+            return res
 
-        registry.call_plugins = call_plugins
+        if registry.loading_report.enabled:
+            registry.call_plugins = call_plugins_with_report
+        else:
+            registry.call_plugins = call_plugins
 
     @classmethod
     def register(self, parent, name, cls_, **kwargs):
@@ -266,11 +365,30 @@ class Model:
         :rtype: new base
         """
         new_type_properties = {}
-        for attr in dir(base):
-            method = getattr(base, attr)
-            registry.call_plugins(
-                'transform_base_attribute',
-                attr, method, namespace, base, properties, new_type_properties)
+        snapshot = registry.snapshot
+        attributes = None
+        if snapshot is not None and snapshot.is_valid:
+            attributes = snapshot.get_base_attributes(base)
+
+        if attributes is None:
+            # unknown base, all the attributes must be given to the plugins
+            used_attributes = []
+            for attr in dir(base):
+                method = getattr(base, attr)
+                if any(registry.call_plugins(
+                    'transform_base_attribute', attr, method, namespace,
+                    base, properties, new_type_properties
+                )):
+                    used_attributes.append(attr)
+
+            if snapshot is not None:
+                snapshot.set_base_attributes(base, used_attributes)
+        else:
+            for attr in attributes:
+                method = getattr(base, attr)
+                registry.call_plugins(
+                    'transform_base_attribute', attr, method, namespace,
+                    base, properties, new_type_properties)
 
         registry.call_plugins(
             'transform_base', namespace, base, properties, new_type_properties)
@@ -505,13 +623,314 @@ class Model:
 
         return bases, properties
 
+    @classmethod
+    def get_event_listeners(cls, registry):
+        """ Return the Models which listen an event of another Model
+
+        Only the methods declared on the bases of the Model and of its
+        mixins are read, the Model are not assembled
+
+        :param registry: the current registry
+        :rtype: dict {listened model: set of the listener models}
+        """
+        listeners = {}
+        for namespace in registry.loaded_registries['Model_names']:
+            for b in iter_declared_bases(registry.loaded_registries,
+                                         namespace):
+                for method in b.__dict__.values():
+                    model = get_listened_model(method)
+                    if model:
+                        listeners.setdefault(model, set()).add(namespace)
+
+        return listeners
+
+    @classmethod
+    def get_references(cls, registry, namespace):
+        """ Return the Models linked with the namespace
+
+        * the inherited Models
+        * the Models used by the fields (relationships, foreign keys)
+        * the Models which inherit the namespace (polymorphism)
+        * the Models on the same table
+
+        :param registry: the current registry
+        :param namespace: the namespace of the model
+        :rtype: set of namespaces
+        """
+        first_step = registry.loaded_namespaces_first_step
+        properties = first_step[namespace]
+        tablename = properties.get('__tablename__')
+        references = set(properties['__depends__'])
+        for field in properties.values():
+            if not isinstance(field, Field):
+                continue
+
+            for value in field.__dict__.values():
+                model_name = getattr(value, 'model_name', None)
+                if isinstance(model_name, str):
+                    references.add(model_name)
+
+        for other, other_properties in first_step.items():
+            if namespace in other_properties['__depends__']:
+                references.add(other)
+            elif tablename and (
+                    other_properties.get('__tablename__') == tablename):
+                references.add(other)
+
+        references.discard(namespace)
+        return references & set(registry.loaded_registries['Model_names'])
+
+    @classmethod
+    def get_lazy_dependencies(cls, registry, namespace):
+        """ Return the Models to assemble with the namespace
+
+        * the Models linked with the namespace, see ``get_references``
+        * the children namespaces
+        * the Models which listen the events of the namespace
+
+        :param registry: the current registry
+        :param namespace: the namespace of the model
+        :rtype: set of namespaces
+        """
+        dependencies = cls.get_references(registry, namespace)
+        dependencies.update(
+            other for other in registry.loaded_namespaces_first_step
+            if other.startswith(namespace + '.'))
+        dependencies.update(
+            registry.lazy_event_listeners.get(namespace, set()))
+        dependencies.discard(namespace)
+        return dependencies & set(registry.loaded_registries['Model_names'])
+
+    @classmethod
+    def load_lazy_namespace(cls, registry, namespace):
+        """ Assemble the namespace and all its dependencies, called by
+        the registry the first time the namespace is required
+
+        :param registry: the current registry
+        :param namespace: the namespace of the model
+        """
+        namespaces = set()
+        todo = [namespace]
+        while todo:
+            ns = todo.pop()
+            if ns in namespaces or ns in registry.loaded_namespaces:
+                continue
+
+            namespaces.add(ns)
+            todo.extend(cls.get_lazy_dependencies(registry, ns))
+
+        # keep the order of the eager assembly
+        for ns in registry.loaded_registries['Model_names']:
+            if ns in namespaces and ns in registry.lazy_namespaces:
+                del registry.lazy_namespaces[ns]
+                cls.load_namespace_second_step(registry, ns)
+
+    @classmethod
+    def get_changed_namespaces(cls, registry, previous_registries):
+        """ Return the Models whose declarations changed since the
+        previous loading of the registry: new Models, new bases on the
+        Model or on its mixins, new properties
+
+        :param registry: the current registry
+        :param previous_registries: the loaded registries of the previous
+            loading
+        :rtype: set of namespaces
+        """
+        def get_bases(loaded_registries, namespace):
+            # the same base can be found twice, only the order matters
+            return list(OrderedDict.fromkeys(
+                iter_declared_bases(loaded_registries, namespace)))
+
+        changed = set()
+        for namespace in registry.loaded_registries['Model_names']:
+            if namespace not in previous_registries:
+                changed.add(namespace)
+            elif (registry.loaded_registries[namespace]['properties'] !=
+                    previous_registries[namespace]['properties']):
+                changed.add(namespace)
+            elif (get_bases(registry.loaded_registries, namespace) !=
+                    get_bases(previous_registries, namespace)):
+                changed.add(namespace)
+
+        return changed
+
+    @classmethod
+    def get_namespaces_to_reassemble(cls, registry, namespaces):
+        """ Return the Models to assemble again when the namespaces
+        changed
+
+        The mappers of the Models linked by a relationship, an inheritance
+        or a table reference each other, so the links are followed in both
+        directions. The children namespaces of a reassembled Model are
+        reassembled too, because they are attributes of the Model
+
+        :param registry: the current registry
+        :param namespaces: the changed namespaces
+        :rtype: set of namespaces
+        """
+        model_names = set(registry.loaded_registries['Model_names'])
+        links = {namespace: set() for namespace in model_names}
+        for namespace in model_names:
+            for other in cls.get_references(registry, namespace):
+                links[namespace].add(other)
+                links[other].add(namespace)
+
+            links[namespace].update(
+                other for other in model_names
+                if other.startswith(namespace + '.'))
+
+        result = set()
+        todo = list(namespaces)
+        while todo:
+            namespace = todo.pop()
+            if namespace not in result:
+                result.add(namespace)
+                todo.extend(links[namespace])
+
+        return result
+
+    @classmethod
+    def can_keep_models(cls, registry, previous_load, namespaces):
+        """ Return True if the Models which are not in namespaces can be
+        kept from the previous loading
+
+        The Models are not kept if the Core classes changed, if a Model
+        was removed, or if a Model to reassemble is a view, is built by
+        another factory or has a Many2Many (the join table and its
+        mapping are shared with the other Model)
+
+        :param registry: the current registry
+        :param previous_load: state of the previous loading
+        :param namespaces: the Models to reassemble
+        :rtype: bool
+        """
+        previous_registries = previous_load['loaded_registries']
+        if registry.lazy_assembly:
+            return False
+
+        if registry.loaded_cores != previous_load['loaded_cores']:
+            return False
+
+        if registry.removed != previous_load['removed']:
+            return False
+
+        if not (set(previous_registries['Model_names']) <=
+                set(registry.loaded_registries['Model_names'])):
+            return False
+
+        for namespace in namespaces:
+            for loaded_registries in (registry.loaded_registries,
+                                      previous_registries):
+                properties = loaded_registries.get(
+                    namespace, {}).get('properties', {})
+                if properties.get(
+                        '__model_factory__', ModelFactory) is not ModelFactory:
+                    return False
+
+            fields = registry.loaded_namespaces_first_step[namespace].values()
+            if any(isinstance(field, Many2Many) for field in fields):
+                return False
+
+        return True
+
+    @classmethod
+    def dispose_model(cls, registry, namespace, model):
+        """ Remove the mapper, the table and the class of the assembled
+        Model from the declarative base and from the registry
+
+        :param registry: the current registry
+        :param namespace: the namespace of the model
+        :param model: the assembled Model
+        """
+        registry.remove_from_registry(namespace)
+        getattr(registry, 'caches', {}).pop(namespace, None)
+        mapper = model.__dict__.get('__mapper__')
+        if mapper is None:
+            return
+
+        metadata = registry.declarativebase.metadata
+        table = mapper.local_table
+        if metadata.tables.get(table.key) is table:
+            metadata.remove(table)
+
+        remove_from_class_registry(
+            registry.declarativebase._decl_class_registry, model)
+        with mapperlib._CONFIGURE_MUTEX:
+            mapperlib._mapper_registry.pop(mapper, None)
+            mapper.dispose()
+
+    @classmethod
+    def keep_unchanged_models(cls, registry, previous_load):
+        """ Keep the assembled Models of the previous loading which do
+        not depend on the changed bloks, and dispose the others to
+        assemble them again. If the Models can not be kept, all the Models
+        are assembled again
+
+        :param registry: the current registry
+        :param previous_load: state of the previous loading
+        """
+        previous_models = previous_load['loaded_namespaces']
+        namespaces = cls.get_namespaces_to_reassemble(
+            registry, cls.get_changed_namespaces(
+                registry, previous_load['loaded_registries']))
+        if not can_dispose_models():
+            logger.warning('The Models can not be disposed with this '
+                           'version of SQLAlchemy, all the Models are '
+                           'assembled again')
+            registry.clean_model(previous_models)
+            return
+
+        if not cls.can_keep_models(registry, previous_load, namespaces):
+            logger.info('All the Models are assembled again')
+            registry.clean_model(previous_models)
+            return
+
+        models = tuple(previous_models[namespace] for namespace in namespaces
+                       if namespace in previous_models)
+        if registry.Session:
+            registry.flush()
+            for obj in list(registry.session):
+                if isinstance(obj, models):
+                    registry.expunge(obj)
+
+        registry.declarativebase = previous_load['declarativebase']
+        registry.loaded_views = previous_load['loaded_views']
+        first_step = previous_load['loaded_namespaces_first_step']
+        for namespace, model in previous_models.items():
+            if namespace in namespaces:
+                cls.dispose_model(registry, namespace, model)
+            else:
+                # the assembly adds the generated fields in the first step
+                registry.loaded_namespaces[namespace] = model
+                registry.loaded_namespaces_first_step[namespace] = (
+                    first_step[namespace])
+
+        registry.expire_attributes.update(
+            (namespace, attributes) for namespace, attributes in
+            previous_load['expire_attributes'].items()
+            if namespace not in namespaces)
+        registry._sqlalchemy_known_events.extend(
+            known_event for known_event in
+            previous_load['sqlalchemy_known_events']
+            if known_event[1] not in namespaces)
+        logger.info('%d/%d Models are assembled again', len(namespaces),
+                    len(set(registry.loaded_registries['Model_names'])))
+
     @classmethod
     def assemble_callback(cls, registry):
         """ Assemble callback is called to assemble all the Model
         from the installed bloks
 
+        In lazy assembly mode, only the first step is done, the Models
+        are assembled the first time the registry gives them
+
+        In incremental reload, the Models which do not depend on the
+        changed bloks are kept from the previous loading
+
         :param registry: registry to update
         """
+        previous_load = registry.previous_load
+        registry.previous_load = None
         registry.loaded_namespaces_first_step = {}
         registry.loaded_views = {}
 
@@ -519,6 +938,16 @@ class Model:
         for namespace in registry.loaded_registries['Model_names']:
             cls.load_namespace_first_step(registry, namespace)
 
+        if previous_load is not None:
+            cls.keep_unchanged_models(registry, previous_load)
+
+        if registry.lazy_assembly:
+            registry.lazy_event_listeners = cls.get_event_listeners(registry)
+            for namespace in registry.loaded_registries['Model_names']:
+                registry.lazy_namespaces[namespace] = cls
+
+            return
+
         # create the namespace with all the information come from first
         # step
         for namespace in registry.loaded_registries['Model_names']:
@@ -536,8 +965,9 @@ class Model:
 
         :param registry: registry to update
         """
-        for Model in registry.loaded_namespaces.values():
-            Model.initialize_model()
+        for namespace, Model in registry.loaded_namespaces.items():
+            with registry.loading_report.phase('initialize_model', namespace):
+                Model.initialize_model()
 
         Blok = registry.System.Blok
         if not registry.withoutautomigration:
@@ -11,6 +11,8 @@ from anyblok.common import apply_cache
 
 class CachePlugin(ModelPluginBase):
 
+    snapshot_compatible = True
+
     def __init__(self, registry):
         if not hasattr(registry, 'caches'):
             registry.caches = {}
@@ -29,7 +31,9 @@ class CachePlugin(ModelPluginBase):
         :param base: One of the base of the model
         :param transformation_properties: the properties of the model
         :param new_type_properties: param to add in a new base if need
+        :rtype: True if the attribute is a cached method
         """
-        new_type_properties.update(apply_cache(
-            attr, method, self.registry, namespace, base,
-            transformation_properties))
+        properties = apply_cache(attr, method, self.registry, namespace, base,
+                                 transformation_properties)
+        new_type_properties.update(properties)
+        return bool(properties)
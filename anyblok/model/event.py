@@ -15,6 +15,8 @@ class ORMEventException(Exception):
 
 class EventPlugin(ModelPluginBase):
 
+    snapshot_compatible = True
+
     def __init__(self, registry):
         if not hasattr(registry, 'events'):
             registry.events = {}
@@ -33,6 +35,7 @@ class EventPlugin(ModelPluginBase):
         :param base: One of the base of the model
         :param transformation_properties: the properties of the model
         :param new_type_properties: param to add in a new base if need
+        :rtype: True if the attribute is an event listener
         """
         if not hasattr(method, 'is_an_event_listener'):
             return
@@ -50,9 +53,13 @@ class EventPlugin(ModelPluginBase):
             if val not in ev:
                 ev.append(val)
 
+            return True
+
 
 class SQLAlchemyEventPlugin(ModelPluginBase):
 
+    snapshot_compatible = True
+
     def transform_base_attribute(self, attr, method, namespace, base,
                                  transformation_properties,
                                  new_type_properties):
@@ -64,6 +71,7 @@ class SQLAlchemyEventPlugin(ModelPluginBase):
         :param base: One of the base of the model
         :param transformation_properties: the properties of the model
         :param new_type_properties: param to add in a new base if need
+        :rtype: True if the attribute is an sqlalchemy event listener
         """
         if not hasattr(method, 'is_an_sqlalchemy_event_listener'):
             return
@@ -72,6 +80,7 @@ class SQLAlchemyEventPlugin(ModelPluginBase):
                 (method.sqlalchemy_listener,
                  namespace,
                  ModelAttribute(namespace, attr)))
+            return True
 
 
 class AutoSQLAlchemyORMEventPlugin(ModelPluginBase):
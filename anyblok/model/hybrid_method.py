@@ -11,6 +11,8 @@ from .plugins import ModelPluginBase
 
 class HybridMethodPlugin(ModelPluginBase):
 
+    snapshot_compatible = True
+
     def initialisation_tranformation_properties(self, properties,
                                                 transformation_properties):
         """ Initialise the transform properties: hybrid_method
@@ -33,6 +35,7 @@ class HybridMethodPlugin(ModelPluginBase):
         :param base: One of the base of the model
         :param transformation_properties: the properties of the model
         :param new_type_properties: param to add in a new base if need
+        :rtype: True if the attribute is an hybrid method
         """
         if not hasattr(method, 'is_an_hybrid_method'):
             return
@@ -40,6 +43,8 @@ class HybridMethodPlugin(ModelPluginBase):
             if attr not in transformation_properties['hybrid_method']:
                 transformation_properties['hybrid_method'].append(attr)
 
+            return True
+
     def insert_in_bases(self, new_base, namespace, properties,
                         transformation_properties):
         """ Create overload to define the write declaration of sqlalchemy
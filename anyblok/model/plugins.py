@@ -22,6 +22,11 @@ def get_model_plugins(registry):
 
 class ModelPluginBase:
 
+    # True if transform_base_attribute returns True for each attribute it
+    # uses, the registry snapshot is disabled if a plugin which defines
+    # transform_base_attribute does not declare it
+    snapshot_compatible = False
+
     def __init__(self, registry):
         self.registry = registry
 
@@ -55,6 +60,9 @@ class ModelPluginBase:
     #     :param base: One of the base of the model
     #     :param transformation_properties: the properties of the model
     #     :param new_type_properties: param to add in a new base if need
+    #     :rtype: True if the plugin used the attribute, the registry
+    #             snapshot only gives these attributes to the plugins which
+    #             declare ``snapshot_compatible``
     #     """
 
     # def transform_base(self, namespace, base,
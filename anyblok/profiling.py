@@ -0,0 +1,187 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2019 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import json
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from logging import getLogger
+from time import perf_counter
+from texttable import Texttable
+from .config import Configuration
+
+logger = getLogger(__name__)
+
+
+def loading_phase(phase, root=False):
+    """ Decorator to record the method of the registry as a phase of the
+    loading report::
+
+        @loading_phase('create_session_factory')
+        def create_session_factory(self):
+            ...
+
+    :param phase: name of the phase
+    :param root: if True, the phase starts the report
+    """
+    def wrapper(method):
+
+        @wraps(method)
+        def wrapped(self, *args, **kwargs):
+            with self.loading_report.phase(phase, root=root):
+                return method(self, *args, **kwargs)
+
+        return wrapped
+
+    return wrapper
+
+
+class RegistryLoadingReport:
+    """ Wall time and allocated memory of the phases of the loading of
+    the registry
+
+    The report is enabled by the configuration ``registry_load_report``
+    (``json`` or ``table``), it is emitted at the end of each loading, in
+    the file defined by ``registry_load_report_file`` or in the logger::
+
+        with registry.loading_report.phase('load_blok', 'anyblok-core'):
+            ...
+
+    The report is started by the root phase, ``load``, the phases called
+    outside the loading (the lazy assembly of a namespace for example)
+    are not recorded. The same phase with the same name is summed, the
+    rows of the report are sorted by duration. The durations of the phases
+    are inclusive: the duration of ``load`` contains the duration of all
+    the other phases.
+    """
+
+    def __init__(self, db_name, report_format=None, report_file=None):
+        self.db_name = db_name
+        self.format = report_format
+        self.file = report_file
+        self.enabled = report_format is not None
+        self.phases = OrderedDict()
+        self.depth = 0
+        self.tracemalloc_started = False
+        self.last_report = []
+
+    @classmethod
+    def get(cls, db_name):
+        """ Return the report defined by the configuration
+
+        :param db_name: name of the database of the registry
+        :rtype: RegistryLoadingReport instance
+        """
+        return cls(db_name,
+                   report_format=Configuration.get('registry_load_report'),
+                   report_file=Configuration.get('registry_load_report_file'))
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracemalloc_started = True
+
+    def stop(self):
+        if self.tracemalloc_started:
+            tracemalloc.stop()
+            self.tracemalloc_started = False
+
+        self.last_report = self.get_rows()
+        self.phases.clear()
+        self.emit()
+
+    @contextmanager
+    def phase(self, phase, name=None, root=False):
+        """ Record the wall time and the allocated memory of the phase
+
+        :param phase: name of the phase
+        :param name: name of the element of the phase (blok, plugin, ...)
+        :param root: if True, the report is started by this phase if it is
+            not already started, else the phase is recorded only in a
+            started report
+        """
+        if not self.enabled or not (self.depth or root):
+            yield
+            return
+
+        if not self.depth:
+            self.start()
+
+        self.depth += 1
+        memory = tracemalloc.get_traced_memory()[0]
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, name, perf_counter() - start,
+                     tracemalloc.get_traced_memory()[0] - memory)
+            self.depth -= 1
+            if not self.depth:
+                self.stop()
+
+    def add(self, phase, name, duration, memory):
+        """ Sum the duration and the memory of the phase
+
+        :param phase: name of the phase
+        :param name: name of the element of the phase
+        :param duration: wall time in seconds
+        :param memory: allocated memory in bytes
+        """
+        key = (phase, name)
+        if key not in self.phases:
+            self.phases[key] = {'phase': phase, 'name': name, 'count': 0,
+                                'duration': 0, 'memory': 0}
+
+        entry = self.phases[key]
+        entry['count'] += 1
+        entry['duration'] += duration
+        entry['memory'] += memory
+
+    def get_rows(self):
+        """ Return the phases sorted by duration
+
+        :rtype: list of dict
+        """
+        return sorted((dict(x) for x in self.phases.values()),
+                      key=lambda x: x['duration'], reverse=True)
+
+    def to_json(self):
+        """ Return the last report in JSON
+
+        :rtype: str
+        """
+        return json.dumps({'db_name': self.db_name,
+                           'phases': self.last_report}, indent=2)
+
+    def to_table(self):
+        """ Return the last report as a table
+
+        :rtype: str
+        """
+        table = Texttable(max_width=0)
+        table.set_cols_dtype(['t', 't', 'i', 'f', 'i'])
+        table.set_precision(4)
+        rows = [['Phase', 'Name', 'Count', 'Duration (s)', 'Memory (B)']]
+        rows.extend([x['phase'], x['name'] or '', x['count'],
+                     x['duration'], x['memory']] for x in self.last_report)
+        table.add_rows(rows)
+        return table.draw()
+
+    def emit(self):
+        """ Write the last report in the file or in the logger """
+        if self.format == 'json':
+            report = self.to_json()
+        else:
+            report = self.to_table()
+
+        if self.file:
+            with open(self.file, 'w') as fp:
+                fp.write(report)
+        else:
+            logger.info('Loading report of the registry %r\n%s',
+                        self.db_name, report)
@@ -8,15 +8,20 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 from logging import getLogger
+from hashlib import sha1
 from sqlalchemy import create_engine, event, MetaData
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import sessionmaker, scoped_session, configure_mappers
 from sqlalchemy.exc import (ProgrammingError, OperationalError,
                             InvalidRequestError)
 from sqlalchemy_utils.functions import database_exists
 from .config import Configuration, get_url
 from .migration import Migration
 from .blok import BlokManager
+from .snapshot import RegistrySnapshot
+from .cache_invalidation import CacheInvalidation
+from .cache_backend import CacheBackend
+from .profiling import RegistryLoadingReport, loading_phase
 from .environment import EnvironmentManager
 from .authorization.query import QUERY_WITH_NO_RESULTS, PostFilteredQuery
 from anyblok.common import anyblok_column_prefix, naming_convention
@@ -24,9 +29,11 @@ from pkg_resources import iter_entry_points
 from .version import parse_version
 from .logging import log
 import sqlalchemy.interfaces
+import gc
 from sqlalchemy.orm.session import close_all_sessions
 
 logger = getLogger(__name__)
+SCHEMA_FINGERPRINT_KEY = 'anyblok.schema.fingerprint'
 
 
 class RegistryManagerException(Exception):
@@ -48,6 +55,22 @@ def return_list(entry):
     return entry
 
 
+class RegistryNamespace(type):
+    """ Type of the namespaces of the registry which are not a Model, in
+    lazy assembly mode the Models of the namespace are assembled the first
+    time they are required as an attribute
+    """
+
+    def __getattr__(cls, attribute):
+        registry = cls.__dict__.get('__registry__')
+        if registry is not None and registry.load_lazy_attribute(
+                cls.__dict__['__registry_namespace__'], attribute):
+            return getattr(cls, attribute)
+
+        raise AttributeError("type object %r has no attribute %r" % (
+            cls.__name__, attribute))
+
+
 class DontBeSilly(sqlalchemy.interfaces.PoolListener):
     def connect(self, dbapi_con, connection_record):
         cur = dbapi_con.cursor()
@@ -131,11 +154,17 @@ class RegistryManager:
         """
         EnvironmentManager.set('db_name', db_name)
         if db_name in cls.registries:
+            registry = cls.registries[db_name]
             if loadwithoutmigration and log_repeat:
                 logger.warning(
                     "Ignoring loadwithoutmigration=True for database %r "
                     "because its registry is already loaded", db_name)
-            return cls.registries[db_name]
+            if kwargs.get('readonly_registry') and not registry.readonly:
+                logger.warning(
+                    "Ignoring readonly_registry=True for database %r "
+                    "because its registry is already loaded without the "
+                    "readonly mode", db_name)
+            return registry
 
         _Registry = Configuration.get('Registry', Registry)
         logger.info("Loading registry for database %r with class %r",
@@ -159,6 +188,39 @@ class RegistryManager:
             registry.blok_list_is_loaded = False
             registry.reload()
 
+    @classmethod
+    def before_fork(cls, gc_freeze=True):
+        """ Prepare the loaded registries to be inherited by forked
+        processes, called by the master process just before the fork
+        of the workers::
+
+            registry = RegistryManager.get('my database')
+            RegistryManager.before_fork()
+            if os.fork() == 0:
+                RegistryManager.after_fork()
+                registry = RegistryManager.get('my database')
+
+        :param gc_freeze: if True, and if the python version allows it,
+            the objects are frozen by the garbage collector, the
+            collections in the workers do not write in the memory pages
+            shared with the master process
+        """
+        for registry in cls.registries.values():
+            registry.before_fork()
+
+        if gc_freeze and hasattr(gc, 'freeze'):
+            gc.collect()
+            gc.freeze()
+
+    @classmethod
+    def after_fork(cls):
+        """ Reinit the inherited registries, called by the forked
+        process just after the fork
+        """
+        EnvironmentManager.reset()
+        for registry in cls.registries.values():
+            registry.after_fork()
+
     @classmethod
     def declare_core(cls, core):
         """ Add new core in the declared cores
@@ -428,18 +490,25 @@ class Registry:
         self.loadwithoutmigration = loadwithoutmigration
         self.unittest = unittest
         self.additional_setting = kwargs
+        self.loading_report = RegistryLoadingReport.get(db_name)
         self.init_engine(db_name=db_name)
         self.init_bind()
         self.registry_base = type("RegistryBase", tuple(), {
             'registry': self,
             'Env': EnvironmentManager})
         self.withoutautomigration = Configuration.get('withoutautomigration')
+        self.readonly = self.is_readonly()
         self.ini_var()
         self.Session = None
         self.nb_query_bases = self.nb_session_bases = 0
         self.blok_list_is_loaded = False
+        self.cache_invalidation = CacheInvalidation.get(self)
+        self.cache_backend = CacheBackend.get(self)
+        self.cache_backend.start()
         self.pre_assemble_entries()
         self.load()
+        if self.cache_invalidation is not None:
+            self.cache_invalidation.start()
 
     def init_bind(self):
         """Initialize the bind"""
@@ -499,7 +568,15 @@ class Registry:
         EnvironmentManager.set('_precommit_hook', [])
         EnvironmentManager.set('_postcommit_hook', [])
         self._sqlalchemy_known_events = []
+        self.nb_listened_sqlalchemy_known_events = 0
         self.expire_attributes = {}
+        self.fields_metadata_computed = False
+        self.snapshot = None
+        self.lazy_assembly = False
+        self.lazy_namespaces = {}
+        self.lazy_event_listeners = {}
+        self.lazy_assembly_paused = False
+        self.previous_load = None
 
     @classmethod
     def db_exists(cls, db_name=None):
@@ -510,7 +587,11 @@ class Registry:
         return database_exists(url)
 
     def listen_sqlalchemy_known_event(self):
-        for e, namespace, method in self._sqlalchemy_known_events:
+        # in lazy assembly mode, the events are added by each assembly
+        start = self.nb_listened_sqlalchemy_known_events
+        self.nb_listened_sqlalchemy_known_events = len(
+            self._sqlalchemy_known_events)
+        for e, namespace, method in self._sqlalchemy_known_events[start:]:
             if hasattr(method, 'get_attribute'):
                 method = method.get_attribute(self)
 
@@ -535,6 +616,9 @@ class Registry:
         :rtype: namespace cls
         :exception: RegistryManagerException
         """
+        if namespace in self.lazy_namespaces:
+            self.load_lazy_namespace(namespace)
+
         if namespace not in self.loaded_namespaces:
             raise RegistryManagerException(
                 "No namespace %r loaded" % namespace)
@@ -542,8 +626,107 @@ class Registry:
         return self.loaded_namespaces[namespace]
 
     def has(self, namespace):
+        if namespace in self.lazy_namespaces:
+            return True
+
         return True if namespace in self.loaded_namespaces else False
 
+    def is_readonly(self):
+        """ Return True if the registry must never change the schema and
+        the system metadata: the registry is loaded from the installed
+        bloks, without migration, without initialisation of the entries
+        and without commit
+
+        :rtype: bool
+        """
+        return bool(self.additional_setting.get(
+            'readonly_registry', Configuration.get('readonly_registry', False)))
+
+    def is_lazy_assembly(self):
+        """ Return True if the namespaces must be assembled the first time
+        they are required, only without migration, because the migration
+        and the initialisation need all the namespaces
+
+        :rtype: bool
+        """
+        if not (self.loadwithoutmigration or self.readonly):
+            return False
+
+        return bool(self.additional_setting.get(
+            'lazy_assembly', Configuration.get('lazy_assembly', False)))
+
+    def is_incremental_reload(self):
+        """ Return True if the reloads of the registry during the
+        installation and the update of the bloks must be incremental
+
+        :rtype: bool
+        """
+        if self.lazy_assembly:
+            return False
+
+        return bool(self.additional_setting.get(
+            'incremental_reload',
+            Configuration.get('incremental_reload', False)))
+
+    def get_cache_checkpoint_interval(self):
+        """ Return the minimal number of seconds between two checks of the
+        cache invalidations at the beginning of the transactions
+
+        :rtype: float or None if the invalidations are not checked
+        """
+        interval = self.additional_setting.get(
+            'cache_checkpoint_interval',
+            Configuration.get('cache_checkpoint_interval'))
+        if interval is None:
+            return None
+
+        return float(interval)
+
+    def is_single_pass_install(self):
+        """ Return True if all the bloks to install must be installed by
+        one loading of the registry
+
+        :rtype: bool
+        """
+        return bool(self.additional_setting.get(
+            'single_pass_install',
+            Configuration.get('single_pass_install', False)))
+
+    def load_lazy_namespace(self, namespace):
+        """ Assemble a namespace in lazy assembly mode
+
+        :param namespace: namespace to assemble
+        """
+        logger.debug('Lazy assembly of %r' % namespace)
+        self.lazy_namespaces[namespace].load_lazy_namespace(self, namespace)
+        self.listen_sqlalchemy_known_event()
+        # the index of the fields is computed again with the new models
+        Model = self.loaded_namespaces.get('Model.System.Model')
+        if Model is not None:
+            Model.get_fields_metadata.cache_clear()
+
+    def load_lazy_attribute(self, namespace, attribute):
+        """ Assemble in lazy assembly mode the Models given by the
+        attribute of a namespace
+
+        :param namespace: namespace of the parent, ``Model`` for the
+                          registry
+        :param attribute: name of the attribute
+        :rtype: bool, True if Models are assembled
+        """
+        lazy_namespaces = self.__dict__.get('lazy_namespaces')
+        if not lazy_namespaces or self.__dict__['lazy_assembly_paused']:
+            return False
+
+        prefix = namespace + '.' + attribute
+        namespaces = [x for x in lazy_namespaces
+                      if x == prefix or x.startswith(prefix + '.')]
+        for x in namespaces:
+            if x in lazy_namespaces:
+                self.load_lazy_namespace(x)
+
+        return bool(namespaces)
+
     def get_bloks_by_states(self, *states):
         """ Return the bloks in these states
 
@@ -569,6 +752,7 @@ class Registry:
 
         return []
 
+    @loading_phase('get_bloks_to_load')
     def get_bloks_to_load(self):
         """ Return the bloks to load by the registry
 
@@ -581,6 +765,10 @@ class Registry:
 
         :rtype: list of blok's name
         """
+        if self.readonly:
+            # the installation is done by a registry which is not readonly
+            return []
+
         toinstall = self.get_bloks_by_states('toinstall')
         for blok in BlokManager.auto_install:
             if blok not in (toinstall + loaded):
@@ -693,9 +881,9 @@ class Registry:
                 self.loaded_registries[key] = {'properties': {}, 'bases': []}
 
             self.loaded_registries[key]['properties'].update(v['properties'])
-            old_bases = [] + self.loaded_registries[key]['bases']
-            self.loaded_registries[key]['bases'] = v['bases']
-            self.loaded_registries[key]['bases'] += old_bases
+            # copy the bases, the list of the blok must not be modified
+            old_bases = self.loaded_registries[key]['bases']
+            self.loaded_registries[key]['bases'] = v['bases'] + old_bases
             self.loaded_registries[entry + '_names'].append(key)
 
     def load_core(self, blok, core):
@@ -737,6 +925,27 @@ class Registry:
             elif toinstall or blok in toload:
                 self.load_blok(blok, toinstall, toload)
 
+    def load_bloks_to_install(self, toinstall, toload):
+        """ Load the bloks installed by this loading of the registry
+
+        By default only the first blok is installed, the next bloks are
+        installed by the reloads of the registry. In single pass install
+        mode, all the bloks are loaded in the order of their dependencies,
+        so the models are assembled and the schema is migrated only once,
+        then the bloks are installed in this order
+
+        :param toinstall: list of the bloks to install
+        :param toload: list of the bloks already installed
+        :rtype: list of the loaded bloks to install
+        """
+        if not self.is_single_pass_install():
+            toinstall = toinstall[:1]
+
+        for blok in toinstall:
+            self.load_blok(blok, True, toload)
+
+        return toinstall
+
     def load_blok(self, blok, toinstall, toload):
         """ load on blok, load all the core and all the entry for one blok
 
@@ -749,18 +958,20 @@ class Registry:
         if blok not in BlokManager.bloks:
             return False
 
-        b = BlokManager.bloks[blok](self)
-        self.load_bloks(b.required + b.conditional, toinstall, toload)
-        self.load_bloks(b.optional, toinstall, toload, required=False)
+        with self.loading_report.phase('load_blok', blok):
+            b = BlokManager.bloks[blok](self)
+            self.load_bloks(b.required + b.conditional, toinstall, toload)
+            self.load_bloks(b.optional, toinstall, toload, required=False)
 
-        for core in RegistryManager.declared_cores:
-            self.load_core(blok, core)
+            for core in RegistryManager.declared_cores:
+                self.load_core(blok, core)
 
-        for entry in RegistryManager.declared_entries:
-            self.load_entry(blok, entry)
+            for entry in RegistryManager.declared_entries:
+                self.load_entry(blok, entry)
+
+            self.load_properties(blok)
+            self.load_removed(blok)
 
-        self.load_properties(blok)
-        self.load_removed(blok)
         self.loaded_bloks[blok] = b
         self.ordered_loaded_bloks.append(blok)
         logger.debug("Blok %r loaded" % blok)
@@ -823,11 +1034,13 @@ class Registry:
                 if conn:
                     conn.close()
 
-    def get_namespace(self, parent, child):
+    def get_namespace(self, parent, child, namespace=None):
         if hasattr(parent, child) and getattr(parent, child):
             return getattr(parent, child)
 
-        tmpns = type(child, tuple(), {'children_namespaces': {}})
+        tmpns = RegistryNamespace(child, tuple(), {
+            'children_namespaces': {}, '__registry__': self,
+            '__registry_namespace__': namespace})
         if hasattr(parent, 'children_namespaces'):
             parent.children_namespaces[child] = tmpns
 
@@ -850,23 +1063,51 @@ class Registry:
 
         setattr(parent, child, base)
 
+    def remove_from_registry(self, namespace):
+        """ Remove the class of the namespace from the attributes of the
+        registry
+
+        :param namespace: tree path of the attribute
+        """
+        parent = self
+        names = namespace.split('.')[1:]
+        for name in names[:-1]:
+            parent = parent.__dict__.get(name)
+            if parent is None:
+                return
+
+        if names[-1] in parent.__dict__:
+            delattr(parent, names[-1])
+
+        if hasattr(parent, 'children_namespaces'):
+            parent.children_namespaces.pop(names[-1], None)
+
     def add_in_registry(self, namespace, base):
         """ Add a class as an attribute of the registry
 
         :param namespace: tree path of the attribute
         :param base: class to add
         """
-        namespace = namespace.split('.')[1:]
+        namespace = namespace.split('.')
 
-        def update_namespaces(parent, namespaces):
+        def update_namespaces(parent, path, namespaces):
             if len(namespaces) == 1:
                 self.final_namespace(parent, namespaces[0], base)
             else:
-                new_parent = self.get_namespace(parent, namespaces[0])
-                update_namespaces(new_parent, namespaces[1:])
-
-        update_namespaces(self, namespace)
+                path = path + '.' + namespaces[0]
+                new_parent = self.get_namespace(parent, namespaces[0],
+                                                namespace=path)
+                update_namespaces(new_parent, path, namespaces[1:])
+
+        # the attributes of the registry are read, they must not be
+        # assembled by the lazy assembly
+        self.lazy_assembly_paused = True
+        try:
+            update_namespaces(self, namespace[0], namespace[1:])
+        finally:
+            self.lazy_assembly_paused = False
 
+    @loading_phase('create_session_factory')
     def create_session_factory(self):
         """Create the SQLA Session factory
 
@@ -875,7 +1116,7 @@ class Registry:
         if self.Session is None or self.must_recreate_session_factory():
             bind = self.bind
             if self.Session:
-                if not self.withoutautomigration:
+                if not (self.withoutautomigration or self.readonly):
                     # this is the only case to use commit in the construction
                     # of the registry
                     self.commit()
@@ -904,6 +1145,83 @@ class Registry:
         else:
             self.flush()
 
+    def get_warm_up_models(self):
+        """ Return the models to warm up at the end of the load
+
+        :rtype: list of the namespaces, None if there is no warm up
+        """
+        models = self.additional_setting.get(
+            'registry_warm_up_models',
+            Configuration.get('registry_warm_up_models'))
+        if models:
+            return models
+
+        if self.additional_setting.get(
+                'registry_warm_up', Configuration.get('registry_warm_up')):
+            return list(self.loaded_namespaces.keys())
+
+        return None
+
+    def auto_warm_up(self):
+        """ Warm up the models defined by the configuration, if any """
+        models = self.get_warm_up_models()
+        if models is not None:
+            self.warm_up(models)
+
+    @log(logger, level='debug')
+    def warm_up(self, models=None):
+        """ Configure the mappers and fill the caches of the metadata of
+        the models, so the first requests do not pay for them::
+
+            registry.warm_up(['Model.System.Blok'])
+
+        :param models: namespaces of the models, all the models by default
+        """
+        configure_mappers()
+        if models is None:
+            models = list(self.loaded_namespaces.keys())
+
+        self.System.Model.get_fields_metadata()
+        for model in models:
+            try:
+                Model = self.get(model)
+                if not Model.is_sql:
+                    continue
+
+                Model.get_primary_keys()
+                Model.fields_description()
+                Model.get_hybrid_property_columns()
+                # same arguments as the deletion of an instance
+                fields = self.loaded_namespaces_first_step[model].keys()
+                Model.find_remote_attribute_to_expire(*fields)
+            except Exception:
+                logger.exception('The warm up of the model %r failed', model)
+
+    def listen_cache_checkpoint(self):
+        """ Check the cache invalidations at the beginning of each
+        transaction, if the interval of the checkpoint is defined. The
+        event is added once the registry is loaded, the table of the
+        cache must exist
+        """
+        interval = self.get_cache_checkpoint_interval()
+        if interval is None:
+            return
+
+        Session = self.Session.session_factory.class_
+        if not event.contains(Session, 'after_begin', self.cache_checkpoint):
+            event.listen(Session, 'after_begin', self.cache_checkpoint)
+
+    def cache_checkpoint(self, session, transaction, connection):
+        """ after_begin event of the session, check the cache invalidations
+        only for the main transaction, not for the savepoints
+        """
+        if transaction.parent is not None:
+            return
+
+        with session.no_autoflush:
+            self.System.Cache.checkpoint(
+                interval=self.get_cache_checkpoint_interval())
+
     def must_recreate_session_factory(self):
         """Check if the SQLA Session Factory must be destroy and recreate
 
@@ -920,6 +1238,7 @@ class Registry:
         return False
 
     @log(logger, level='debug')
+    @loading_phase('load', root=True)
     def load(self):
         """ Load all the namespaces of the registry
 
@@ -927,12 +1246,17 @@ class Registry:
         Update Blok, Model, Column rows
         """
         mustreload = False
-        blok2install = None
+        bloks2install = []
         try:
             self.declarativebase = declarative_base(
                 metadata=MetaData(naming_convention=naming_convention),
                 class_registry=dict(registry=self))
             toload = self.get_bloks_to_load()
+            if self.readonly and not toload:
+                raise RegistryManagerException(
+                    "No installed blok to load the readonly registry of "
+                    "the database %r" % self.db_name)
+
             toinstall = self.get_bloks_to_install(toload)
             if self.update_to_install_blok_dependencies_state(toinstall):
                 toinstall = self.get_bloks_to_install(toload)
@@ -940,11 +1264,12 @@ class Registry:
                 logger.warning("Impossible to use loadwithoumigration")
                 self.loadwithoutmigration = False
 
+            self.lazy_assembly = self.is_lazy_assembly()
             self.load_bloks(toload, False, toload)
             if toinstall and not self.loadwithoutmigration:
-                blok2install = toinstall[0]
-                self.load_blok(blok2install, True, toload)
+                bloks2install = self.load_bloks_to_install(toinstall, toload)
 
+            self.snapshot = RegistrySnapshot.get(self)
             instrumentedlist_base = [] + self.loaded_cores['InstrumentedList']
             instrumentedlist_base += [list]
             self.InstrumentedList = type(
@@ -952,7 +1277,7 @@ class Registry:
             self.assemble_entries()
             self.create_session_factory()
 
-            self.apply_model_schema_on_table(blok2install)
+            self.apply_model_schema_on_table(bloks2install)
             self.listen_sqlalchemy_known_event()
             mustreload = self.is_reload_needed() or mustreload
 
@@ -960,10 +1285,18 @@ class Registry:
             self.close()
             raise e
 
-        if len(toinstall) > 1 or mustreload:
-            self.reload()
+        if set(toinstall[1:]) - set(bloks2install) or mustreload:
+            if self.is_incremental_reload():
+                self.incremental_reload()
+            else:
+                self.reload()
         else:
-            self.System.Blok.load_all()
+            if self.snapshot is not None:
+                self.snapshot.save()
+
+            self.get('Model.System.Blok').load_all()
+            self.listen_cache_checkpoint()
+            self.auto_warm_up()
 
         self.loadwithoutmigration = False
 
@@ -987,7 +1320,8 @@ class Registry:
         for entry in RegistryManager.declared_entries:
             if entry in RegistryManager.callback_assemble_entries:
                 logger.debug('Assemble %r entry' % entry)
-                RegistryManager.callback_assemble_entries[entry](self)
+                with self.loading_report.phase('assemble_entries', entry):
+                    RegistryManager.callback_assemble_entries[entry](self)
 
     def pre_assemble_entries(self):
         for entry in RegistryManager.declared_entries:
@@ -995,7 +1329,13 @@ class Registry:
                 logger.debug('Pre assemble %r entry' % entry)
                 RegistryManager.callback_pre_assemble_entries[entry](self)
 
+    @loading_phase('apply_model_schema_on_table')
     def apply_model_schema_on_table(self, blok2install):
+        """ Create or migrate the schema of the database
+
+        :param blok2install: name or list of names of the bloks installed
+            by this loading
+        """
         # replace the engine by the session.connection for bind attribute
         # because session.connection is already the connection use
         # by blok, migration and all write on the data base
@@ -1003,21 +1343,16 @@ class Registry:
         # new connection, this new connection have not acknowedge of the
         # data in the session.connection, and risk of bad lock on the
         # tables
-        if self.loadwithoutmigration:
+        if self.loadwithoutmigration or self.readonly:
             return
 
-        if not self.withoutautomigration and blok2install == 'anyblok-core':
+        bloks2install = return_list(blok2install) or []
+        if not self.withoutautomigration and 'anyblok-core' in bloks2install:
             self.declarativebase.metadata.tables['system_blok'].create(
                 bind=self.connection(), checkfirst=True)
 
         self.migration = Configuration.get('Migration', Migration)(self)
-        query = """
-            SELECT name, installed_version
-            FROM system_blok
-            WHERE
-                (state = 'toinstall' AND name = '%s')
-                OR state = 'toupdate'""" % blok2install
-        res = self.execute(query).fetchall()
+        res = self.get_bloks_to_migrate(bloks2install)
         if res:
             for blok, installed_version in res:
                 b = BlokManager.get(blok)(self)
@@ -1032,6 +1367,7 @@ class Registry:
                 self.declarativebase.metadata.create_all(self.connection())
 
             self.migration.auto_upgrade_database()
+            self.save_schema_fingerprint()
 
             for blok, installed_version in res:
                 b = BlokManager.get(blok)(self)
@@ -1041,13 +1377,91 @@ class Registry:
                     else None)
                 b.post_migration(parsed_version)
 
+        elif self.is_schema_unchanged():
+            logger.info('The schema fingerprint is unchanged, the schema '
+                        'comparison is skipped')
         else:
             self.migration.auto_upgrade_database()
+            self.save_schema_fingerprint()
+
+    def get_bloks_to_migrate(self, bloks2install):
+        """ Return the bloks to install or to update with their installed
+        version, in the order of the loaded bloks, the migration methods
+        of the bloks are called in this order
+
+        :param bloks2install: list of the names of the bloks installed
+            by this loading
+        :rtype: list of (blok name, installed version)
+        """
+        query = """
+            SELECT name, installed_version
+            FROM system_blok
+            WHERE
+                (state = 'toinstall' AND name IN ('%s'))
+                OR state = 'toupdate'""" % "', '".join(bloks2install)
+        res = self.execute(query).fetchall()
+        order = {blok: index
+                 for index, blok in enumerate(self.ordered_loaded_bloks)}
+        return sorted(res, key=lambda x: order.get(x[0], len(order)))
+
+    def get_schema_fingerprint(self):
+        """ Return the fingerprint of the expected schema, it is computed
+        with the metadata and the version of the loaded bloks
+
+        :rtype: str, hexadecimal digest
+        """
+        value = [self.migration.get_metadata_fingerprint()]
+        value.extend('%s:%s' % (blok, BlokManager.bloks[blok].version)
+                     for blok in self.ordered_loaded_bloks)
+        return sha1('\n'.join(value).encode('utf-8')).hexdigest()
+
+    def get_saved_schema_fingerprint(self):
+        """ Return the fingerprint saved by the last schema comparison
+
+        :rtype: str, hexadecimal digest or None
+        """
+        conn = self.connection()
+        if not conn.dialect.has_table(conn, 'system_parameter'):
+            # the table is created by the schema comparison
+            return None
+
+        Parameter = self.System.Parameter
+        if not Parameter.is_exist(SCHEMA_FINGERPRINT_KEY):
+            return None
+
+        return Parameter.get(SCHEMA_FINGERPRINT_KEY)
+
+    def save_schema_fingerprint(self):
+        """ Save the fingerprint of the schema, the next registries with
+        the same fingerprint skip the schema comparison
+        """
+        self.System.Parameter.set(
+            SCHEMA_FINGERPRINT_KEY, self.get_schema_fingerprint())
+
+    def is_schema_unchanged(self):
+        """ Return True if the schema comparison can be skipped
+
+        The comparison is always done if the configuration
+        ``force_schema_comparison`` is defined
+
+        :rtype: bool
+        """
+        if Configuration.get('force_schema_comparison'):
+            return False
+
+        saved_fingerprint = self.get_saved_schema_fingerprint()
+        return saved_fingerprint == self.get_schema_fingerprint()
 
     def is_reload_needed(self):
 
         """Determines whether a reload is needed or not."""
 
+        if self.readonly:
+            # the schema and the system metadata are not changed, but the
+            # state of the cache invalidations is read from the table
+            self.get('Model.System.Cache').initialize_model()
+            return
+
         if self.loadwithoutmigration:
             return
 
@@ -1055,8 +1469,9 @@ class Registry:
         for entry in RegistryManager.declared_entries:
             if entry in RegistryManager.callback_initialize_entries:
                 logger.debug('Initialize %r entry' % entry)
-                r = RegistryManager.callback_initialize_entries[entry](
-                    self)
+                with self.loading_report.phase('initialize_entries', entry):
+                    r = RegistryManager.callback_initialize_entries[entry](
+                        self)
                 mustreload = mustreload or r
 
         return mustreload
@@ -1142,14 +1557,58 @@ class Registry:
             self.unittest_transaction.close()
             self.bind.close()
 
+    def before_fork(self):
+        """ Prepare the registry to be inherited by forked processes
+
+        * the session is removed and the connections of the pool are
+          closed, a connection must never be shared between processes
+        * the mappers are configured to not modify the classes in the
+          workers
+        * the transport of the cache invalidation is stopped, it is started
+          again in the workers
+        """
+        if self.Session:
+            self.Session.remove()
+
+        configure_mappers()
+        if self.cache_invalidation is not None:
+            self.cache_invalidation.stop()
+
+        if not self.unittest:
+            self.engine.dispose()
+
+    def after_fork(self):
+        """ Reinit the registry in the forked process
+
+        The pool of the engine is recreated and the sessions of the parent
+        process are forgotten without be closed, their connections belong
+        to the parent process
+        """
+        if not self.unittest:
+            self.engine.dispose()
+
+        if self.Session:
+            self.Session.registry.clear()
+
+        if self.cache_invalidation is not None:
+            self.cache_invalidation.start()
+
     def close(self):
         """Release the session, connection and engine"""
+        if self.cache_invalidation is not None:
+            self.cache_invalidation.stop()
+            self.cache_invalidation = None
+
+        self.cache_backend.close()
         self.close_session()
         self.engine.dispose()
         if self.db_name in RegistryManager.registries:
             del RegistryManager.registries[self.db_name]
 
     def __getattr__(self, attribute):
+        if self.load_lazy_attribute('Model', attribute):
+            return self.__dict__[attribute]
+
         # TODO safe the call of session for reload
         if self.Session:
             session = self.Session()
@@ -1284,12 +1743,21 @@ class Registry:
             session = self.Session()
             session.commit(*args, **kwargs)
 
-    def clean_model(self):
-        """ Clean the registry of all the namespaces """
-        for model in self.loaded_namespaces.keys():
+    def clean_model(self, namespaces=None):
+        """ Clean the registry of all the namespaces
+
+        :param namespaces: the namespaces to clean, by default the loaded
+            namespaces
+        """
+        if namespaces is None:
+            namespaces = self.loaded_namespaces
+
+        for model in namespaces:
             name = model.split('.')[1]
-            if hasattr(self, name) and getattr(self, name):
-                setattr(self, name, None)
+            if self.__dict__.get(name):
+                # remove the attribute and not set None to let the lazy
+                # assembly find it
+                delattr(self, name)
 
     @log(logger, level='debug')
     def complete_reload(self):
@@ -1306,6 +1774,32 @@ class Registry:
         self.ini_var()
         self.load()
 
+    @log(logger, level='debug')
+    def incremental_reload(self):
+        """ Reload the registry, only the Models which depend on the
+        changed bloks are assembled and mapped again, the other Models are
+        kept with their mapper and their table.
+
+        All the Models are assembled again if the Core classes changed or
+        if a Model was removed
+        """
+        previous_load = {
+            'declarativebase': self.declarativebase,
+            'loaded_namespaces': self.loaded_namespaces,
+            'loaded_registries': self.loaded_registries,
+            'loaded_namespaces_first_step': getattr(
+                self, 'loaded_namespaces_first_step', {}),
+            'loaded_cores': self.loaded_cores,
+            'loaded_views': getattr(self, 'loaded_views', {}),
+            'removed': self.removed,
+            'expire_attributes': self.expire_attributes,
+            'sqlalchemy_known_events': self._sqlalchemy_known_events,
+        }
+        self.remove_sqlalchemy_known_event()
+        self.ini_var()
+        self.previous_load = previous_load
+        self.load()
+
     def get_bloks(self, blok, filter_states, filter_modes):
         Blok = self.System.Blok
         definition_blok = BlokManager.bloks[blok]
@@ -1378,6 +1872,11 @@ class Registry:
         :param uninstall: list of the blok to uninstall
         :exception: RegistryException
         """
+        if self.readonly:
+            raise RegistryException(
+                "The bloks can not be upgraded by the readonly registry of "
+                "the database %r" % self.db_name)
+
         Blok = self.System.Blok
 
         def upgrade_state_bloks(state):
@@ -1415,7 +1914,11 @@ class Registry:
         upgrade_state_bloks('touninstall')(uninstall or [])
         upgrade_state_bloks('toinstall')(install or [])
         upgrade_state_bloks('toupdate')(update or [])
-        self.reload()
+        if self.is_incremental_reload():
+            self.incremental_reload()
+        else:
+            self.reload()
+
         self.expire_all()
 
     @log(logger, level='debug')
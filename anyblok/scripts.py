@@ -79,6 +79,22 @@ Configuration.add_application_properties(
 )
 
 
+Configuration.add_application_properties(
+    'cache_report', ['logging', 'cache-report'],
+    prog='AnyBlok cache report, version %r' % version,
+    description="Print the statistics and the invalidations of the cached "
+                "methods",
+    formatter_class=RawDescriptionHelpFormatter,
+    epilog=dedent("Note\n"
+                  "----\n"
+                  "  The statistics are the ones of the process of the "
+                  "report, use --cache-report-script \n"
+                  "  to call the cached methods before the report. The "
+                  "saved invalidations are the \n"
+                  "  ones of all the processes.")
+)
+
+
 Configuration.add_application_properties(
     'nose', ['logging', 'unittest'],
     prog='AnyBlok nose, version %r' % version,
@@ -193,6 +209,86 @@ def anyblok2doc():
             dot.save()
 
 
+def format_date(date):
+    if date is None:
+        return '-'
+
+    return date.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def format_cache_report(report, process_stats=True):
+    """Return the lines of the report of the cached methods
+
+    The statistics, the entries and the last invalidation come from the
+    caches of the process which made the report, only the saved
+    invalidations are shared by all the processes.
+
+    :param report: report given by ``System.Cache.get_report``
+    :param process_stats: if False, only the saved invalidations are given
+    :rtype: list of str
+    """
+    names = ['%s.%s' % (method['registry_name'], method['method'])
+             for method in report]
+    width = max([len(name) for name in names] + [len('method')])
+    if not process_stats:
+        line = '{:<%d} {:>8} {:>19}' % width
+        lines = [line.format('method', 'saved', 'last saved')]
+        for name, method in zip(names, report):
+            last_saved = method['last_saved_invalidation'] or {}
+            lines.append(line.format(
+                name, method['saved_invalidations'],
+                format_date(last_saved.get('date'))))
+
+        return lines
+
+    line = ('{:<%d} {:>8} {:>8} {:>6} {:>8} {:>10} {:>8} {:>19} {:>8} '
+            '{:>19}  {}') % width
+    lines = [line.format('method', 'hits', 'misses', 'ratio', 'entries',
+                         'memory', 'invalid.', 'last invalidation',
+                         'saved', 'last saved', 'cause')]
+    for name, method in zip(names, report):
+        last = method['last_invalidation'] or {}
+        last_saved = method['last_saved_invalidation'] or {}
+        ratio = method['hit_ratio']
+        lines.append(line.format(
+            name,
+            method['hits'], method['misses'],
+            '-' if ratio is None else '%.0f%%' % (ratio * 100),
+            method['currsize'], method['memory'], method['invalidations'],
+            format_date(last.get('date')), method['saved_invalidations'],
+            format_date(last_saved.get('date')), last.get('cause', '-')))
+
+    return lines
+
+
+def anyblok_cache_report():
+    """Print the invalidations of the cached methods saved by all the
+    processes, the statistics of the caches are printed only if a script is
+    executed, they describe the calls of this script
+    """
+    registry = anyblok.start('cache_report')
+    if registry:
+        python_script = Configuration.get('cache_report_script')
+        if python_script:
+            with open(python_script, "r") as fh:
+                exec(fh.read(), None, locals())
+
+        registry.commit()
+        report = registry.System.Cache.get_report()
+        models = Configuration.get('cache_report_models')
+        if models:
+            report = [method for method in report
+                      if method['registry_name'] in models]
+
+        # the caches of the other processes are unknown, the statistics
+        # of this process are only meaningful for the calls of the script
+        for line in format_cache_report(
+                report, process_stats=bool(python_script)):
+            print(line)
+
+        registry.close()
+
+
 def anyblok_nose():
     """Run nose unit test after giving it the registry
     """
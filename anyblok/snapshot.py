@@ -0,0 +1,221 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2019 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import json
+import os
+from hashlib import sha1
+from logging import getLogger
+from os.path import join, isfile, relpath
+from pkg_resources import iter_entry_points
+from .blok import BlokManager
+from .config import Configuration
+from .release import version
+
+logger = getLogger(__name__)
+
+source_signatures = {}
+
+
+def get_blok_source_signature(blok):
+    """Return the signature of the python sources of the blok, from the
+    modification time and the size of the files, the sources are not read
+
+    :param blok: name of the blok
+    :rtype: str, hexadecimal digest
+    """
+    path = BlokManager.getPath(blok)
+    digest = sha1()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith('.py'):
+                continue
+
+            filename = join(root, name)
+            stat = os.stat(filename)
+            digest.update(('%s:%d:%d\n' % (
+                relpath(filename, path), stat.st_mtime_ns,
+                stat.st_size)).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def get_cached_blok_source_signature(blok):
+    """Return the signature of the sources of the blok, computed once by
+    process: the sources are walked by the first registry, the next
+    registries and the processes forked after the loading use it
+
+    :param blok: name of the blok
+    :rtype: str, hexadecimal digest
+    """
+    path = BlokManager.getPath(blok)
+    if path not in source_signatures:
+        source_signatures[path] = get_blok_source_signature(blok)
+
+    return source_signatures[path]
+
+
+def clear_source_signatures():
+    """Forget the signatures of the sources, called when the bloks are
+    unloaded because the sources may be changed"""
+    source_signatures.clear()
+
+
+def get_snapshot_incompatible_plugins():
+    """Return the model plugins which define ``transform_base_attribute``
+    without declaring ``snapshot_compatible``, the attributes they use
+    are unknown
+
+    :rtype: list of the entry points
+    """
+    res = []
+    for i in iter_entry_points('anyblok.model.plugin'):
+        plugin = i.load()
+        if (hasattr(plugin, 'transform_base_attribute') and
+                not getattr(plugin, 'snapshot_compatible', False)):
+            res.append(i)
+
+    return res
+
+
+def get_base_key(base):
+    """Return the key used to identify a base between two processes
+
+    :param base: class declared in a blok or core class
+    :rtype: str
+    """
+    return '%s:%s' % (base.__module__, base.__qualname__)
+
+
+class RegistrySnapshot:
+    """Persisted result of the assembly of the registry
+
+    The assembly of the Model asks to each plugin if an attribute of
+    each base must be transformed (``transform_base_attribute``). The
+    snapshot saves, for each base, the attributes really used by the
+    plugins, the next processes only give these attributes to the plugins
+    in place of the scan on ``dir(base)``. Only this scan is skipped, the
+    plugins are still called and the models are still assembled.
+
+    The snapshot is saved in the directory defined by the configuration
+    ``registry_snapshot_dir``, it is only used if the fingerprint of the
+    loaded bloks (name, version, modification time and size of the sources)
+    is the same, the sources are walked once by process. The snapshot is
+    disabled if a model plugin does not
+    declare ``snapshot_compatible``::
+
+        snapshot = RegistrySnapshot.get(registry)
+        if snapshot is not None and snapshot.is_valid:
+            attributes = snapshot.get_base_attributes(base)
+
+    """
+
+    def __init__(self, registry, path):
+        self.registry = registry
+        self.path = path
+        self.fingerprint = self.get_fingerprint()
+        self.attributes = {}
+        self.is_valid = False
+        self.changed = False
+
+    @classmethod
+    def get(cls, registry):
+        """Return the snapshot of the registry, None if no snapshot
+        directory is defined in the configuration
+
+        :param registry: the current registry
+        :rtype: RegistrySnapshot instance or None
+        """
+        directory = Configuration.get('registry_snapshot_dir')
+        if not directory:
+            return None
+
+        plugins = get_snapshot_incompatible_plugins()
+        if plugins:
+            logger.warning('The registry snapshot is disabled, the model '
+                           'plugins %r are not snapshot compatible', plugins)
+            return None
+
+        path = join(directory, 'anyblok-registry-%s.json' % registry.db_name)
+        snapshot = cls(registry, path)
+        snapshot.load()
+        return snapshot
+
+    def get_fingerprint(self):
+        """Return the fingerprint of the loaded bloks of the registry
+
+        :rtype: str, hexadecimal digest
+        """
+        bloks = []
+        for blok in self.registry.ordered_loaded_bloks:
+            bloks.append((blok, BlokManager.bloks[blok].version,
+                          get_cached_blok_source_signature(blok)))
+
+        plugins = sorted(str(i) for i in iter_entry_points(
+            'anyblok.model.plugin'))
+        value = json.dumps([version, plugins, bloks])
+        return sha1(value.encode('utf-8')).hexdigest()
+
+    def load(self):
+        """Load the snapshot file, the snapshot is valid only if the
+        fingerprint is the same
+        """
+        if not isfile(self.path):
+            logger.info('No registry snapshot %r found', self.path)
+            return
+
+        try:
+            with open(self.path, 'r') as fp:
+                data = json.load(fp)
+        except ValueError:
+            logger.warning('Invalid registry snapshot %r', self.path)
+            return
+
+        if data.get('fingerprint') != self.fingerprint:
+            logger.info('Registry snapshot %r is obsolete', self.path)
+            return
+
+        self.attributes = data['attributes']
+        self.is_valid = True
+        logger.info('Use the registry snapshot %r', self.path)
+
+    def get_base_attributes(self, base):
+        """Return the attributes to give to the plugins for this base
+
+        :param base: class declared in a blok or core class
+        :rtype: list of attribute names or None if the base is unknown
+        """
+        return self.attributes.get(get_base_key(base))
+
+    def set_base_attributes(self, base, attributes):
+        """Save the attributes used by the plugins for this base
+
+        :param base: class declared in a blok or core class
+        :param attributes: list of attribute names
+        """
+        self.attributes[get_base_key(base)] = attributes
+        self.changed = True
+
+    def save(self):
+        """Write the snapshot file if something changed"""
+        if not self.changed:
+            return
+
+        data = {
+            'fingerprint': self.fingerprint,
+            'bloks': self.registry.ordered_loaded_bloks,
+            'attributes': self.attributes,
+        }
+        # write in a temporary file before replace it to never give an
+        # incomplete file to another process
+        tmp_path = '%s.%d' % (self.path, os.getpid())
+        with open(tmp_path, 'w') as fp:
+            json.dump(data, fp)
+
+        os.replace(tmp_path, self.path)
+        self.changed = False
+        logger.info('Registry snapshot %r saved', self.path)
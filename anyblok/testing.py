@@ -85,7 +85,10 @@ def tmp_configuration(**values):
     :param **values: values to update
     """
     try:
-        old_configuration = Configuration.configuration.copy()
+        # the options are updated in place, they must be copied to be
+        # restored
+        old_configuration = {key: copy(option) for key, option in
+                             Configuration.configuration.items()}
         Configuration.update(**values)
         yield
     finally:
@@ -8,10 +8,16 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 import pytest
-from anyblok.testing import sgdb_in
+from anyblok.testing import sgdb_in, tmp_configuration
 from anyblok.blok import BlokManager
 from anyblok.registry import RegistryException, RegistryConflictingException
 
+try:
+    # python 3.4+ should use builtin unittest.mock not mock package
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
 
 @pytest.mark.skipif(sgdb_in(['MySQL', 'MariaDB']),
                     reason='Not for MySQL and MariaDB')
@@ -807,3 +813,50 @@ class TestBlokSession:
         Session = registry.Session
         registry.upgrade(install=('test-blok12',))
         assert Session is not registry.Session
+
+
+@pytest.mark.skipif(sgdb_in(['MySQL', 'MariaDB']),
+                    reason='Not for MySQL and MariaDB')
+class TestBlokSinglePassInstall:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_testblok):
+        transaction = registry_testblok.begin_nested()
+        request.addfinalizer(transaction.rollback)
+        return
+
+    def upgrade(self, registry, single_pass_install, **kwargs):
+        with tmp_configuration(single_pass_install=single_pass_install):
+            with patch.object(registry, 'reload',
+                              wraps=registry.reload) as reload:
+                registry.upgrade(**kwargs)
+
+        return reload.call_count
+
+    def check_installed(self, registry, *bloks):
+        Blok = registry.System.Blok
+        for blok in bloks:
+            blok = Blok.query().filter(Blok.name == blok).one()
+            assert blok.state == 'installed'
+            assert blok.installed_version == '1.0.0'
+
+    def test_install_blok_by_blok(self, registry_testblok):
+        registry = registry_testblok
+        assert self.upgrade(registry, False, install=('test-blok3',)) == 3
+        self.check_installed(registry, 'test-blok1', 'test-blok2',
+                             'test-blok3')
+
+    def test_install_in_single_pass(self, registry_testblok):
+        registry = registry_testblok
+        assert self.upgrade(registry, True, install=('test-blok3',)) == 1
+        self.check_installed(registry, 'test-blok1', 'test-blok2',
+                             'test-blok3')
+
+    def test_install_models_in_single_pass(self, registry_testblok):
+        registry = registry_testblok
+        assert self.upgrade(registry, True,
+                            install=('test-blok7', 'test-blok8')) == 1
+        self.check_installed(registry, 'test-blok7', 'test-blok8')
+        t2 = registry.Test2.insert(label="test2")
+        t1 = registry.Test.insert(label="Test1", test2=t2.id)
+        assert registry.Test.query().filter_by(id=t1.id).one().test2 == t2.id
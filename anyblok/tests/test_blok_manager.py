@@ -8,6 +8,10 @@
 # obtain one at http://mozilla.org/MPL/2.0/.
 import pytest
 from anyblok.blok import BlokManager, Blok, BlokManagerException
+from anyblok.testing import LogCapture
+from logging import WARNING
+from threading import Thread, Timer, Event, current_thread
+from time import time
 
 
 class TestBlokManager:
@@ -61,3 +65,68 @@ class TestBlokManager:
         BlokManager.set(blok_name, Blok)
         with pytest.raises(BlokManagerException):
             BlokManager.set(blok_name, Blok)
+
+
+class TestBlokManagerLoadingLock:
+
+    @pytest.fixture(autouse=True)
+    def bloks_must_be_unloaded(self, request):
+        request.addfinalizer(BlokManager.unload)
+        BlokManager.unload()
+
+    def lock_in_thread(self, delay):
+        locked = Event()
+        release = Event()
+
+        def target():
+            with BlokManager.loading_lock():
+                locked.set()
+                release.wait(delay)
+
+        thread = Thread(target=target, name='loader')
+        thread.start()
+        locked.wait()
+        return thread, release
+
+    def test_load_in_the_lock(self):
+        with BlokManager.loading_lock():
+            assert BlokManager.lock_owner == current_thread().name
+            BlokManager.load()
+            BlokManager.reload()
+            assert BlokManager.lock_owner == current_thread().name
+
+        assert BlokManager.lock_owner is None
+        assert BlokManager.has('anyblok-core')
+
+    def test_wait_the_end_of_the_loading(self):
+        thread, release = self.lock_in_thread(5)
+        Timer(0.2, release.set).start()
+        start = time()
+        BlokManager.load()
+        thread.join()
+        assert time() - start < 5
+        assert BlokManager.has('anyblok-core')
+
+    def test_timeout(self):
+        thread, release = self.lock_in_thread(5)
+        try:
+            with pytest.raises(BlokManagerException) as exc:
+                BlokManager.load(timeout=0.1)
+
+            assert "'loader'" in str(exc.value)
+        finally:
+            release.set()
+            thread.join()
+
+    def test_warning_during_the_wait(self):
+        thread, release = self.lock_in_thread(5)
+        lock_warning_delay = BlokManager.lock_warning_delay
+        BlokManager.lock_warning_delay = 0.05
+        try:
+            with LogCapture('anyblok.blok', level=WARNING) as logs:
+                Timer(0.2, release.set).start()
+                BlokManager.load()
+                assert logs.get_warning_messages()
+        finally:
+            BlokManager.lock_warning_delay = lock_warning_delay
+            thread.join()
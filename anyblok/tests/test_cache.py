@@ -6,13 +6,24 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+import gc
+import weakref
+from datetime import datetime, timedelta
 from random import random
 from anyblok.declarations import Declarations, cache, classmethod_cache
 from anyblok.bloks.anyblok_core.exceptions import CacheException
 from anyblok.column import Integer
+from anyblok.testing import tmp_configuration
+from anyblok.scripts import format_cache_report
 import pytest
 from .conftest import init_registry, reset_db
 
+try:
+    # python 3.4+ should use builtin unittest.mock not mock package
+    from unittest.mock import patch, Mock
+except ImportError:
+    from mock import patch, Mock
+
 register = Declarations.register
 Model = Declarations.Model
 Mixin = Declarations.Mixin
@@ -94,6 +105,406 @@ class TestCache:
         cache = caches[0]
         assert cache.indentify == ('Model.Test', 'method_cached')
 
+    def test_checkpoint(self, registry_method_cached):
+        registry = registry_method_cached
+        Cache = registry.System.Cache
+        t = registry.Test()
+        value = t.method_cached()
+        assert t.method_cached() == value
+        Cache.insert(registry_name="Model.Test", method="method_cached")
+        assert t.method_cached() == value
+        assert Cache.checkpoint(interval=0) is True
+        assert t.method_cached() == value + 1
+
+    def test_checkpoint_with_interval(self, registry_method_cached):
+        registry = registry_method_cached
+        Cache = registry.System.Cache
+        Cache.checkpoint(interval=0)
+        with patch.object(Cache, 'clear_invalidate_cache') as clear:
+            assert Cache.checkpoint(interval=3600) is False
+            clear.assert_not_called()
+            with tmp_configuration(cache_checkpoint_interval=0):
+                assert Cache.checkpoint() is True
+
+            clear.assert_called_once_with()
+
+    def test_listen_cache_checkpoint(self, registry_method_cached):
+        registry = registry_method_cached
+        Session = registry.Session.session_factory.class_
+        with tmp_configuration(cache_checkpoint_interval=0):
+            with patch('anyblok.registry.event.listen') as listen:
+                registry.listen_cache_checkpoint()
+
+        listen.assert_called_once_with(Session, 'after_begin',
+                                       registry.cache_checkpoint)
+
+    def test_no_cache_checkpoint_without_interval(self,
+                                                  registry_method_cached):
+        registry = registry_method_cached
+        with patch('anyblok.registry.event.listen') as listen:
+            registry.listen_cache_checkpoint()
+
+        listen.assert_not_called()
+
+    def test_cache_checkpoint_by_transaction(self, registry_method_cached):
+        registry = registry_method_cached
+        transaction = Mock()
+        transaction.parent = None
+        with tmp_configuration(cache_checkpoint_interval=10):
+            with patch.object(registry.System.Cache,
+                              'checkpoint') as checkpoint:
+                registry.cache_checkpoint(registry.session, transaction, None)
+
+        checkpoint.assert_called_once_with(interval=10)
+
+    def test_no_cache_checkpoint_by_savepoint(self, registry_method_cached):
+        registry = registry_method_cached
+        savepoint = Mock()
+        savepoint.parent = Mock()
+        with patch.object(registry.System.Cache, 'checkpoint') as checkpoint:
+            registry.cache_checkpoint(registry.session, savepoint, None)
+
+        checkpoint.assert_not_called()
+
+    def get_existing_ids(self, Cache, rows):
+        ids = [row.id for row in rows]
+        return {x[0] for x in Cache.query('id').filter(Cache.id.in_(ids))}
+
+    def test_prune_duplicated_invalidations(self, registry_method_cached):
+        registry = registry_method_cached
+        Cache = registry.System.Cache
+        rows = [
+            Cache.insert(registry_name="Model.Test", method="method_cached",
+                         args=[1]),
+            Cache.insert(registry_name="Model.Test", method="method_cached"),
+            Cache.insert(registry_name="Model.Test2", method="method_cached",
+                         args=[1]),
+            Cache.insert(registry_name="Model.Test2", method="method_cached",
+                         args=[2]),
+            Cache.insert(registry_name="Model.Test2", method="method_cached",
+                         args=[1]),
+            Cache.insert(registry_name="Model.Test", method="method_cached"),
+        ]
+        assert Cache.prune(retention=0) >= 3
+        assert self.get_existing_ids(Cache, rows) == {
+            rows[3].id, rows[4].id, rows[5].id}
+
+    def test_prune_old_invalidations(self, registry_method_cached):
+        registry = registry_method_cached
+        Cache = registry.System.Cache
+        old_date = datetime.now() - timedelta(days=2)
+        rows = [
+            Cache.insert(registry_name="Model.Test", method="method_cached",
+                         args=[1], create_date=old_date),
+            Cache.insert(registry_name="Model.Test", method="method_cached",
+                         args=[2]),
+            Cache.insert(registry_name="Model.Test", method="method_cached",
+                         args=[3], create_date=old_date),
+        ]
+        assert rows[1].create_date is not None
+        Cache.prune(retention=86400)
+        # the last invalidation is always kept
+        assert self.get_existing_ids(Cache, rows) == {rows[1].id, rows[2].id}
+
+    def test_prune_in_its_own_transaction(self, registry_method_cached):
+        registry = registry_method_cached
+        Cache = registry.System.Cache
+        rows = [
+            Cache.insert(registry_name="Model.Test", method="method_cached")
+            for x in range(3)
+        ]
+        with patch.object(registry, 'unittest', False):
+            Cache.prune(retention=0)
+
+        # the invalidations of the transaction of the session are not seen
+        assert self.get_existing_ids(Cache, rows) == {row.id for row in rows}
+        assert Cache.prune(retention=0) >= 2
+        assert self.get_existing_ids(Cache, rows) == {rows[2].id}
+
+    def test_auto_prune_error(self, registry_method_cached):
+        registry = registry_method_cached
+        Cache = registry.System.Cache
+        with tmp_configuration(cache_invalidation_retention=10):
+            with patch.object(Cache, 'last_prune', None):
+                with patch.object(Cache, 'prune',
+                                  side_effect=Exception('locked')) as prune:
+                    Cache.auto_prune()
+                    Cache.auto_prune()
+
+        prune.assert_called_once_with(retention=10)
+
+    def test_auto_prune(self, registry_method_cached):
+        registry = registry_method_cached
+        Cache = registry.System.Cache
+        with tmp_configuration(cache_invalidation_retention=10):
+            with patch.object(Cache, 'last_prune', None):
+                with patch.object(Cache, 'prune') as prune:
+                    Cache.auto_prune()
+                    Cache.auto_prune()
+
+        prune.assert_called_once_with(retention=10)
+
+    def test_no_prune_by_initialize_model(self, registry_method_cached):
+        registry = registry_method_cached
+        Cache = registry.System.Cache
+        with tmp_configuration(cache_invalidation_retention=10):
+            with patch.object(Cache, 'last_prune', None):
+                with patch.object(Cache, 'prune') as prune:
+                    Cache.initialize_model()
+
+        prune.assert_not_called()
+
+    def test_auto_prune_after_commit(self, registry_method_cached):
+        registry = registry_method_cached
+        Cache = registry.System.Cache
+        with tmp_configuration(cache_invalidation_retention=10):
+            with patch.object(Cache, 'last_prune', None):
+                with patch.object(Cache, 'prune') as prune:
+                    Cache.invalidate('Model.Test', 'method_cached')
+                    prune.assert_not_called()
+                    registry.apply_postcommit_hook()
+
+        prune.assert_called_once_with(retention=10)
+
+    def test_auto_prune_by_checkpoint(self, registry_method_cached):
+        registry = registry_method_cached
+        Cache = registry.System.Cache
+        with patch.object(Cache, 'auto_prune') as auto_prune:
+            Cache.checkpoint()
+
+        auto_prune.assert_called_once_with()
+
+    def test_no_auto_prune_without_retention(self, registry_method_cached):
+        registry = registry_method_cached
+        Cache = registry.System.Cache
+        with tmp_configuration(cache_invalidation_retention=0):
+            with patch.object(Cache, 'last_prune', None):
+                with patch.object(Cache, 'prune') as prune:
+                    Cache.auto_prune()
+
+        prune.assert_not_called()
+
+    def test_invalidation_not_checked_during_retention(
+        self, registry_method_cached
+    ):
+        registry = registry_method_cached
+        Cache = registry.System.Cache
+        t = registry.Test()
+        value = t.method_cached()
+        with tmp_configuration(cache_invalidation_retention=10):
+            with patch.object(Cache, 'last_check', 0):
+                with patch('anyblok.bloks.anyblok_core.system.cache.'
+                           'monotonic', return_value=100):
+                    invalidations = Cache.get_invalidations()
+                    assert Cache.last_check == 100
+
+        assert (registry.caches['Model.Test']['method_cached'][0],
+                None) in invalidations
+        for method_cache, args in invalidations:
+            method_cache.cache_clear()
+
+        assert t.method_cached() == value + 1
+
+
+def add_model_with_bounded_method_cached():
+
+    @register(Model)
+    class Test:
+
+        x = 0
+
+        @cache(size=2, ttl=60, max_bytes=1024)
+        def method_cached(self, value):
+            self.x += 1
+            return value
+
+        @classmethod_cache(policy='fifo')
+        def classmethod_cached(cls):
+            return random()
+
+
+class TestBoundedCache:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded):
+
+        def close():
+            self.registry.close()
+
+        request.addfinalizer(close)
+
+    def test_bounded_cache(self):
+        self.registry = init_registry(add_model_with_bounded_method_cached)
+        t = self.registry.Test()
+        for value in (1, 2, 1, 3):
+            assert t.method_cached(value) == value
+
+        assert t.x == 3
+        method_cache = self.registry.caches['Model.Test']['method_cached'][0]
+        assert method_cache.ttl == 60
+        assert method_cache.max_bytes == 1024
+        stats = self.registry.System.Cache.get_stats()
+        assert stats[('Model.Test', 'method_cached')] == {
+            'hits': 1, 'misses': 3, 'evictions': 1, 'expirations': 0,
+            'currsize': 2, 'bytes': method_cache.store.bytes}
+
+    def test_classmethod_cache_with_policy(self):
+        self.registry = init_registry(add_model_with_bounded_method_cached)
+        Test = self.registry.Test
+        assert Test.classmethod_cached() == Test.classmethod_cached()
+        stats = self.registry.System.Cache.get_stats()
+        assert stats[('Model.Test', 'classmethod_cached')]['hits'] == 1
+
+
+def add_model_with_method_cached_by_args():
+
+    @register(Model)
+    class Test:
+
+        @cache(max_bytes=1024 * 1024)
+        def method_cached(self, value):
+            return random()
+
+        @classmethod_cache(max_bytes=1024 * 1024)
+        def classmethod_cached(cls, value):
+            return random()
+
+        @classmethod_cache()
+        def lru_classmethod_cached(cls, value):
+            return random()
+
+
+class TestCacheInvalidationByArgs:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded):
+
+        def close():
+            self.registry.close()
+
+        request.addfinalizer(close)
+
+    def test_invalidate_classmethod_entries(self):
+        self.registry = init_registry(add_model_with_method_cached_by_args)
+        Test = self.registry.Test
+        Cache = self.registry.System.Cache
+        value1 = Test.classmethod_cached(1)
+        value2 = Test.classmethod_cached(2)
+        Cache.invalidate('Model.Test', 'classmethod_cached', 1)
+        assert Test.classmethod_cached(1) != value1
+        assert Test.classmethod_cached(2) == value2
+        invalidation = Cache.query().order_by(Cache.id.desc()).first()
+        assert invalidation.args == [1]
+
+    def test_invalidate_method_entries(self):
+        self.registry = init_registry(add_model_with_method_cached_by_args)
+        t = self.registry.Test()
+        value1 = t.method_cached('a')
+        value2 = t.method_cached('b')
+        self.registry.System.Cache.invalidate(
+            self.registry.Test, 'method_cached', 'a')
+        assert t.method_cached('a') != value1
+        assert t.method_cached('b') == value2
+
+    def test_invalidate_lru_classmethod_entries(self):
+        self.registry = init_registry(add_model_with_method_cached_by_args)
+        Test = self.registry.Test
+        value1 = Test.lru_classmethod_cached(1)
+        value2 = Test.lru_classmethod_cached(2)
+        assert Test.lru_classmethod_cached(1) == value1
+        self.registry.System.Cache.invalidate(
+            'Model.Test', 'lru_classmethod_cached', 1)
+        # the other arguments are kept
+        assert Test.lru_classmethod_cached(1) != value1
+        assert Test.lru_classmethod_cached(2) == value2
+        info = Test.lru_classmethod_cached.cache_info()
+        assert info['hits'] == 2
+        assert info['misses'] == 3
+
+    def test_get_invalidations(self):
+        self.registry = init_registry(add_model_with_method_cached_by_args)
+        Cache = self.registry.System.Cache
+        Cache.insert(registry_name="Model.Test", method="method_cached",
+                     args=[1, [2, 3]])
+        Cache.insert(registry_name="Model.Test", method="method_cached")
+        invalidations = Cache.get_invalidations()
+        assert [args for cache, args in invalidations] == [(1, (2, 3)), None]
+
+    def test_invalidate_with_invalid_args(self):
+        self.registry = init_registry(add_model_with_method_cached_by_args)
+        with pytest.raises(CacheException):
+            self.registry.System.Cache.invalidate(
+                'Model.Test', 'method_cached', object())
+
+
+class TestCacheReport:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded):
+
+        def close():
+            self.registry.close()
+
+        request.addfinalizer(close)
+
+    def get_report(self, method):
+        for report in self.registry.System.Cache.get_report():
+            if (report['registry_name'], report['method']) == (
+                    'Model.Test', method):
+                return report
+
+    def test_report(self):
+        self.registry = init_registry(add_model_with_method_cached_by_args)
+        Test = self.registry.Test
+        for value in (1, 1, 2):
+            Test.classmethod_cached(value)
+
+        report = self.get_report('classmethod_cached')
+        assert report['hits'] == 1
+        assert report['misses'] == 2
+        assert report['hit_ratio'] == 1 / 3
+        assert report['currsize'] == 2
+        assert report['memory'] > 0
+        assert report['invalidations'] == 0
+        assert report['last_invalidation'] is None
+        assert report['saved_invalidations'] == 0
+        assert report['last_saved_invalidation'] is None
+        assert self.get_report('method_cached')['hit_ratio'] is None
+
+    def test_report_invalidations(self):
+        self.registry = init_registry(add_model_with_method_cached_by_args)
+        Test = self.registry.Test
+        Cache = self.registry.System.Cache
+        Test.classmethod_cached(1)
+        Cache.invalidate('Model.Test', 'classmethod_cached', 1)
+        Cache.invalidate('Model.Test', 'classmethod_cached')
+        report = self.get_report('classmethod_cached')
+        assert report['currsize'] == 0
+        assert report['invalidations'] == 2
+        assert report['last_invalidation']['cause'] == 'System.Cache'
+        assert report['last_invalidation']['args'] is None
+        assert report['saved_invalidations'] == 2
+        assert report['last_saved_invalidation']['args'] is None
+        assert report['last_saved_invalidation']['date'] is not None
+
+    def test_format_report(self):
+        self.registry = init_registry(add_model_with_method_cached_by_args)
+        self.registry.Test.classmethod_cached(1)
+        self.registry.System.Cache.invalidate('Model.Test', 'method_cached')
+        report = [self.get_report('classmethod_cached'),
+                  self.get_report('method_cached')]
+        lines = format_cache_report(report)
+        assert len(lines) == 3
+        assert lines[1].startswith('Model.Test.classmethod_cached ')
+        assert ' 0% ' in lines[1]
+        assert lines[2].endswith('  System.Cache')
+        lines = format_cache_report(report, process_stats=False)
+        assert len(lines) == 3
+        assert lines[0].split() == ['method', 'saved', 'last', 'saved']
+        assert lines[1].split() == ['Model.Test.classmethod_cached', '0',
+                                    '-']
+        assert lines[2].split()[:2] == ['Model.Test.method_cached', '1']
+
 
 class TestSimpleCache:
 
@@ -1013,6 +1424,10 @@ def add_sql_model_cache():
         def get_id2(self):
             return self.id2
 
+        @cache(per_instance=True)
+        def get_id2_per_instance(self):
+            return self.id2
+
         @classmethod_cache()
         def count(cls):
             return cls.query().count()
@@ -1052,3 +1467,31 @@ class TestSQLModelCache:
         Cache = registry.System.Cache
         Cache.invalidate('Model.Test', 'get_id2')
         assert t.get_id2() == 2
+
+    def test_method_cached_keep_instance(self, registry_sql_model_cached):
+        registry = registry_sql_model_cached
+        t = registry.Test.insert(id2=1)
+        assert t.get_id2() == 1
+        t.id2 = 2
+        registry.expunge(t)
+        assert t.get_id2() == 1
+
+    def test_method_cached_dropped_by_expunge(self, registry_sql_model_cached):
+        registry = registry_sql_model_cached
+        t = registry.Test.insert(id2=1)
+        assert t.get_id2_per_instance() == 1
+        t.id2 = 2
+        assert t.get_id2_per_instance() == 1
+        registry.expunge(t)
+        assert t.get_id2_per_instance() == 2
+
+    def test_method_cached_does_not_keep_instance(self,
+                                                  registry_sql_model_cached):
+        registry = registry_sql_model_cached
+        t = registry.Test.insert(id2=1)
+        assert t.get_id2_per_instance() == 1
+        ref = weakref.ref(t)
+        registry.expunge(t)
+        del t
+        gc.collect()
+        assert ref() is None
@@ -0,0 +1,297 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2019 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from anyblok.declarations import Declarations, classmethod_cache
+from anyblok.cache import MethodCache, LRUMethodCache
+from anyblok.cache_backend import (
+    CacheBackend, CacheBackendException, MemoryCacheBackend,
+    SQLiteCacheBackend, SharedMethodCache)
+from anyblok.testing import tmp_configuration
+from .conftest import init_registry
+
+try:
+    # python 3.4+ should use builtin unittest.mock not mock package
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+register = Declarations.register
+Model = Declarations.Model
+
+
+class Registry:
+    """ Registry of a process, only the settings are used """
+
+    def __init__(self, path=None, backend=None,
+                 db_name='test_cache_backend'):
+        self.db_name = db_name
+        self.additional_setting = {'cache_backend': backend,
+                                   'cache_backend_path': path}
+        self.ordered_loaded_bloks = []
+
+
+class Counter:
+
+    def __init__(self):
+        self.__name__ = self.__qualname__ = 'counter'
+        self.calls = 0
+
+    def __call__(self, cls, value, size=1):
+        self.calls += 1
+        return [value] * size
+
+
+def get_method_cache(backend, method, **options):
+    method_cache = backend.get_method_cache(method, **options)
+    method_cache.indentify = ('Model.Test', 'method')
+    return method_cache
+
+
+class TestSQLiteCacheBackend:
+
+    @pytest.fixture(autouse=True)
+    def init_backends(self, request, tmpdir):
+        path = str(tmpdir.join('cache.sqlite'))
+        self.backends = [SQLiteCacheBackend(Registry(path)),
+                         SQLiteCacheBackend(Registry(path))]
+
+        def close():
+            for backend in self.backends:
+                backend.close()
+
+        request.addfinalizer(close)
+
+    def test_get_backend(self):
+        assert isinstance(CacheBackend.get(Registry()), MemoryCacheBackend)
+        assert isinstance(CacheBackend.get(Registry(backend='sqlite')),
+                          SQLiteCacheBackend)
+        with pytest.raises(CacheBackendException):
+            CacheBackend.get(Registry(backend='unknown'))
+
+    def test_memory_backend(self):
+        backend = MemoryCacheBackend(Registry())
+        method_cache = backend.get_method_cache(Counter())
+        assert type(method_cache) is LRUMethodCache
+        method_cache = backend.get_method_cache(Counter(), ttl=60)
+        assert type(method_cache) is MethodCache
+
+    def test_default_path(self):
+        backend = SQLiteCacheBackend(Registry())
+        assert backend.path.endswith('anyblok-cache-test_cache_backend.sqlite')
+
+    def test_entries_not_shared_by_the_databases(self):
+        counter = Counter()
+        other = SQLiteCacheBackend(
+            Registry(self.backends[0].path, db_name='other_database'))
+        self.backends.append(other)
+        cache1 = get_method_cache(self.backends[0], counter)
+        cache2 = get_method_cache(other, counter)
+        assert cache1('cls', 1) == [1]
+        assert cache2('cls', 1) == [1]
+        assert counter.calls == 2
+        cache2.cache_clear()
+        assert cache1('cls', 1) == [1]
+        assert counter.calls == 2
+
+    def test_entries_shared_by_the_processes(self):
+        counter = Counter()
+        cache1, cache2 = [get_method_cache(backend, counter)
+                          for backend in self.backends]
+        assert isinstance(cache1, SharedMethodCache)
+        assert cache1('cls', 1) == [1]
+        assert cache2('cls', 1) == [1]
+        assert cache2('cls', 1, size=2) == [1, 1]
+        assert counter.calls == 2
+        assert cache1.cache_info()['misses'] == 1
+        info = cache2.cache_info()
+        assert info['hits'] == 1
+        assert info['misses'] == 1
+        assert info['currsize'] == 2
+        assert info['bytes'] > 0
+
+    def test_entries_by_version(self):
+        counter = Counter()
+        cache1, cache2 = [get_method_cache(backend, counter)
+                          for backend in self.backends]
+        cache2.version = 'other version'
+        cache1('cls', 1)
+        cache2('cls', 1)
+        assert counter.calls == 2
+
+    def test_cache_clear(self):
+        counter = Counter()
+        cache1, cache2 = [get_method_cache(backend, counter)
+                          for backend in self.backends]
+        cache1('cls', 1)
+        cache2.cache_clear()
+        cache1('cls', 1)
+        assert counter.calls == 2
+
+    def test_cache_invalidate(self):
+        counter = Counter()
+        cache1, cache2 = [get_method_cache(backend, counter)
+                          for backend in self.backends]
+        cache1('cls', 1)
+        cache1('cls', 2)
+        cache2.cache_invalidate(1)
+        assert cache1.cache_info()['currsize'] == 1
+        cache1('cls', 1)
+        cache1('cls', 2)
+        assert counter.calls == 3
+
+    def test_size(self):
+        counter = Counter()
+        method_cache = get_method_cache(self.backends[0], counter, size=2)
+        for value in (1, 2, 3):
+            method_cache('cls', value)
+
+        assert method_cache.cache_info()['currsize'] == 2
+        assert method_cache.cache_info()['evictions'] == 1
+        method_cache('cls', 3)
+        method_cache('cls', 1)
+        assert counter.calls == 4
+
+    def test_max_bytes(self):
+        counter = Counter()
+        method_cache = get_method_cache(self.backends[0], counter,
+                                        max_bytes=100)
+        method_cache('cls', 1, size=100)
+        assert method_cache.cache_info()['currsize'] == 0
+        for value in range(20):
+            method_cache('cls', value)
+
+        info = method_cache.cache_info()
+        assert info['bytes'] <= 100
+        assert info['evictions'] > 0
+
+    def test_ttl(self):
+        counter = Counter()
+        method_cache = get_method_cache(self.backends[0], counter, ttl=10)
+        with patch('anyblok.cache_backend.time', return_value=100):
+            method_cache('cls', 1)
+            method_cache('cls', 1)
+
+        assert counter.calls == 1
+        with patch('anyblok.cache_backend.time', return_value=111):
+            method_cache('cls', 1)
+
+        assert counter.calls == 2
+        assert method_cache.cache_info()['expirations'] == 1
+
+    def test_not_picklable(self):
+
+        def method(cls, value):
+            return lambda: value
+
+        method_cache = get_method_cache(self.backends[0], method)
+        assert method_cache('cls', 1)() == 1
+        assert method_cache('cls', lambda: 1)() is not None
+        assert method_cache.cache_info()['currsize'] == 0
+
+    def test_start_removes_the_entries_of_the_database(self):
+        counter = Counter()
+        other = SQLiteCacheBackend(
+            Registry(self.backends[0].path, db_name='other_database'))
+        self.backends.append(other)
+        cache1, cache2 = [get_method_cache(backend, counter)
+                          for backend in self.backends[:2]]
+        other_cache = get_method_cache(other, counter)
+        assert cache1('cls', 1) == [1]
+        assert other_cache('cls', 1) == [1]
+        self.backends[1].start()
+        assert cache2('cls', 1) == [1]
+        assert other_cache('cls', 1) == [1]
+        assert counter.calls == 3
+
+    def test_connection_reopened_after_fork(self):
+        backend = self.backends[0]
+        connection = backend.get_connection()
+        with patch('anyblok.cache_backend.os.getpid', return_value=-1):
+            assert backend.get_connection() is not connection
+
+        assert backend.inherited_connections == [connection]
+
+
+def add_model_with_classmethod_cached():
+
+    @register(Model)
+    class Test:
+
+        x = 0
+
+        @classmethod_cache(shared=True)
+        def method_cached(cls, value):
+            cls.x += 1
+            return [value, cls.x]
+
+        @classmethod_cache()
+        def method_not_shared(cls, value):
+            return value
+
+
+class TestRegistryCacheBackend:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded, tmpdir):
+        self.path = str(tmpdir.join('cache.sqlite'))
+
+        def close():
+            if hasattr(self, 'registry'):
+                self.registry.close()
+
+        request.addfinalizer(close)
+
+    def init_registry(self):
+        with tmp_configuration(cache_backend='sqlite',
+                               cache_backend_path=self.path):
+            self.registry = init_registry(add_model_with_classmethod_cached)
+
+        return self.registry
+
+    def test_shared_cache(self):
+        registry = self.init_registry()
+        assert isinstance(registry.cache_backend, SQLiteCacheBackend)
+        assert registry.Test.method_cached(1) == [1, 1]
+        other = SQLiteCacheBackend(registry)
+        other.path = self.path
+        try:
+            other_cache = get_method_cache(
+                other, registry.Test.method_cached.__func__.method)
+            other_cache.name = registry.Test.method_cached.get_name()
+            assert other_cache(registry.Test, 1) == [1, 1]
+        finally:
+            other.close()
+
+        assert registry.Test.x == 1
+
+    def test_entries_removed_by_the_start_of_the_registry(self):
+        registry = self.init_registry()
+        assert registry.Test.method_cached(1) == [1, 1]
+        registry.close()
+        # invalidated while no process was running
+        registry = self.init_registry()
+        assert registry.Test.method_cached(1) == [1, 1]
+        assert registry.Test.x == 1
+
+    def test_invalidation_by_system_cache(self):
+        registry = self.init_registry()
+        registry.Test.method_cached(1)
+        registry.Test.method_cached(2)
+        registry.System.Cache.invalidate('Model.Test', 'method_cached', 1)
+        assert registry.Test.method_cached(1) == [1, 3]
+        assert registry.Test.method_cached(2) == [2, 2]
+        registry.System.Cache.invalidate('Model.Test', 'method_cached')
+        assert registry.Test.method_cached(2) == [2, 4]
+
+    def test_not_shared_methods(self):
+        registry = self.init_registry()
+        for namespace, method in (('Model.System.Blok', 'is_installed'),
+                                  ('Model.Test', 'method_not_shared')):
+            caches = registry.caches[namespace][method]
+            assert not any(isinstance(cache, SharedMethodCache)
+                           for cache in caches)
@@ -0,0 +1,301 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2019 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+from threading import Event
+from time import monotonic, sleep
+from anyblok.declarations import Declarations, cache
+from anyblok.cache_invalidation import (
+    CacheInvalidationException, LocalCacheInvalidation,
+    PostgreSQLCacheInvalidation, NOTIFY_CHANNEL)
+from anyblok.testing import tmp_configuration, sgdb_in
+from .conftest import init_registry
+
+try:
+    # python 3.4+ should use builtin unittest.mock not mock package
+    from unittest.mock import patch, Mock
+except ImportError:
+    from mock import patch, Mock
+
+register = Declarations.register
+Model = Declarations.Model
+
+
+def add_model_with_method_cached():
+
+    @register(Model)
+    class Test:
+
+        x = 0
+
+        @cache()
+        def method_cached(self):
+            self.x += 1
+            return self.x
+
+
+class OtherRegistry:
+    """ Registry of another process, only the caches are used """
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.cache = Mock()
+        self.caches = {'Model.Test': {'method_cached': [self.cache]}}
+
+
+class TestCacheInvalidation:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded):
+
+        def close():
+            if hasattr(self, 'registry'):
+                self.registry.close()
+
+        request.addfinalizer(close)
+
+    def init_registry(self, transport):
+        with tmp_configuration(cache_invalidation_transport=transport):
+            self.registry = init_registry(add_model_with_method_cached)
+
+        return self.registry
+
+    def test_without_transport(self):
+        registry = self.init_registry(None)
+        assert registry.cache_invalidation is None
+
+    def test_unknown_transport(self):
+        with pytest.raises(CacheInvalidationException):
+            self.init_registry('unknown')
+
+    def test_local_transport(self):
+        registry = self.init_registry('local')
+        assert isinstance(registry.cache_invalidation, LocalCacheInvalidation)
+        other = LocalCacheInvalidation(OtherRegistry(registry.db_name))
+        other.start()
+        try:
+            t = registry.Test()
+            assert t.method_cached() == 1
+            with patch.object(registry.System.Cache, 'get_last_id') as poll:
+                registry.System.Cache.invalidate('Model.Test',
+                                                 'method_cached')
+                poll.assert_not_called()
+
+            assert t.method_cached() == 2
+            other.registry.cache.cache_clear.assert_called_once_with()
+        finally:
+            other.stop()
+
+        assert other not in LocalCacheInvalidation.subscribers[
+            registry.db_name]
+
+    def test_local_transport_invalidate_all(self):
+        registry = self.init_registry('local')
+        other = LocalCacheInvalidation(OtherRegistry(registry.db_name))
+        other.start()
+        try:
+            registry.System.Cache.invalidate_all()
+            other.registry.cache.cache_clear.assert_called_once_with()
+        finally:
+            other.stop()
+
+    def test_local_transport_invalidate_entries(self):
+        registry = self.init_registry('local')
+        other = LocalCacheInvalidation(OtherRegistry(registry.db_name))
+        other.start()
+        try:
+            registry.System.Cache.invalidate(
+                'Model.Test', 'method_cached', 'a', [1, 2])
+            other.registry.cache.cache_invalidate.assert_called_once_with(
+                'a', (1, 2))
+            other.registry.cache.cache_clear.assert_not_called()
+        finally:
+            other.stop()
+
+    def test_local_transport_of_another_database(self):
+        registry = self.init_registry('local')
+        other = LocalCacheInvalidation(OtherRegistry('other database'))
+        other.start()
+        try:
+            registry.System.Cache.invalidate('Model.Test', 'method_cached')
+            other.registry.cache.cache_clear.assert_not_called()
+        finally:
+            other.stop()
+
+    def test_close_registry_stop_the_transport(self):
+        registry = self.init_registry('local')
+        transport = registry.cache_invalidation
+        registry.close()
+        assert transport.started is False
+        assert registry.cache_invalidation is None
+
+
+@pytest.mark.skipif(not sgdb_in(['PostgreSQL']),
+                    reason='LISTEN / NOTIFY only exists on PostgreSQL')
+class TestPostgreSQLCacheInvalidation:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded):
+
+        def close():
+            if hasattr(self, 'registry'):
+                self.registry.close()
+
+        request.addfinalizer(close)
+
+    def init_registry(self):
+        with tmp_configuration(cache_invalidation_transport='postgresql'):
+            self.registry = init_registry(add_model_with_method_cached)
+
+        return self.registry
+
+    def notify(self, registry, payload):
+        connection = registry.engine.raw_connection()
+        try:
+            connection.connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute('SELECT pg_notify(%s, %s)',
+                           (NOTIFY_CHANNEL, payload))
+            cursor.close()
+        finally:
+            connection.close()
+
+    def test_transport(self):
+        registry = self.init_registry()
+        transport = registry.cache_invalidation
+        assert isinstance(transport, PostgreSQLCacheInvalidation)
+        assert transport.thread.is_alive()
+
+    def test_receive_notification(self):
+        registry = self.init_registry()
+        received = Event()
+        with patch.object(registry.cache_invalidation, 'receive',
+                          side_effect=lambda *a: received.set()) as receive:
+            self.notify(registry, '["Model.Test", "method_cached"]')
+            assert received.wait(5)
+
+        receive.assert_called_once_with('Model.Test', 'method_cached')
+
+    def test_receive_notification_with_args(self):
+        registry = self.init_registry()
+        received = Event()
+        with patch.object(registry.cache_invalidation, 'receive',
+                          side_effect=lambda *a: received.set()) as receive:
+            self.notify(registry, '["Model.Test", "method_cached", [1]]')
+            assert received.wait(5)
+
+        receive.assert_called_once_with('Model.Test', 'method_cached', [1])
+
+    def test_receive_invalid_notification(self):
+        registry = self.init_registry()
+        received = Event()
+        with patch.object(registry.cache_invalidation, 'receive',
+                          side_effect=lambda *a: received.set()) as receive:
+            self.notify(registry, 'invalid')
+            self.notify(registry, '["Model.Test", "method_cached"]')
+            assert received.wait(5)
+
+        receive.assert_called_once_with('Model.Test', 'method_cached')
+
+    def test_publish_in_the_transaction(self):
+        registry = self.init_registry()
+        t = registry.Test()
+        assert t.method_cached() == 1
+        with patch.object(registry.cache_invalidation, 'publish') as publish:
+            registry.System.Cache.invalidate('Model.Test', 'method_cached')
+
+        publish.assert_called_once_with('Model.Test', 'method_cached')
+        assert t.method_cached() == 2
+
+    def test_stop(self):
+        registry = self.init_registry()
+        transport = registry.cache_invalidation
+        thread = transport.thread
+        transport.stop()
+        assert not thread.is_alive()
+        assert transport.connection is None
+        transport.start()
+        assert transport.thread.is_alive()
+
+    def test_start_clears_the_caches(self):
+        registry = self.init_registry()
+        transport = registry.cache_invalidation
+        t = registry.Test()
+        assert t.method_cached() == 1
+        transport.stop()
+        transport.start()
+        # the notifications sent before the LISTEN are lost
+        assert t.method_cached() == 2
+
+    def test_publish_too_long_payload(self):
+        registry = self.init_registry()
+        transport = registry.cache_invalidation
+        args = ['x' * transport.max_payload_size]
+        assert transport.get_payload(
+            'Model.Test', 'method_cached', args) == (
+            '["Model.Test", "method_cached"]')
+        assert transport.get_payload(
+            'Model.Test', 'method_cached', ['x']) == (
+            '["Model.Test", "method_cached", ["x"]]')
+        transport.publish('Model.Test', 'method_cached', args)
+
+    def kill_listener(self, registry):
+        transport = registry.cache_invalidation
+        pid = transport.connection.get_backend_pid()
+        connection = registry.engine.raw_connection()
+        try:
+            connection.connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute('SELECT pg_terminate_backend(%s)', (pid,))
+            cursor.close()
+        finally:
+            connection.close()
+
+        return pid
+
+    def wait(self, condition, timeout=5):
+        end = monotonic() + timeout
+        while not condition():
+            if monotonic() > end:
+                return False
+
+            sleep(0.05)
+
+        return True
+
+    def test_poll_the_table_while_the_listener_is_lost(self):
+        registry = self.init_registry()
+        transport = registry.cache_invalidation
+        transport.reconnect_delay = 60
+        assert registry.System.Cache.checkpoint(interval=0) is False
+        self.kill_listener(registry)
+        assert self.wait(lambda: not transport.is_alive())
+        assert transport.thread.is_alive()
+        with patch.object(registry.System.Cache, 'get_last_id',
+                          return_value=0) as poll:
+            assert registry.System.Cache.checkpoint(interval=0) is True
+            poll.assert_called()
+
+    def test_reconnect_the_lost_listener(self):
+        registry = self.init_registry()
+        transport = registry.cache_invalidation
+        transport.reconnect_delay = 0.1
+        t = registry.Test()
+        assert t.method_cached() == 1
+        pid = self.kill_listener(registry)
+        assert self.wait(
+            lambda: transport.is_alive() and
+            transport.connection.get_backend_pid() != pid)
+        # the notifications sent during the disconnection are lost
+        assert t.method_cached() == 2
+        received = Event()
+        with patch.object(transport, 'receive',
+                          side_effect=lambda *a: received.set()) as receive:
+            self.notify(registry, '["Model.Test", "method_cached"]')
+            assert received.wait(5)
+
+        receive.assert_called_once_with('Model.Test', 'method_cached')
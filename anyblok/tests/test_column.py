@@ -909,6 +909,19 @@ class TestColumns:
         Seq = registry.System.Sequence
         assert Seq.query().filter(Seq.code == 'Model.Test=>col').count() == 1
 
+    @pytest.mark.skipif(sgdb_in(['MySQL', 'MariaDB', 'MsSQL']),
+                        reason='ISSUE #89')
+    @pytest.mark.filterwarnings('error::sqlalchemy.exc.SAWarning')
+    def test_sequence_number_updated_after_the_flush(self):
+        registry = self.init_registry(simple_column, ColumnType=Sequence)
+        registry.Test.insert()
+        registry.Test.insert()
+        registry.flush()
+        registry.expire_all()
+        Seq = registry.System.Sequence
+        seq = Seq.query().filter(Seq.code == 'Model.Test=>col').one()
+        assert seq.number == 2
+
     @pytest.mark.skipif(sgdb_in(['MySQL', 'MariaDB', 'MsSQL']),
                         reason='ISSUE #89')
     def test_sequence_with_primary_key(self):
@@ -7,13 +7,23 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file,You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 import pytest
-from anyblok.column import Integer, String, Selection
+from anyblok.column import (
+    Integer, String, Selection, Sequence, DateTime, Boolean)
 from anyblok.relationship import Many2One, One2One, Many2Many, One2Many
 from anyblok.declarations import Declarations
 from anyblok.bloks.anyblok_core.exceptions import SqlBaseException
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
+from anyblok.testing import tmp_configuration
 from .conftest import init_registry
 
+try:
+    # python 3.4+ should use builtin unittest.mock not mock package
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
 
 Model = Declarations.Model
 register = Declarations.register
@@ -39,6 +49,23 @@ def registry_declare_model(request, bloks_loaded):
     return registry
 
 
+def count_statements(registry, method, *args, **kwargs):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(registry.engine, 'before_cursor_execute',
+                 before_cursor_execute)
+    try:
+        res = method(*args, **kwargs)
+    finally:
+        event.remove(registry.engine, 'before_cursor_execute',
+                     before_cursor_execute)
+
+    return res, len(statements)
+
+
 class TestCoreSQLBase:
 
     @pytest.fixture(autouse=True)
@@ -101,6 +128,46 @@ class TestCoreSQLBase:
         t.delete()
         assert registry.Test.query().get(t.id) is None
 
+    def test_bulk_delete_query(self, registry_declare_model):
+        registry = registry_declare_model
+        registry.Test.multi_insert(*[{'id2': x} for x in range(5)])
+        t = registry.Test.query().filter(registry.Test.id2 == 4).one()
+        assert registry.Test.bulk_delete(registry.Test.query().filter(
+            registry.Test.id2 > 1)) == 3
+        assert registry.Test.query().count() == 2
+        assert t not in registry.session
+
+    def test_bulk_delete_instances(self, registry_declare_model):
+        registry = registry_declare_model
+        t1, t2, t3 = registry.Test.multi_insert(
+            *[{'id2': x} for x in range(3)])
+        assert registry.Test.bulk_delete([t1, t3, t1]) == 2
+        assert registry.Test.query().all() == [t2]
+
+    def test_bulk_delete_by_chunk(self, registry_declare_model):
+        registry = registry_declare_model
+        registry.Test.multi_insert(*[{'id2': x} for x in range(5)])
+        query = registry.Test.query()
+        res, nb = count_statements(
+            registry, registry.Test.bulk_delete, query, chunk_size=2)
+        assert res == 5
+        # one query to get the primary keys and one delete by chunk
+        assert nb == 4
+
+    def test_bulk_delete_nothing(self, registry_declare_model):
+        registry = registry_declare_model
+        assert registry.Test.bulk_delete(registry.Test.query()) == 0
+        assert registry.Test.bulk_delete([]) == 0
+
+    def test_bulk_delete_with_wrong_arguments(self, registry_declare_model):
+        registry = registry_declare_model
+        t = registry.Test.insert(id2=1)
+        with pytest.raises(SqlBaseException):
+            registry.Test.bulk_delete([t], synchronize_session='unknown')
+
+        with pytest.raises(SqlBaseException):
+            registry.Test.bulk_delete([registry.System.Blok.query().first()])
+
     def test_expire(self, registry_declare_model):
         registry = registry_declare_model
         t = registry.Test.insert(id2=2)
@@ -140,6 +207,129 @@ class TestCoreSQLBase:
         assert t.to_primary_keys() == {'id': t.id}
         assert registry.Test.from_primary_keys(id=t.id) == t
 
+    def test_from_primary_keys_in_identity_map(self, registry_declare_model):
+        registry = registry_declare_model
+        t = registry.Test.insert(id2=1)
+        res, nb = count_statements(
+            registry, registry.Test.from_primary_keys, id=t.id)
+        assert res is t
+        assert nb == 0
+
+    def test_from_primary_keys_with_one_query(self, registry_declare_model):
+        registry = registry_declare_model
+        t = registry.Test.insert(id2=1)
+        registry.expunge(t)
+        res, nb = count_statements(
+            registry, registry.Test.from_primary_keys, id=t.id)
+        assert res.id2 == 1
+        assert nb == 1
+        res, nb = count_statements(
+            registry, registry.Test.from_primary_keys, id=-1)
+        assert res is None
+        assert nb == 1
+
+    def test_from_primary_keys_with_none(self, registry_declare_model):
+        registry = registry_declare_model
+        assert registry.Test.from_primary_keys(id=None) is None
+
+    def test_from_primary_keys_with_other_fields(self,
+                                                 registry_declare_model):
+        registry = registry_declare_model
+        t = registry.Test.insert(id2=1)
+        assert registry.Test.from_primary_keys(id=t.id, id2=1) is t
+        assert registry.Test.from_primary_keys(id=t.id, id2=2) is None
+
+    def test_from_primary_keys_without_primary_key(self,
+                                                   registry_declare_model):
+        registry = registry_declare_model
+        with pytest.raises(SqlBaseException):
+            registry.Test.from_primary_keys(id2=1)
+
+    def test_from_deleted_primary_keys(self, registry_declare_model):
+        registry = registry_declare_model
+        t = registry.Test.insert(id2=1)
+        t.delete()
+        assert registry.Test.from_primary_keys(id=t.id) is None
+
+    def test_get_identity_primary_keys(self, registry_declare_model):
+        registry = registry_declare_model
+        assert registry.Test.get_identity_primary_keys() == ['id']
+
+    def test_from_multi_primary_keys(self, registry_declare_model):
+        registry = registry_declare_model
+        t1 = registry.Test.insert(id2=1)
+        t2 = registry.Test.insert(id2=2)
+        registry.expire_all()
+        res, nb = count_statements(
+            registry, registry.Test.from_multi_primary_keys,
+            {'id': t2.id}, {'id': -1}, {'id': t1.id}, {'id': t2.id})
+        assert res == [t2, None, t1, t2]
+        assert isinstance(res, registry.InstrumentedList)
+        assert nb == 1
+        assert registry.Test.from_multi_primary_keys() == []
+
+    def test_from_multi_primary_keys_in_identity_map(self,
+                                                     registry_declare_model):
+        registry = registry_declare_model
+        t1 = registry.Test.insert(id2=1)
+        t2 = registry.Test.insert(id2=2)
+        res, nb = count_statements(
+            registry, registry.Test.from_multi_primary_keys,
+            {'id': t1.id}, {'id': t2.id})
+        assert res == [t1, t2]
+        assert nb == 0
+
+    def test_from_multi_primary_keys_by_chunk(self, registry_declare_model):
+        registry = registry_declare_model
+        ids = [registry.Test.insert(id2=x).id for x in range(5)]
+        registry.expire_all()
+        res, nb = count_statements(
+            registry, registry.Test.from_multi_primary_keys,
+            *[{'id': x} for x in ids], chunk_size=2)
+        assert [x.id for x in res] == ids
+        assert nb == 3
+        registry.expire_all()
+        with tmp_configuration(query_chunk_size=4):
+            res, nb = count_statements(
+                registry, registry.Test.from_multi_primary_keys,
+                *[{'id': x} for x in ids])
+
+        assert nb == 2
+
+    def test_from_primary_keys_with_string_ids(self,
+                                               registry_declare_model):
+        registry = registry_declare_model
+        t1 = registry.Test.insert(id2=1)
+        t2 = registry.Test.insert(id2=2)
+        res, nb = count_statements(
+            registry, registry.Test.from_primary_keys, id=str(t1.id))
+        assert res is t1
+        assert nb == 0
+        res, nb = count_statements(
+            registry, registry.Test.from_multi_primary_keys,
+            {'id': str(t1.id)}, {'id': str(t2.id)})
+        assert res == [t1, t2]
+        assert nb == 0
+        id1, id2 = t1.id, t2.id
+        registry.expire_all()
+        res, nb = count_statements(
+            registry, registry.Test.from_multi_primary_keys,
+            {'id': str(id2)}, {'id': float(id1)})
+        assert res == [t2, t1]
+        assert nb == 1
+
+    def test_from_multi_primary_keys_with_other_fields(
+        self, registry_declare_model
+    ):
+        registry = registry_declare_model
+        t = registry.Test.insert(id2=1)
+        res = registry.Test.from_multi_primary_keys(
+            {'id': t.id, 'id2': 1}, {'id': t.id, 'id2': 2})
+        assert res == [t, None]
+        assert isinstance(res, registry.InstrumentedList)
+        with pytest.raises(SqlBaseException):
+            registry.Test.from_multi_primary_keys({'id2': 1})
+
     def test_expire_with_column_selection(self, registry_declare_model):
         registry = registry_declare_model
         t = registry.Test.insert()
@@ -148,6 +338,321 @@ class TestCoreSQLBase:
         assert t.select == 'key'
 
 
+def declare_model_with_composite_primary_keys():
+
+    @register(Model)
+    class Test:
+        id = Integer(primary_key=True)
+        code = String(primary_key=True)
+        value = Integer()
+
+
+@pytest.fixture(scope="class")
+def registry_declare_model_with_composite_primary_keys(request,
+                                                       bloks_loaded):
+    registry = init_registry(declare_model_with_composite_primary_keys)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+class TestCoreSQLBaseCompositePrimaryKeys:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request,
+                 registry_declare_model_with_composite_primary_keys):
+        registry = registry_declare_model_with_composite_primary_keys
+        transaction = registry.begin_nested()
+        request.addfinalizer(transaction.rollback)
+        self.registry = registry
+
+    def insert(self):
+        Test = self.registry.Test
+        t1 = Test.insert(id=1, code='a', value=1)
+        t2 = Test.insert(id=1, code='b', value=2)
+        t3 = Test.insert(id=2, code='a', value=3)
+        self.registry.expire_all()
+        return t1, t2, t3
+
+    def test_from_primary_keys(self):
+        t1, t2, t3 = self.insert()
+        assert self.registry.Test.from_primary_keys(id=1, code='b') is t2
+        assert self.registry.Test.from_primary_keys(id=2, code='b') is None
+
+    def test_from_multi_primary_keys(self):
+        t1, t2, t3 = self.insert()
+        assert self.registry.Test.from_multi_primary_keys(
+            {'id': 2, 'code': 'a'}, {'id': 2, 'code': 'b'},
+            {'code': 'b', 'id': 1}) == [t3, None, t2]
+
+    def test_from_multi_primary_keys_with_string_ids(self):
+        t1, t2, t3 = self.insert()
+        assert self.registry.Test.from_multi_primary_keys(
+            {'id': '2', 'code': 'a'}, {'id': '1', 'code': 'b'}) == [t3, t2]
+
+    def test_from_multi_primary_keys_without_tuple_in(self):
+        t1, t2, t3 = self.insert()
+        Test = self.registry.Test
+        with patch.object(Test, 'tuple_in_dialects', ()):
+            assert Test.from_multi_primary_keys(
+                {'id': 1, 'code': 'a'}, {'id': 2, 'code': 'a'},
+                chunk_size=1) == [t1, t3]
+
+    def test_where_clause_from_identities(self):
+        Test = self.registry.Test
+        where_clause = str(Test.get_where_clause_from_identities(
+            ['id', 'code'], [(1, 'a'), (2, 'b')]))
+        assert ' IN ' in where_clause
+        with patch.object(Test, 'tuple_in_dialects', ()):
+            where_clause = str(Test.get_where_clause_from_identities(
+                ['id', 'code'], [(1, 'a'), (2, 'b')]))
+
+        assert ' OR ' in where_clause
+
+
+def declare_model_with_query_criterion():
+
+    @register(Model)
+    class Test:
+        id = Integer(primary_key=True)
+        active = Boolean(default=True)
+
+        @classmethod
+        def query(cls, *elements):
+            query = super(Test, cls).query(*elements)
+            return query.filter(cls.active.is_(True))
+
+
+@pytest.fixture(scope="class")
+def registry_declare_model_with_query_criterion(request, bloks_loaded):
+    registry = init_registry(declare_model_with_query_criterion)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+class TestCoreSQLBaseQueryCriterion:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_declare_model_with_query_criterion):
+        registry = registry_declare_model_with_query_criterion
+        transaction = registry.begin_nested()
+        request.addfinalizer(transaction.rollback)
+        self.registry = registry
+
+    def test_from_primary_keys(self):
+        Test = self.registry.Test
+        t1 = Test.insert()
+        t2 = Test.insert(active=False)
+        assert Test.from_primary_keys(id=t1.id) is t1
+        self.registry.expunge(t1)
+        self.registry.expunge(t2)
+        assert Test.from_primary_keys(id=t1.id).id == t1.id
+        assert Test.from_primary_keys(id=t2.id) is None
+
+
+def declare_model_for_bulk():
+
+    @register(Model)
+    class Test:
+        id = Integer(primary_key=True)
+        name = String(default='default')
+        value = Integer(db_column_name='other_value')
+        number = Sequence(formater='N{seq}')
+        update_date = DateTime(auto_update=True)
+
+    @register(Model)
+    class Test2:
+        id = Integer(primary_key=True)
+        code = String(primary_key=True)
+        value = Integer()
+
+
+@pytest.fixture(scope="class")
+def registry_declare_model_for_bulk(request, bloks_loaded):
+    registry = init_registry(declare_model_for_bulk)
+    request.addfinalizer(registry.close)
+    return registry
+
+
+class TestCoreSQLBaseBulkInsert:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_declare_model_for_bulk):
+        registry = registry_declare_model_for_bulk
+        transaction = registry.begin_nested()
+        request.addfinalizer(transaction.rollback)
+        self.registry = registry
+
+    def test_bulk_insert(self):
+        Test = self.registry.Test
+        instances = Test.multi_insert(
+            {'name': 'a', 'value': 1}, {'value': 2}, {'name': 'c'},
+            bulk=True)
+        assert [(x.name, x.value) for x in instances] == [
+            ('a', 1), ('default', 2), ('c', None)]
+        assert len(set(x.number for x in instances)) == 3
+        assert all(x.number.startswith('N') for x in instances)
+        assert Test.query().count() == 3
+
+    def test_bulk_insert_return_primary_keys(self):
+        Test = self.registry.Test
+        pks = Test.multi_insert({'value': 1}, {'value': 2}, bulk=True,
+                                return_instances=False)
+        assert [Test.from_primary_keys(**x).value for x in pks] == [1, 2]
+
+    def test_bulk_insert_by_chunk(self):
+        registry = self.registry
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if statement.startswith('INSERT INTO test '):
+                statements.append(statement)
+
+        event.listen(registry.engine, 'before_cursor_execute',
+                     before_cursor_execute)
+        try:
+            pks = registry.Test.multi_insert(
+                *[{'value': x} for x in range(5)], bulk=True,
+                return_instances=False, chunk_size=2)
+        finally:
+            event.remove(registry.engine, 'before_cursor_execute',
+                         before_cursor_execute)
+
+        assert len(pks) == 5
+        assert len(statements) == 3
+
+    def test_bulk_insert_with_the_primary_keys(self):
+        Test2 = self.registry.Test2
+        pks = Test2.multi_insert({'id': 1, 'code': 'a'},
+                                 {'id': 2, 'code': 'b'}, bulk=True,
+                                 return_instances=False)
+        assert pks == [{'id': 1, 'code': 'a'}, {'id': 2, 'code': 'b'}]
+        assert Test2.query().count() == 2
+
+    def test_bulk_insert_without_returning(self):
+        Test, Test2 = self.registry.Test, self.registry.Test2
+        with patch.object(self.registry.engine.dialect, 'implicit_returning',
+                          False):
+            pks = Test.multi_insert({'value': 1}, {}, bulk=True,
+                                    return_instances=False)
+            pks2 = Test2.multi_insert({'id': 1, 'code': 'a'}, bulk=True,
+                                      return_instances=False)
+
+        assert [Test.from_primary_keys(**x).value for x in pks] == [1, None]
+        assert pks2 == [{'id': 1, 'code': 'a'}]
+
+    def test_bulk_insert_format_the_values(self):
+        Test = self.registry.Test
+        field = self.registry.loaded_namespaces_first_step[
+            'Model.Test']['value']
+        with patch.object(field, 'setter_format_value',
+                          side_effect=lambda value: value * 10):
+            instances = Test.multi_insert({'value': 1}, bulk=True)
+
+        assert instances[0].value == 10
+
+    def test_bulk_insert_unknown_column(self):
+        with pytest.raises(SqlBaseException):
+            self.registry.Test.multi_insert({'unknown': 1}, bulk=True)
+
+    def test_bulk_insert_nothing(self):
+        assert self.registry.Test.multi_insert(bulk=True) == []
+
+    def test_multi_insert_return_primary_keys(self):
+        Test2 = self.registry.Test2
+        assert Test2.multi_insert({'id': 1, 'code': 'a'},
+                                  return_instances=False) == [
+            {'id': 1, 'code': 'a'}]
+
+
+@pytest.mark.filterwarnings('error::sqlalchemy.exc.SAWarning')
+class TestCoreSQLBaseBulkUpdate:
+
+    @pytest.fixture(autouse=True)
+    def transact(self, request, registry_declare_model_for_bulk):
+        registry = registry_declare_model_for_bulk
+        transaction = registry.begin_nested()
+        request.addfinalizer(transaction.rollback)
+        self.registry = registry
+
+    def test_bulk_update(self):
+        Test = self.registry.Test
+        t1, t2, t3 = Test.multi_insert({'name': 't1'}, {'name': 't2'},
+                                       {'name': 't3'})
+        assert Test.bulk_update([
+            {'id': t1.id, 'name': 'a', 'value': 1},
+            {'id': t2.id, 'value': 2},
+            {'id': t3.id, 'name': 'c', 'value': 3},
+        ]) == 3
+        assert [(x.name, x.value) for x in (t1, t2, t3)] == [
+            ('a', 1), ('t2', 2), ('c', 3)]
+        assert all(x.update_date is not None for x in (t1, t2, t3))
+
+    def test_bulk_update_by_group_of_columns(self):
+        registry = self.registry
+        pks = registry.Test.multi_insert(
+            *[{'value': x} for x in range(5)], bulk=True,
+            return_instances=False)
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if statement.startswith('UPDATE test '):
+                statements.append(statement)
+
+        event.listen(registry.engine, 'before_cursor_execute',
+                     before_cursor_execute)
+        try:
+            registry.Test.bulk_update(
+                [dict(name=str(i), **pk) for i, pk in enumerate(pks[:3])] +
+                [dict(value=10, **pk) for pk in pks[3:]])
+        finally:
+            event.remove(registry.engine, 'before_cursor_execute',
+                         before_cursor_execute)
+
+        assert len(statements) == 2
+        assert [x.value for x in registry.Test.from_multi_primary_keys(
+            *pks)] == [0, 1, 2, 10, 10]
+
+    def test_bulk_update_with_string_ids(self):
+        Test = self.registry.Test
+        t1, t2 = Test.multi_insert({'value': 1}, {'value': 2})
+        assert Test.bulk_update([
+            {'id': str(t1.id), 'value': 3},
+            {'id': float(t2.id), 'value': 4},
+        ]) == 2
+        assert (t1.value, t2.value) == (3, 4)
+
+    def test_bulk_update_composite_primary_keys(self):
+        Test2 = self.registry.Test2
+        t1 = Test2.insert(id=1, code='a', value=1)
+        t2 = Test2.insert(id=1, code='b', value=2)
+        assert Test2.bulk_update([{'id': 1, 'code': 'b', 'value': 3}]) == 1
+        assert (t1.value, t2.value) == (1, 3)
+
+    def test_bulk_update_format_the_values(self):
+        Test = self.registry.Test
+        t = Test.insert(value=1)
+        field = self.registry.loaded_namespaces_first_step[
+            'Model.Test']['value']
+        with patch.object(field, 'setter_format_value',
+                          side_effect=lambda value: value * 10):
+            Test.bulk_update([{'id': t.id, 'value': 2}])
+
+        assert t.value == 20
+
+    def test_bulk_update_without_primary_key(self):
+        with pytest.raises(SqlBaseException):
+            self.registry.Test.bulk_update([{'name': 'a'}])
+
+    def test_bulk_update_unknown_column(self):
+        t = self.registry.Test.insert()
+        with pytest.raises(SqlBaseException):
+            self.registry.Test.bulk_update([{'id': t.id, 'unknown': 1}])
+
+    def test_bulk_update_nothing(self):
+        t = self.registry.Test.insert()
+        assert self.registry.Test.bulk_update([{'id': t.id}]) == 0
+
+
 def declare_model_with_m2o():
 
     @register(Model)
@@ -279,6 +784,67 @@ class TestCoreSQLBaseM2O:
         with pytest.raises(SqlBaseException):
             t2.to_dict('name', ())
 
+    def test_bulk_update_m2o(self, registry_declare_model_with_m2o):
+        registry = registry_declare_model_with_m2o
+        t1 = registry.Test.insert(name='t1')
+        t2 = registry.Test2.insert(name='t2', test=t1)
+        t3 = registry.Test.insert(name='t3')
+        assert t1.test2 == [t2]
+        assert t2.test is t1
+        assert t3.test2 == []
+        registry.Test2.bulk_update([{'id': t2.id, 'test_id': t3.id}])
+        assert t1.test2 == []
+        assert t2.test is t3
+        assert t3.test2 == [t2]
+
+    def insert_for_bulk_delete(self, registry):
+        t1 = registry.Test.insert(name='t1')
+        t2 = registry.Test2.insert(name='t2', test=t1)
+        t3 = registry.Test2.insert(name='t3', test=t1)
+        assert t1.test2 == [t2, t3]
+        return t1, t2, t3
+
+    def test_bulk_delete_m2o_expire(self, registry_declare_model_with_m2o):
+        registry = registry_declare_model_with_m2o
+        t1, t2, t3 = self.insert_for_bulk_delete(registry)
+        assert registry.Test2.bulk_delete([t2]) == 1
+        assert t2 not in registry.session
+        res, nb = count_statements(registry, getattr, t1, 'test2')
+        assert res == [t3]
+        assert nb == 1
+
+    def test_bulk_delete_m2o_remove(self, registry_declare_model_with_m2o):
+        registry = registry_declare_model_with_m2o
+        t1, t2, t3 = self.insert_for_bulk_delete(registry)
+        registry.Test2.bulk_delete([t2], synchronize_session='remove')
+        res, nb = count_statements(registry, getattr, t1, 'test2')
+        assert res == [t3]
+        assert nb == 0
+
+    def test_bulk_delete_m2o_error(self, registry_declare_model_with_m2o):
+        registry = registry_declare_model_with_m2o
+        t1, t2, t3 = self.insert_for_bulk_delete(registry)
+        assert t2.test is t1
+        with pytest.raises(IntegrityError):
+            registry.Test.bulk_delete([t1])
+
+        # the session is not synchronized with the failed DELETE
+        assert t1 in registry.session
+        res, nb = count_statements(registry, getattr, t2, 'test')
+        assert res is t1
+        assert nb == 0
+
+    def test_bulk_delete_m2o_without_synchronize(
+        self, registry_declare_model_with_m2o
+    ):
+        registry = registry_declare_model_with_m2o
+        t1, t2, t3 = self.insert_for_bulk_delete(registry)
+        registry.Test2.bulk_delete([t2], synchronize_session=False)
+        assert t1.test2 == [t2, t3]
+        registry.expunge(t2)
+        t1.expire()
+        assert t1.test2 == [t3]
+
     def test_refresh_update_m2o(self, registry_declare_model_with_m2o):
         registry = registry_declare_model_with_m2o
         t1 = registry.Test.insert(name='t1')
@@ -357,6 +923,25 @@ class TestCoreSQLBaseM2O:
         assert registry.Test2.getFieldType('test') == 'Many2One'
         assert registry.Test.getFieldType('test2') == 'One2Many'
 
+    def test_getFieldType_unknown_field(self, registry_declare_model_with_m2o):
+        registry = registry_declare_model_with_m2o
+        with pytest.raises(NoResultFound):
+            registry.Test.getFieldType('unknown')
+
+    def test_metadata_without_query(self, registry_declare_model_with_m2o):
+        registry = registry_declare_model_with_m2o
+        registry.System.Cache.invalidate_all()
+        # the index of the fields is read again after the invalidation,
+        # the methods of the metadata use it without query
+        registry.System.Model.get_fields_metadata()
+        with patch.object(registry.System.Field, 'query',
+                          side_effect=Exception('No query')):
+            assert registry.Test2.get_primary_keys() == ['id']
+            assert registry.Test2.getFieldType('test') == 'Many2One'
+            fd = registry.Test.fields_description()
+            assert fd['test2']['type'] == 'One2Many'
+            assert fd['test2']['model'] == 'Model.Test2'
+
     def test_repr_m2o(self, registry_declare_model_with_m2o):
         registry = registry_declare_model_with_m2o
         t1 = registry.Test.insert(name='t1')
@@ -658,6 +1243,19 @@ class TestCoreSQLBasem2m:
                                      'id': t2.id,
                                      'test': [{'id': t1.id}]}]}
 
+    def test_bulk_delete_m2m(self, registry_declare_model_with_m2m):
+        registry = registry_declare_model_with_m2m
+        t1 = registry.Test.insert(name='t1')
+        t2 = registry.Test2.insert(name='t2')
+        t3 = registry.Test2.insert(name='t3')
+        t2.test.append(t1)
+        t3.test.append(t1)
+        assert t1.test2 == [t2, t3]
+        assert registry.Test2.bulk_delete([t2]) == 1
+        assert t1.test2 == [t3]
+        assert registry.Test.bulk_delete([t1]) == 1
+        assert t3.test == []
+
     def test_refresh_update_m2m(self, registry_declare_model_with_m2m):
         registry = registry_declare_model_with_m2m
         t1 = registry.Test.insert(name='t1')
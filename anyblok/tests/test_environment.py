@@ -67,6 +67,11 @@ class TestEnvironment:
         wanted = MockEnvironment.scoped_function_for_session
         assert getted == wanted
 
+    def test_reset_without_reset_method(self):
+        EnvironmentManager.set('db_name', 'test db name')
+        EnvironmentManager.reset()
+        assert EnvironmentManager.get('db_name') == 'test db name'
+
     def check_bad_define_environment(self, env):
         try:
             EnvironmentManager.define_environment_cls(env)
@@ -165,3 +170,12 @@ class TestThreadEnvironment:
 
     def test_scoped_function_session(self):
         assert EnvironmentManager.scoped_function_for_session() is None
+
+    def test_reset(self):
+        values = {x: y.copy() for x, y in ThreadEnvironment.values.items()}
+        try:
+            EnvironmentManager.set('db_name', 'test db name')
+            EnvironmentManager.reset()
+            assert EnvironmentManager.get('db_name') is None
+        finally:
+            ThreadEnvironment.values.update(values)
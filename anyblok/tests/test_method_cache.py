@@ -0,0 +1,334 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2019 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import gc
+import weakref
+import pytest
+from anyblok.cache import (
+    MethodCache, InstanceMethodCache, LRUMethodCache, CacheException,
+    FIFOPolicy, get_size, get_method_cache, invalidation_cause)
+
+try:
+    # python 3.4+ should use builtin unittest.mock not mock package
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+
+class Counter:
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, value, size=1):
+        self.calls += 1
+        return [value] * size
+
+
+class TestMethodCache:
+
+    def test_cache(self):
+        counter = Counter()
+        method_cache = MethodCache(counter)
+        assert method_cache(1) == [1]
+        assert method_cache(1) == [1]
+        assert method_cache(2) == [2]
+        assert counter.calls == 2
+        info = method_cache.cache_info()
+        assert info['hits'] == 1
+        assert info['misses'] == 2
+        assert info['currsize'] == 2
+
+    def test_cache_with_kwargs(self):
+        counter = Counter()
+        method_cache = MethodCache(counter)
+        assert method_cache(1, size=2) == [1, 1]
+        assert method_cache(1, size=2) == [1, 1]
+        assert method_cache(1) == [1]
+        assert counter.calls == 2
+
+    def test_cache_clear(self):
+        counter = Counter()
+        method_cache = MethodCache(counter)
+        method_cache(1)
+        method_cache.cache_clear()
+        method_cache(1)
+        assert counter.calls == 2
+        assert method_cache.cache_info()['currsize'] == 1
+
+    def test_lru_eviction(self):
+        counter = Counter()
+        method_cache = MethodCache(counter, size=2)
+        method_cache(1)
+        method_cache(2)
+        method_cache(1)
+        method_cache(3)
+        assert list(method_cache.entries) == [(1,), (3,)]
+        assert method_cache.cache_info()['evictions'] == 1
+
+    def test_fifo_eviction(self):
+        counter = Counter()
+        method_cache = MethodCache(counter, size=2, policy='fifo')
+        assert isinstance(method_cache.policy, FIFOPolicy)
+        method_cache(1)
+        method_cache(2)
+        method_cache(1)
+        method_cache(3)
+        assert list(method_cache.entries) == [(2,), (3,)]
+
+    def test_unknown_policy(self):
+        with pytest.raises(CacheException):
+            MethodCache(Counter(), policy='unknown')
+
+    def test_ttl(self):
+        counter = Counter()
+        method_cache = MethodCache(counter, ttl=10)
+        with patch('anyblok.cache.monotonic', return_value=100):
+            method_cache(1)
+            method_cache(1)
+
+        assert counter.calls == 1
+        with patch('anyblok.cache.monotonic', return_value=111):
+            method_cache(1)
+
+        assert counter.calls == 2
+        assert method_cache.cache_info()['expirations'] == 1
+
+    def test_max_bytes(self):
+        counter = Counter()
+        max_bytes = get_size([1] * 10) * 2
+        method_cache = MethodCache(counter, max_bytes=max_bytes)
+        method_cache(1, size=10)
+        method_cache(2, size=10)
+        assert method_cache.cache_info()['bytes'] <= max_bytes
+        method_cache(3, size=10)
+        info = method_cache.cache_info()
+        assert info['bytes'] <= max_bytes
+        assert info['evictions'] == 1
+        assert info['currsize'] == 2
+
+    def test_result_bigger_than_max_bytes(self):
+        counter = Counter()
+        method_cache = MethodCache(counter, max_bytes=get_size([1]))
+        method_cache(1, size=100)
+        method_cache(1, size=100)
+        assert counter.calls == 2
+        assert method_cache.cache_info()['currsize'] == 0
+
+    def test_cache_invalidate(self):
+
+        def method(cls, value, size=1):
+            return [value] * size
+
+        method_cache = MethodCache(method)
+        method_cache('cls1', 1)
+        method_cache('cls2', 1)
+        method_cache('cls1', 2)
+        method_cache('cls1', 1, size=2)
+        method_cache.cache_invalidate(1)
+        assert list(method_cache.entries) == [
+            ('cls1', 2), ('cls1', 1) + MethodCache.kwd_mark + (('size', 2),)]
+        method_cache.cache_invalidate(1, size=2)
+        assert list(method_cache.entries) == [('cls1', 2)]
+
+    def test_record_invalidation(self):
+        method_cache = MethodCache(Counter())
+        assert method_cache.last_invalidation is None
+        method_cache.cache_clear()
+        assert method_cache.last_invalidation['cause'] == 'cache_clear'
+        assert method_cache.last_invalidation['args'] is None
+        with invalidation_cause('test'):
+            method_cache.cache_invalidate(1)
+
+        assert method_cache.last_invalidation['cause'] == 'test'
+        assert method_cache.last_invalidation['args'] == (1,)
+        assert method_cache.cache_info()['invalidations'] == 2
+
+    def test_cache_memory(self):
+        method_cache = MethodCache(Counter())
+        method_cache(1, size=10)
+        assert method_cache.cache_info()['bytes'] == 0
+        assert method_cache.cache_memory() == get_size([1] * 10)
+        method_cache = MethodCache(Counter(), max_bytes=1024)
+        method_cache(1, size=10)
+        assert method_cache.cache_memory() == get_size([1] * 10)
+
+    def test_bound_method(self):
+
+        class Test:
+
+            def __init__(self):
+                self.calls = 0
+
+            def method(self, value):
+                self.calls += 1
+                return value
+
+            method_cached = MethodCache(method)
+
+        t = Test()
+        assert t.method_cached(1) == 1
+        assert t.method_cached(1) == 1
+        assert t.calls == 1
+        assert Test.method_cached.__name__ == 'method'
+
+
+class State:
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+
+
+class Instance:
+
+    def __init__(self, session_id=None):
+        self.calls = 0
+        if session_id is not None:
+            self._sa_instance_state = State(session_id)
+
+    def method(self, value):
+        self.calls += 1
+        return [value]
+
+    method_cached = InstanceMethodCache(method, size=2)
+
+
+class TestInstanceMethodCache:
+
+    def test_cache_by_instance(self):
+        t1, t2 = Instance(), Instance()
+        assert t1.method_cached(1) == [1]
+        assert t1.method_cached(1) == [1]
+        assert t2.method_cached(1) == [1]
+        assert t1.calls == 1
+        assert t2.calls == 1
+        assert Instance.method_cached.entries == {}
+
+    def test_size_by_instance(self):
+        t1, t2 = Instance(), Instance()
+        for value in (1, 2, 3):
+            t1.method_cached(value)
+            t2.method_cached(value)
+
+        assert len(Instance.method_cached.get_store(t1).entries) == 2
+        assert len(Instance.method_cached.get_store(t2).entries) == 2
+
+    def test_instance_is_not_kept_alive(self):
+        t = Instance()
+        t.method_cached(1)
+        ref = weakref.ref(t)
+        del t
+        gc.collect()
+        assert ref() is None
+
+    def test_cache_clear(self):
+        t = Instance()
+        t.method_cached(1)
+        Instance.method_cached.cache_clear()
+        t.method_cached(1)
+        assert t.calls == 2
+
+    def test_cache_invalidate(self):
+        t1, t2 = Instance(), Instance()
+        for value in (1, 2):
+            t1.method_cached(value)
+            t2.method_cached(value)
+
+        Instance.method_cached.cache_invalidate(1)
+        assert list(Instance.method_cached.get_store(t1).entries) == [(2,)]
+        assert list(Instance.method_cached.get_store(t2).entries) == [(2,)]
+        t1.method_cached(1)
+        t1.method_cached(2)
+        assert t1.calls == 3
+
+    def test_cache_dropped_when_the_session_changes(self):
+        t = Instance(session_id=1)
+        t.method_cached(1)
+        t.method_cached(1)
+        assert t.calls == 1
+        t._sa_instance_state.session_id = None
+        t.method_cached(1)
+        assert t.calls == 2
+
+    def test_cache_info(self):
+        method_cache = InstanceMethodCache(Instance.method)
+        t1, t2 = Instance(), Instance()
+        method_cache(t1, 1)
+        method_cache(t1, 2)
+        method_cache(t2, 1)
+        method_cache(t2, 1)
+        info = method_cache.cache_info()
+        assert info['currsize'] == 3
+        assert info['hits'] == 1
+        assert info['misses'] == 3
+        del t1
+        gc.collect()
+        assert method_cache.cache_info()['currsize'] == 1
+
+
+class TestLRUMethodCache:
+
+    def test_cache(self):
+        counter = Counter()
+        method_cache = LRUMethodCache(counter, size=2)
+        assert method_cache(1) == [1]
+        assert method_cache(1) == [1]
+        assert method_cache(2) == [2]
+        assert method_cache(3) == [3]
+        assert counter.calls == 3
+        info = method_cache.cache_info()
+        assert info['hits'] == 1
+        assert info['misses'] == 3
+        assert info['currsize'] == 2
+        assert info['evictions'] == 1
+
+    def test_cache_invalidate(self):
+        calls = []
+
+        def method(cls, value, size=1):
+            calls.append(value)
+            return [value] * size
+
+        method_cache = LRUMethodCache(method)
+        method_cache('cls1', 1)
+        method_cache('cls2', 1)
+        method_cache('cls1', 2)
+        method_cache('cls1', 1, size=2)
+        method_cache.cache_invalidate(1)
+        # only the entries of the arguments are invalidated, whatever the
+        # first argument
+        method_cache('cls1', 1)
+        method_cache('cls2', 1)
+        method_cache('cls1', 2)
+        method_cache('cls1', 1, size=2)
+        assert calls == [1, 1, 2, 1, 1, 1]
+        info = method_cache.cache_info()
+        assert info['hits'] == 2
+        assert info['misses'] == 6
+        assert info['invalidations'] == 1
+        assert method_cache.last_invalidation['args'] == (1,)
+
+    def test_cache_clear_after_invalidate(self):
+        counter = Counter()
+        method_cache = LRUMethodCache(counter)
+        method_cache('cls', 1)
+        method_cache.cache_invalidate(1)
+        method_cache.cache_clear()
+        assert method_cache.versions == {}
+        method_cache('cls', 1)
+        method_cache('cls', 1)
+        assert counter.calls == 2
+        assert method_cache.cache_info()['currsize'] == 1
+
+    def test_get_method_cache(self):
+        assert type(get_method_cache(Counter())) is LRUMethodCache
+        for options in (dict(ttl=60), dict(max_bytes=1024),
+                        dict(policy='fifo')):
+            assert type(get_method_cache(Counter(), **options)) is MethodCache
+
+        assert type(get_method_cache(
+            Counter(), per_instance=True)) is InstanceMethodCache
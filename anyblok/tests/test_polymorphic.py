@@ -118,6 +118,38 @@ class TestMultiTablePoly:
             employee = query.one()
             assert isinstance(employee, registry.Engineer)
 
+    def test_from_primary_keys(self, registry_multi_table_poly):
+        registry = registry_multi_table_poly
+        engineer = registry.Engineer.insert(name='engineer',
+                                            engineer_name='john')
+        assert registry.Engineer.get_identity_primary_keys() == ['id']
+        assert registry.Employee.from_primary_keys(id=engineer.id) is engineer
+        assert registry.Engineer.from_primary_keys(id=engineer.id) is engineer
+        assert registry.Manager.from_primary_keys(id=engineer.id) is None
+        registry.expunge(engineer)
+        employee = registry.Employee.from_primary_keys(id=engineer.id)
+        assert isinstance(employee, registry.Engineer)
+        assert employee.engineer_name == 'john'
+
+    def test_bulk_update(self, registry_multi_table_poly):
+        registry = registry_multi_table_poly
+        engineer = registry.Engineer.insert(name='engineer',
+                                            engineer_name='john')
+        assert registry.Engineer.bulk_update([
+            {'id': engineer.id, 'name': 'other', 'engineer_name': 'doe'},
+            {'id': engineer.id + 1, 'name': 'missing'}]) == 1
+        registry.expire(engineer)
+        assert engineer.name == 'other'
+        assert engineer.engineer_name == 'doe'
+
+    def test_bulk_delete(self, registry_multi_table_poly):
+        registry = registry_multi_table_poly
+        registry.Engineer.insert(name='engineer', engineer_name='john')
+        registry.Manager.insert(name='manager', manager_name='doe')
+        assert registry.Engineer.bulk_delete(registry.Engineer.query()) == 1
+        assert registry.Employee.query().count() == 1
+        assert registry.Engineer.query().count() == 0
+
     def test_getFieldType(self, registry_multi_table_poly):
         registry = registry_multi_table_poly
         assert registry.Employee.getFieldType('id') == 'Integer'
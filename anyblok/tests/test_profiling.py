@@ -0,0 +1,118 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2019 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import json
+import pytest
+from anyblok.profiling import RegistryLoadingReport
+from anyblok.testing import tmp_configuration
+from .conftest import init_registry
+
+
+class TestRegistryLoadingReport:
+
+    def test_disabled(self):
+        report = RegistryLoadingReport('test')
+        with report.phase('load', root=True):
+            pass
+
+        assert report.enabled is False
+        assert report.last_report == []
+
+    def test_phases(self, tmpdir):
+        path = tmpdir.join('report.json')
+        report = RegistryLoadingReport('test', report_format='json',
+                                       report_file=str(path))
+        with report.phase('load', root=True):
+            for blok in ('blok1', 'blok2', 'blok1'):
+                with report.phase('load_blok', blok):
+                    pass
+
+        rows = {(x['phase'], x['name']): x for x in report.last_report}
+        assert report.last_report[0]['phase'] == 'load'
+        assert rows[('load_blok', 'blok1')]['count'] == 2
+        assert rows[('load_blok', 'blok2')]['count'] == 1
+        assert report.phases == {}
+        data = json.loads(path.read())
+        assert data['db_name'] == 'test'
+        assert len(data['phases']) == 3
+
+    def test_phase_outside_the_report(self, tmpdir):
+        path = tmpdir.join('report.json')
+        report = RegistryLoadingReport('test', report_format='json',
+                                       report_file=str(path))
+        with report.phase('initialize_model', 'Model.Test'):
+            pass
+
+        assert report.phases == {}
+        assert report.last_report == []
+        assert not path.exists()
+
+    def test_table(self, tmpdir):
+        path = tmpdir.join('report.txt')
+        report = RegistryLoadingReport('test', report_format='table',
+                                       report_file=str(path))
+        with report.phase('load', root=True):
+            pass
+
+        assert 'Duration (s)' in path.read()
+
+    def test_exception_in_phase(self):
+        report = RegistryLoadingReport('test', report_format='json',
+                                       report_file='/dev/null')
+        with pytest.raises(Exception):
+            with report.phase('load', root=True):
+                raise Exception('test')
+
+        assert report.depth == 0
+        assert report.last_report[0]['phase'] == 'load'
+
+
+class TestRegistryLoadingReportWithRegistry:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded):
+
+        def close():
+            if hasattr(self, 'registry'):
+                self.registry.close()
+
+        request.addfinalizer(close)
+
+    def test_report(self, tmpdir):
+        path = tmpdir.join('report.json')
+        with tmp_configuration(registry_load_report='json',
+                               registry_load_report_file=str(path)):
+            self.registry = init_registry(None)
+
+        phases = {(x['phase'], x['name'])
+                  for x in json.loads(path.read())['phases']}
+        for phase in [('load', None), ('get_bloks_to_load', None),
+                      ('load_blok', 'anyblok-core'),
+                      ('assemble_entries', 'Model'),
+                      ('call_plugins',
+                       'HybridMethodPlugin.transform_base_attribute'),
+                      ('create_session_factory', None),
+                      ('apply_model_schema_on_table', None),
+                      ('initialize_entries', 'Model'),
+                      ('initialize_model', 'Model.System.Blok')]:
+            assert phase in phases
+
+    def test_lazy_assembly_not_reported(self, tmpdir):
+        path = tmpdir.join('report.json')
+        with tmp_configuration(registry_load_report='json',
+                               registry_load_report_file=str(path),
+                               lazy_assembly=True):
+            self.registry = init_registry(None)
+            self.registry.loadwithoutmigration = True
+            self.registry.reload()
+
+        assert 'Model.System.Parameter' in self.registry.lazy_namespaces
+        path.remove()
+        self.registry.System.Parameter.set('lazy', 1)
+        assert 'Model.System.Parameter' in self.registry.loaded_namespaces
+        assert not path.exists()
+        assert self.registry.loading_report.phases == {}
@@ -9,21 +9,25 @@
 # obtain one at http://mozilla.org/MPL/2.0/.
 import pytest
 from .conftest import init_registry
-from anyblok.testing import TestCase, LogCapture
-from anyblok.registry import RegistryManager
+from anyblok.testing import TestCase, LogCapture, tmp_configuration
+from anyblok.registry import RegistryManager, RegistryException
 from anyblok.config import Configuration
+from anyblok.environment import EnvironmentManager, ThreadEnvironment
+from anyblok.migration import Migration
 from anyblok.blok import BlokManager, Blok
 from anyblok.column import Integer
-from anyblok import start
+from anyblok.relationship import Many2One
+from copy import deepcopy
+from anyblok import start, Declarations
 from threading import Thread
 from logging import ERROR
 import sys
 
 try:
     # python 3.4+ should use builtin unittest.mock not mock package
-    from unittest.mock import patch
+    from unittest.mock import patch, Mock
 except ImportError:
-    from mock import patch
+    from mock import patch, Mock
 
 
 class Test:
@@ -78,6 +82,36 @@ class TestRegistry:
             registry.System.Blok.state == 'installed').all()
         assert bloks_before_reload == bloks_after_reload
 
+    def test_before_fork(self):
+        registry = self.init_registry(None)
+        session = registry.session
+        with patch('anyblok.registry.gc') as gc:
+            RegistryManager.before_fork()
+            gc.freeze.assert_called_once_with()
+
+        assert registry.session is not session
+        assert registry.System.Blok.query().count()
+
+    def test_before_fork_without_gc_freeze(self):
+        self.init_registry(None)
+        with patch('anyblok.registry.gc') as gc:
+            RegistryManager.before_fork(gc_freeze=False)
+            gc.freeze.assert_not_called()
+
+    def test_after_fork(self):
+        registry = self.init_registry(None)
+        session = registry.session
+        values = {x: y.copy() for x, y in ThreadEnvironment.values.items()}
+        try:
+            EnvironmentManager.set('test_fork', 'parent value')
+            RegistryManager.after_fork()
+            assert EnvironmentManager.get('test_fork') is None
+        finally:
+            ThreadEnvironment.values.update(values)
+
+        assert registry.session is not session
+        assert registry.System.Blok.query().count()
+
     def test_get_bloks_to_load(self):
         registry = self.init_registry(None)
         bloks = registry.get_bloks_to_load()
@@ -694,3 +728,510 @@ class TestRegistry2:
             messages = logs.get_error_messages()
             message = messages[0]
             assert 'Here one exception' in message
+
+
+def add_model_for_schema_fingerprint():
+
+    from anyblok import Declarations
+
+    @Declarations.register(Declarations.Model)
+    class Test:
+        id = Integer(primary_key=True)
+
+
+def add_other_model_for_schema_fingerprint():
+
+    from anyblok import Declarations
+
+    @Declarations.register(Declarations.Model)
+    class Test:
+        id = Integer(primary_key=True)
+        val = Integer()
+
+
+class TestSchemaFingerprint:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded):
+
+        def close():
+            if hasattr(self, 'registry'):
+                self.registry.close()
+
+        request.addfinalizer(close)
+
+    def init_registry(self, *args, **kwargs):
+        self.registry = init_registry(*args, **kwargs)
+        return self.registry
+
+    def test_fingerprint_is_saved(self):
+        registry = self.init_registry(add_model_for_schema_fingerprint)
+        fingerprint = registry.get_schema_fingerprint()
+        assert registry.get_saved_schema_fingerprint() == fingerprint
+        assert registry.is_schema_unchanged() is True
+
+    def test_fingerprint_depends_on_the_models(self):
+        registry = self.init_registry(add_model_for_schema_fingerprint)
+        fingerprint = registry.get_schema_fingerprint()
+        registry.close()
+        registry = self.init_registry(add_other_model_for_schema_fingerprint)
+        assert registry.get_schema_fingerprint() != fingerprint
+
+    def test_skip_schema_comparison(self):
+        registry = self.init_registry(add_model_for_schema_fingerprint)
+        with patch.object(Migration, 'auto_upgrade_database') as upgrade:
+            registry.apply_model_schema_on_table(None)
+            upgrade.assert_not_called()
+
+    def test_schema_comparison_with_another_fingerprint(self):
+        registry = self.init_registry(add_model_for_schema_fingerprint)
+        registry.System.Parameter.set(
+            'anyblok.schema.fingerprint', 'other fingerprint')
+        with patch.object(Migration, 'auto_upgrade_database') as upgrade:
+            registry.apply_model_schema_on_table(None)
+            upgrade.assert_called_once_with()
+
+        assert registry.is_schema_unchanged() is True
+
+    def test_bloks_to_migrate_in_the_order_of_the_loaded_bloks(self):
+        registry = self.init_registry(add_model_for_schema_fingerprint)
+        bloks = list(reversed(registry.ordered_loaded_bloks))
+        for blok in bloks:
+            registry.execute(
+                "UPDATE system_blok SET state = 'toupdate' WHERE name = '%s'"
+                % blok)
+
+        res = registry.get_bloks_to_migrate([])
+        assert [x[0] for x in res] == registry.ordered_loaded_bloks
+
+    def test_force_schema_comparison(self):
+        registry = self.init_registry(add_model_for_schema_fingerprint)
+        with tmp_configuration(force_schema_comparison=True):
+            assert registry.is_schema_unchanged() is False
+            with patch.object(Migration, 'auto_upgrade_database') as upgrade:
+                registry.apply_model_schema_on_table(None)
+                upgrade.assert_called_once_with()
+
+
+def add_models_for_lazy_assembly():
+
+    from anyblok import Declarations
+    from anyblok.declarations import classmethod_cache, listen
+
+    register = Declarations.register
+    Model = Declarations.Model
+
+    @register(Model)
+    class Test:
+        id = Integer(primary_key=True)
+
+    @register(Model)
+    class Test2:
+        id = Integer(primary_key=True)
+        test = Many2One(model=Model.Test)
+
+    @register(Model)
+    class Test3:
+        id = Integer(primary_key=True)
+
+    @register(Model)
+    class Test4:
+
+        @classmethod_cache()
+        def get_value(cls):
+            return 1
+
+        @listen(Model.Test2, 'fire_test')
+        def listener(cls, value):
+            return value
+
+
+class TestLazyAssembly:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded):
+
+        def close():
+            if hasattr(self, 'registry'):
+                self.registry.close()
+
+        request.addfinalizer(close)
+
+    def init_lazy_registry(self, lazy_assembly=True):
+        loaded_bloks = deepcopy(RegistryManager.loaded_bloks)
+        EnvironmentManager.set('current_blok', 'anyblok-test')
+        try:
+            add_models_for_lazy_assembly()
+        finally:
+            EnvironmentManager.set('current_blok', None)
+
+        try:
+            self.registry = RegistryManager.get(
+                Configuration.get('db_name'), unittest=True)
+            self.registry.upgrade(install=('anyblok-test',))
+            self.registry.loadwithoutmigration = True
+            with tmp_configuration(lazy_assembly=lazy_assembly):
+                self.registry.reload()
+        finally:
+            RegistryManager.loaded_bloks = loaded_bloks
+
+        return self.registry
+
+    def test_without_lazy_assembly(self):
+        registry = self.init_lazy_registry(lazy_assembly=False)
+        assert registry.lazy_namespaces == {}
+        assert 'Model.Test3' in registry.loaded_namespaces
+
+    def test_lazy_assembly(self):
+        registry = self.init_lazy_registry()
+        assert 'Model.System.Blok' in registry.loaded_namespaces
+        assert 'Model.Test' not in registry.loaded_namespaces
+        assert 'Model.Test3' in registry.lazy_namespaces
+        assert registry.has('Model.Test3')
+
+    def test_lazy_assembly_by_get(self):
+        registry = self.init_lazy_registry()
+        Test2 = registry.get('Model.Test2')
+        assert 'Model.Test' in registry.loaded_namespaces
+        assert 'Model.Test4' in registry.loaded_namespaces
+        assert 'Model.Test3' not in registry.loaded_namespaces
+        test = registry.Test.insert()
+        test2 = Test2.insert(test=test)
+        assert Test2.query().one() is test2
+        assert test2.test is test
+
+    def test_lazy_assembly_by_attribute(self):
+        registry = self.init_lazy_registry()
+        assert registry.Test3.insert().id
+        assert 'Model.Test3' in registry.loaded_namespaces
+        assert 'Model.Test2' not in registry.loaded_namespaces
+
+    def test_lazy_assembly_with_event_and_cache(self):
+        registry = self.init_lazy_registry()
+        with patch.object(registry.Test4, 'listener') as listener:
+            registry.Test2.fire('fire_test', 2)
+            listener.assert_called_once_with(2)
+
+        assert registry.Test4.get_value() == 1
+
+    def test_lazy_assembly_of_nested_model(self):
+        registry = self.init_lazy_registry()
+        assert 'Model.System.Blok' in registry.loaded_namespaces
+        assert 'Model.System.Parameter' in registry.lazy_namespaces
+        # the primary keys are read from the index of the fields
+        assert registry.System.Blok.get_primary_keys() == ['name']
+        Parameter = registry.System.Parameter
+        assert 'Model.System.Parameter' in registry.loaded_namespaces
+        assert Parameter.get_primary_keys() == ['key']
+        Parameter.set('lazy', 1)
+        assert Parameter.get('lazy') == 1
+
+    def test_lazy_assembly_unknown_nested_attribute(self):
+        registry = self.init_lazy_registry()
+        with pytest.raises(AttributeError):
+            registry.System.Unknown
+
+
+def add_models_for_incremental_reload():
+
+    from anyblok import Declarations
+    from anyblok.declarations import cache
+
+    register = Declarations.register
+    Model = Declarations.Model
+
+    @register(Model)
+    class Test:
+        id = Integer(primary_key=True)
+
+    @register(Model)
+    class Test2:
+        id = Integer(primary_key=True)
+        test = Many2One(model=Model.Test)
+
+    @register(Model)
+    class Test3:
+        id = Integer(primary_key=True)
+
+        @cache()
+        def get_value(self):
+            return self.id
+
+
+def add_field_on_model(name):
+
+    from anyblok import Declarations
+    from anyblok.column import String
+
+    Declarations.register(Declarations.Model)(
+        type(name, (), {'name': String()}))
+
+
+class TestIncrementalReload:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded):
+
+        def close():
+            if hasattr(self, 'registry'):
+                self.registry.close()
+
+        request.addfinalizer(close)
+
+    @pytest.fixture(autouse=True)
+    def keep_loaded_bloks(self, request):
+        loaded_bloks = deepcopy(RegistryManager.loaded_bloks)
+
+        def reset():
+            RegistryManager.loaded_bloks = loaded_bloks
+
+        request.addfinalizer(reset)
+
+    def declare(self, function, *args):
+        EnvironmentManager.set('current_blok', 'anyblok-test')
+        try:
+            function(*args)
+        finally:
+            EnvironmentManager.set('current_blok', None)
+
+    def init_registry(self):
+        self.declare(add_models_for_incremental_reload)
+        self.registry = RegistryManager.get(
+            Configuration.get('db_name'), unittest=True)
+        self.registry.upgrade(install=('anyblok-test',))
+        return self.registry
+
+    def update_registry(self, incremental_reload=True):
+        with tmp_configuration(incremental_reload=incremental_reload):
+            self.registry.upgrade(update=('anyblok-test',))
+
+    def get_models(self, registry):
+        return {namespace: registry.get(namespace)
+                for namespace in ('Model.Test', 'Model.Test2', 'Model.Test3',
+                                  'Model.System.Blok')}
+
+    def test_is_incremental_reload(self):
+        registry = self.init_registry()
+        assert registry.is_incremental_reload() is False
+        with tmp_configuration(incremental_reload=True):
+            assert registry.is_incremental_reload() is True
+
+    def test_get_namespaces_to_reassemble(self):
+        from anyblok.model import Model
+        registry = self.init_registry()
+        namespaces = Model.get_namespaces_to_reassemble(
+            registry, {'Model.Test'})
+        assert namespaces == {'Model.Test', 'Model.Test2'}
+        namespaces = Model.get_namespaces_to_reassemble(
+            registry, {'Model.Test3'})
+        assert namespaces == {'Model.Test3'}
+
+    def test_without_changes(self):
+        registry = self.init_registry()
+        models = self.get_models(registry)
+        self.update_registry()
+        assert self.get_models(registry) == models
+        test3 = registry.Test3.insert()
+        assert test3.get_value() == test3.id
+
+    def test_reassemble_changed_model(self):
+        registry = self.init_registry()
+        models = self.get_models(registry)
+        self.declare(add_field_on_model, 'Test3')
+        self.update_registry()
+        new_models = self.get_models(registry)
+        assert new_models['Model.Test3'] is not models['Model.Test3']
+        for namespace in ('Model.Test', 'Model.Test2', 'Model.System.Blok'):
+            assert new_models[namespace] is models[namespace]
+
+        class_registry = registry.declarativebase._decl_class_registry
+        assert class_registry['ModelTest3'] is registry.Test3
+        test3 = registry.Test3.insert(name='Test')
+        assert registry.Test3.query().one() is test3
+        assert test3.get_value() == test3.id
+        assert registry.Test2.insert(test=registry.Test.insert()).test
+
+    def test_reassemble_linked_models(self):
+        registry = self.init_registry()
+        models = self.get_models(registry)
+        self.declare(add_field_on_model, 'Test')
+        self.update_registry()
+        new_models = self.get_models(registry)
+        for namespace in ('Model.Test', 'Model.Test2'):
+            assert new_models[namespace] is not models[namespace]
+
+        for namespace in ('Model.Test3', 'Model.System.Blok'):
+            assert new_models[namespace] is models[namespace]
+
+        test2 = registry.Test2.insert(test=registry.Test.insert(name='Test'))
+        assert registry.Test2.query().one().test.name == 'Test'
+        assert test2.test in registry.Test.query().all()
+
+    def test_reassemble_all_models_when_core_changed(self):
+        registry = self.init_registry()
+        models = self.get_models(registry)
+
+        def add_core():
+            from anyblok import Declarations
+
+            @Declarations.register(Declarations.Core)
+            class Base:
+                pass
+
+        self.declare(add_core)
+        self.update_registry()
+        new_models = self.get_models(registry)
+        for namespace, model in models.items():
+            assert new_models[namespace] is not model
+
+    def test_reassemble_all_models_without_sqlalchemy_private_api(self):
+        registry = self.init_registry()
+        models = self.get_models(registry)
+        self.declare(add_field_on_model, 'Test3')
+        with patch('anyblok.model.can_dispose_models', return_value=False):
+            self.update_registry()
+
+        new_models = self.get_models(registry)
+        for namespace, model in models.items():
+            assert new_models[namespace] is not model
+
+        test3 = registry.Test3.insert(name='Test')
+        assert registry.Test3.query().one() is test3
+        assert registry.Test2.insert(test=registry.Test.insert()).test
+
+    def test_without_incremental_reload(self):
+        registry = self.init_registry()
+        models = self.get_models(registry)
+        self.update_registry(incremental_reload=False)
+        new_models = self.get_models(registry)
+        for namespace, model in models.items():
+            assert new_models[namespace] is not model
+
+
+class TestReadonlyRegistry:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded):
+
+        def close():
+            if hasattr(self, 'registry'):
+                self.registry.close()
+
+        request.addfinalizer(close)
+
+    def init_readonly_registry(self):
+        self.registry = RegistryManager.get(
+            Configuration.get('db_name'), unittest=True)
+        with tmp_configuration(readonly_registry=True):
+            self.registry.readonly = self.registry.is_readonly()
+
+        return self.registry
+
+    def test_is_readonly(self):
+        self.registry = RegistryManager.get(
+            Configuration.get('db_name'), unittest=True)
+        assert self.registry.readonly is False
+        with tmp_configuration(readonly_registry=True):
+            assert self.registry.is_readonly() is True
+
+    def test_reload_without_migration_and_initialisation(self):
+        registry = self.init_readonly_registry()
+        callbacks = {entry: Mock(return_value=False)
+                     for entry in RegistryManager.callback_initialize_entries}
+        with patch.dict(RegistryManager.callback_initialize_entries,
+                        callbacks):
+            with patch.object(Migration, 'auto_upgrade_database') as upgrade:
+                with patch.object(registry, 'commit') as commit:
+                    registry.reload()
+
+        upgrade.assert_not_called()
+        commit.assert_not_called()
+        for callback in callbacks.values():
+            callback.assert_not_called()
+
+        assert registry.readonly is True
+        assert 'Model.System.Blok' in registry.loaded_namespaces
+
+    def test_readonly_with_cache_checkpoint(self):
+        registry = self.init_readonly_registry()
+        with tmp_configuration(cache_checkpoint_interval=0):
+            registry.reload()
+            Cache = registry.System.Cache
+            assert Cache.last_cache_id == Cache.get_last_id()
+            with patch.object(Cache, 'clear_invalidate_cache',
+                              wraps=Cache.clear_invalidate_cache) as clear:
+                registry.rollback()
+                assert registry.System.Blok.query().count()
+
+            clear.assert_called_once_with()
+            Cache.invalidate('Model.System.Blok', 'is_installed')
+            assert Cache.last_cache_id == Cache.get_last_id()
+
+    def test_no_blok_to_install(self):
+        registry = self.init_readonly_registry()
+        assert registry.get_bloks_to_install(
+            registry.get_bloks_to_load()) == []
+
+    def test_upgrade_is_forbidden(self):
+        registry = self.init_readonly_registry()
+        with pytest.raises(RegistryException):
+            registry.upgrade(install=('anyblok-test',))
+
+    def test_keep_the_mode_of_the_loaded_registry(self):
+        registry = self.init_readonly_registry()
+        assert RegistryManager.get(
+            Configuration.get('db_name'), readonly_registry=False) is registry
+        assert registry.readonly is True
+
+
+def add_model_to_warm_up():
+
+    @Declarations.register(Declarations.Model)
+    class Test:
+        id = Integer(primary_key=True)
+
+
+class TestRegistryWarmUp:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded):
+
+        def close():
+            if hasattr(self, 'registry'):
+                self.registry.close()
+
+        request.addfinalizer(close)
+
+    def get_currsize(self, method):
+        stats = self.registry.System.Cache.get_stats()
+        return stats[('Model.Test', method)]['currsize']
+
+    def test_warm_up(self):
+        self.registry = init_registry(add_model_to_warm_up)
+        self.registry.System.Cache.invalidate_all()
+        with patch('anyblok.registry.configure_mappers') as configure:
+            self.registry.warm_up(['Model.Test'])
+
+        configure.assert_called_once_with()
+        for method in ('get_primary_keys', '_fields_description',
+                       'get_hybrid_property_columns',
+                       'find_remote_attribute_to_expire'):
+            assert self.get_currsize(method) == 1
+
+    def test_no_warm_up_by_default(self):
+        self.registry = init_registry(add_model_to_warm_up)
+        assert self.registry.get_warm_up_models() is None
+
+    def test_warm_up_all_models(self):
+        self.registry = init_registry(add_model_to_warm_up)
+        with tmp_configuration(registry_warm_up=True):
+            models = self.registry.get_warm_up_models()
+
+        assert set(models) == set(self.registry.loaded_namespaces.keys())
+
+    def test_warm_up_at_the_load(self):
+        with tmp_configuration(registry_warm_up_models=['Model.Test']):
+            with patch('anyblok.registry.Registry.warm_up') as warm_up:
+                self.registry = init_registry(add_model_to_warm_up)
+
+        warm_up.assert_called_with(['Model.Test'])
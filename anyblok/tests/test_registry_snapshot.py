@@ -0,0 +1,151 @@
+# This file is a part of the AnyBlok project
+#
+#    Copyright (C) 2019 Jean-Sebastien SUZANNE <js.suzanne@gmail.com>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file,You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import json
+import pytest
+from anyblok.declarations import Declarations, cache, hybrid_method
+from anyblok.column import Integer
+from anyblok.model.cache import CachePlugin
+from anyblok.snapshot import (
+    get_base_key, get_blok_source_signature,
+    get_cached_blok_source_signature, clear_source_signatures)
+from anyblok.testing import tmp_configuration
+from .conftest import init_registry
+
+try:
+    # python 3.4+ should use builtin unittest.mock not mock package
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+register = Declarations.register
+Model = Declarations.Model
+
+
+def add_model_with_plugin_attributes():
+
+    @register(Model)
+    class Test:
+        id = Integer(primary_key=True)
+        val = Integer(nullable=False)
+
+        x = 0
+
+        @cache()
+        def method_cached(self):
+            self.x += 1
+            return self.x
+
+        @hybrid_method
+        def val_is(self, val):
+            return self.val == val
+
+
+class TestRegistrySnapshot:
+
+    @pytest.fixture(autouse=True)
+    def close_registry(self, request, bloks_loaded):
+
+        def close():
+            if hasattr(self, 'registry'):
+                self.registry.close()
+
+        request.addfinalizer(close)
+
+    def init_registry(self, *args, **kwargs):
+        self.registry = init_registry(*args, **kwargs)
+        return self.registry
+
+    def get_test_base(self, registry):
+        return registry.loaded_registries['Model.Test']['bases'][0]
+
+    def check_model(self, registry):
+        t = registry.Test.insert(val=1)
+        assert t.method_cached() == 1
+        assert t.method_cached() == 1
+        assert registry.Test.query().filter(
+            registry.Test.val_is(1)).one() is t
+
+    def test_without_snapshot_dir(self):
+        registry = self.init_registry(add_model_with_plugin_attributes)
+        assert registry.snapshot is None
+
+    def test_save_snapshot(self, tmpdir):
+        with tmp_configuration(registry_snapshot_dir=str(tmpdir)):
+            registry = self.init_registry(add_model_with_plugin_attributes)
+
+        path = tmpdir.join('anyblok-registry-%s.json' % registry.db_name)
+        assert path.check()
+        data = json.loads(path.read())
+        assert data['fingerprint'] == registry.snapshot.fingerprint
+        attributes = data['attributes'][get_base_key(
+            self.get_test_base(registry))]
+        assert sorted(attributes) == ['method_cached', 'val_is']
+        self.check_model(registry)
+
+    def test_use_snapshot(self, tmpdir):
+        with tmp_configuration(registry_snapshot_dir=str(tmpdir)):
+            self.init_registry(add_model_with_plugin_attributes)
+            # the registry is reloaded with the saved snapshot
+            registry = self.init_registry(add_model_with_plugin_attributes)
+
+        assert registry.snapshot.is_valid is True
+        assert registry.snapshot.changed is False
+        assert sorted(registry.snapshot.get_base_attributes(
+            self.get_test_base(registry))) == ['method_cached', 'val_is']
+        self.check_model(registry)
+
+    def test_obsolete_snapshot(self, tmpdir):
+        with tmp_configuration(registry_snapshot_dir=str(tmpdir)):
+            registry = self.init_registry(add_model_with_plugin_attributes)
+            path = tmpdir.join('anyblok-registry-%s.json' % registry.db_name)
+            path.write(json.dumps({'fingerprint': 'other fingerprint',
+                                   'attributes': {}}))
+            registry = self.init_registry(add_model_with_plugin_attributes)
+
+        data = json.loads(path.read())
+        assert data['fingerprint'] == registry.snapshot.fingerprint
+        assert registry.snapshot.is_valid is False
+        self.check_model(registry)
+
+    def test_snapshot_disabled_by_incompatible_plugin(self, tmpdir):
+        with tmp_configuration(registry_snapshot_dir=str(tmpdir)):
+            with patch.object(CachePlugin, 'snapshot_compatible', False):
+                registry = self.init_registry(
+                    add_model_with_plugin_attributes)
+
+        assert registry.snapshot is None
+        assert tmpdir.listdir() == []
+        self.check_model(registry)
+
+    def test_source_signature(self, tmpdir):
+        source = tmpdir.join('__init__.py')
+        source.write('x = 1')
+        with patch('anyblok.snapshot.BlokManager.getPath',
+                   return_value=str(tmpdir)):
+            signature = get_blok_source_signature('test-blok')
+            assert get_blok_source_signature('test-blok') == signature
+            source.setmtime(source.mtime() + 10)
+            assert get_blok_source_signature('test-blok') != signature
+
+    def test_source_signature_walked_once(self, tmpdir):
+        tmpdir.join('__init__.py').write('x = 1')
+        clear_source_signatures()
+        try:
+            with patch('anyblok.snapshot.BlokManager.getPath',
+                       return_value=str(tmpdir)):
+                with patch('anyblok.snapshot.os.walk',
+                           return_value=[]) as walk:
+                    signature = get_cached_blok_source_signature('test-blok')
+                    assert get_cached_blok_source_signature(
+                        'test-blok') == signature
+                    assert walk.call_count == 1
+                    clear_source_signatures()
+                    get_cached_blok_source_signature('test-blok')
+                    assert walk.call_count == 2
+        finally:
+            clear_source_signatures()
@@ -95,6 +95,7 @@ setup(
             'anyblok_nose=anyblok.scripts:anyblok_nose',
             'anyblok_interpreter=anyblok.scripts:anyblok_interpreter',
             'anyblok_doc=anyblok.scripts:anyblok2doc',
+            'anyblok_cache_report=anyblok.scripts:anyblok_cache_report',
         ],
         'bloks': [
             'anyblok-core=anyblok.bloks.anyblok_core:AnyBlokCore',
@@ -132,5 +133,14 @@ setup(
             'cache=anyblok.model.cache:CachePlugin',
             'field_datetime=anyblok.model.field_datetime:AutoUpdatePlugin',
         ],
+        'anyblok.cache.invalidation': [
+            'local=anyblok.cache_invalidation:LocalCacheInvalidation',
+            ('postgresql='
+             'anyblok.cache_invalidation:PostgreSQLCacheInvalidation'),
+        ],
+        'anyblok.cache.backend': [
+            'memory=anyblok.cache_backend:MemoryCacheBackend',
+            'sqlite=anyblok.cache_backend:SQLiteCacheBackend',
+        ],
     },
 )